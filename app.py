@@ -10,6 +10,7 @@ import os
 from dotenv import load_dotenv
 from streamlit_cookies_manager import EncryptedCookieManager
 import json
+from utils.crime_aggregates import fetch_crime_summary
 
 # ===============================
 # Load Environment Variables
@@ -298,31 +299,32 @@ from modules import EDA, data_checker, alcaldias_dashboard, interactive_map, cit
 # ===============================
 @st.cache_data(ttl=3600)
 def load_summary_stats():
-    """Load summary statistics for landing page"""
+    """Load summary statistics for landing page (aggregated server-side)"""
     try:
         supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
         
-        # Get total crime count
-        crime_response = supabase.table(SUPABASE_TABLE).select("fecha_hecho, alcaldia_hecho", count="exact").execute()
-        total_crimes = crime_response.count if hasattr(crime_response, 'count') else len(crime_response.data)
-        
-        # Get most recent date
-        recent_response = supabase.table(SUPABASE_TABLE).select("fecha_hecho").order("fecha_hecho", desc=True).limit(1).execute()
-        most_recent_date = recent_response.data[0]['fecha_hecho'] if recent_response.data else "N/A"
-        
-        # Get unique alcaldías count
-        alcaldias_response = supabase.table(SUPABASE_TABLE).select("alcaldia_hecho").execute()
-        df_temp = pd.DataFrame(alcaldias_response.data)
-        unique_alcaldias = df_temp['alcaldia_hecho'].nunique() if not df_temp.empty else 0
+        try:
+            # Totals, latest date and alcaldías in one RPC call (sql/crime_aggregates.sql)
+            stats = fetch_crime_summary()
+        except Exception:
+            # Aggregation functions not installed: count with lightweight queries
+            crime_response = supabase.table(SUPABASE_TABLE).select("fecha_hecho", count="exact").limit(1).execute()
+            recent_response = supabase.table(SUPABASE_TABLE).select("fecha_hecho").order("fecha_hecho", desc=True).limit(1).execute()
+            stats = {
+                'total_crimes': crime_response.count or 0,
+                'most_recent_date': recent_response.data[0]['fecha_hecho'] if recent_response.data else "N/A",
+                # Counting distinct alcaldías would mean reading the whole table
+                'unique_alcaldias': "N/A"
+            }
         
-        # Get total cuadrantes
-        cuadrantes_response = supabase.table(SUPABASE_TABLE_CUADRANTS).select("*", count="exact").execute()
-        total_cuadrantes = cuadrantes_response.count if hasattr(cuadrantes_response, 'count') else len(cuadrantes_response.data)
+        # Get total cuadrantes (count only, no geometries)
+        cuadrantes_response = supabase.table(SUPABASE_TABLE_CUADRANTS).select("id", count="exact").limit(1).execute()
+        total_cuadrantes = cuadrantes_response.count if cuadrantes_response.count is not None else len(cuadrantes_response.data)
         
         return {
-            'total_crimes': total_crimes,
-            'most_recent_date': most_recent_date,
-            'unique_alcaldias': unique_alcaldias,
+            'total_crimes': stats['total_crimes'],
+            'most_recent_date': stats['most_recent_date'],
+            'unique_alcaldias': stats['unique_alcaldias'],
             'total_cuadrantes': total_cuadrantes
         }
     except Exception as e:
@@ -4,6 +4,9 @@ import json
 from datetime import datetime, timedelta
 from supabase import create_client
 from components.mckinsey_styling import apply_mckinsey_styles, create_kpi_card, format_number, format_delta_text
+from utils.crime_store import get_crime_data
+from utils.alcaldia_names import normalize_alcaldia_series
+from utils.cuadrantes import load_cuadrantes_table
 
 # ===============================
 # Configuration
@@ -16,64 +19,14 @@ SUPABASE_TABLE_CUADRANTS = "cuadrantes"
 # ===============================
 # Helper Functions
 # ===============================
-def normalize_alcaldia_name(name):
-    """Normalize alcaldía names for matching"""
-    if pd.isna(name):
-        return None
-    name = str(name).upper()
-    replacements = {
-        'Á': 'A', 'É': 'E', 'Í': 'I', 'Ó': 'O', 'Ú': 'U',
-        'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u'
-    }
-    for old, new in replacements.items():
-        name = name.replace(old, new)
-    
-    name = name.replace('.', '').strip()
-    if name.endswith(' DE MORELOS'):
-        name = name.replace(' DE MORELOS', '')
-    if name.startswith('LA '):
-        name = name[3:]
-    return name
-
-def categorize_violence(delito_text):
-    """Categorize crime by violence"""
-    if pd.isna(delito_text):
-        return 'unknown'
-    delito_lower = str(delito_text).lower()
-    if 'con violencia' in delito_lower:
-        return 'violent'
-    elif 'sin violencia' in delito_lower:
-        return 'non_violent'
-    return 'unknown'
+PREDICTIONS_COLUMNS = [
+    'alcaldia_hecho', 'anio_hecho', 'fecha_hecho', 'delito', 'latitud', 'longitud',
+    'year', 'month', 'date', 'alcaldia_normalized', 'violence_category'
+]
 
-@st.cache_data(ttl=3600)
 def load_crime_data():
-    """Load and preprocess crime data from Supabase"""
-    try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        
-        response = supabase.table(SUPABASE_TABLE).select(
-            "alcaldia_hecho, anio_hecho, fecha_hecho, delito, latitud, longitud"
-        ).execute()
-        
-        df = pd.DataFrame(response.data)
-        
-        if df.empty:
-            return df
-        
-        df['fecha_hecho'] = pd.to_datetime(df['fecha_hecho'], errors='coerce')
-        df['year'] = df['fecha_hecho'].dt.year
-        df['month'] = df['fecha_hecho'].dt.month
-        df['date'] = df['fecha_hecho'].dt.date
-        
-        df['alcaldia_normalized'] = df['alcaldia_hecho'].apply(normalize_alcaldia_name)
-        df['violence_category'] = df['delito'].apply(categorize_violence)
-        df = df[df['alcaldia_normalized'].notna()]
-        
-        return df
-    except Exception as e:
-        st.error(f"Error loading data: {e}")
-        return pd.DataFrame()
+    """Load preprocessed crime data from the shared crime store"""
+    return get_crime_data(PREDICTIONS_COLUMNS)
 
 @st.cache_data
 def load_population_data():
@@ -95,7 +48,7 @@ def load_population_data():
         if 'alc' not in pop_df.columns:
             return None
         
-        pop_df['alc_normalized'] = pop_df['alc'].apply(normalize_alcaldia_name)
+        pop_df['alc_normalized'] = normalize_alcaldia_series(pop_df['alc'])
         pop_df['pob'] = pd.to_numeric(pop_df['pob'], errors='coerce')
         population_by_alcaldia = pop_df.groupby('alc_normalized')['pob'].sum().to_dict()
         
@@ -112,7 +65,7 @@ def load_cuadrantes_count():
         
         if response.data:
             cuad_df = pd.DataFrame(response.data)
-            cuad_df['alcaldia_normalized'] = cuad_df['alcaldia'].apply(normalize_alcaldia_name)
+            cuad_df['alcaldia_normalized'] = normalize_alcaldia_series(cuad_df['alcaldia'])
             cuadrantes_count = cuad_df.groupby('alcaldia_normalized').size().to_dict()
             return cuadrantes_count
         return None
@@ -122,24 +75,10 @@ def load_cuadrantes_count():
 def load_cuadrantes_geojson():
     """Load cuadrantes GeoJSON data from Supabase"""
     try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        response = supabase.table(SUPABASE_TABLE_CUADRANTS).select("*").execute()
+        cuad_df = load_cuadrantes_table()
         
-        if response.data:
-            cuad_df = pd.DataFrame(response.data)
-            cuad_df['alcaldia_normalized'] = cuad_df['alcaldia'].apply(normalize_alcaldia_name)
-            
-            # Parse geo_shape if it's a string
-            import ast
-            def parse_shape(v):
-                try:
-                    return ast.literal_eval(v) if isinstance(v, str) else v
-                except:
-                    return None
-            
-            cuad_df['geo_shape'] = cuad_df['geo_shape'].apply(parse_shape)
-            
-            return cuad_df
+        if not cuad_df.empty:
+            return cuad_df.drop(columns=['geometry'])
         return pd.DataFrame()
     except Exception as e:
         st.error(f"Error loading cuadrantes: {e}")
@@ -4,6 +4,14 @@ import json
 from datetime import datetime, timedelta
 from supabase import create_client
 from components.mckinsey_styling import apply_mckinsey_styles, create_kpi_card, format_number, format_delta_text
+from utils.crime_store import get_crime_data
+from utils.crime_cube import get_crime_cube
+from utils.crime_aggregates import get_kpi_cube
+from utils.crime_query import crime_query
+from utils.crime_windows import get_daily_series
+from utils.alcaldia_names import normalize_alcaldia_series
+from utils.cuadrantes import load_cuadrantes_table
+from utils.geometry_tiers import simplify_geometry
 
 # ===============================
 # Configuration
@@ -25,76 +33,15 @@ def get_spanish_month_name(date):
     }
     return f"{month_names[date.month]} {date.year}"
 
-def normalize_alcaldia_name(name):
-    """Normalize alcaldía names for matching"""
-    if pd.isna(name):
-        return None
-    name = str(name).upper()
-    replacements = {
-        'Á': 'A', 'É': 'E', 'Í': 'I', 'Ó': 'O', 'Ú': 'U',
-        'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u'
-    }
-    for old, new in replacements.items():
-        name = name.replace(old, new)
-    
-    name = name.replace('.', '').strip()
-    if name.endswith(' DE MORELOS'):
-        name = name.replace(' DE MORELOS', '')
-    if name.startswith('LA '):
-        name = name[3:]
-    return name
-
-def categorize_violence(delito_text):
-    """Categorize crime by violence"""
-    if pd.isna(delito_text):
-        return 'unknown'
-    delito_lower = str(delito_text).lower()
-    if 'con violencia' in delito_lower:
-        return 'violent'
-    elif 'sin violencia' in delito_lower:
-        return 'non_violent'
-    return 'unknown'
+ALCALDIA_DASHBOARD_COLUMNS = [
+    'alcaldia_hecho', 'fecha_hecho', 'delito', 'latitud', 'longitud',
+    'year', 'month', 'day_of_week', 'date', 'hour',
+    'alcaldia_normalized', 'violence_category'
+]
 
-@st.cache_data(ttl=3600)
 def load_crime_data():
-    """Load and preprocess crime data from Supabase"""
-    try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        
-        response = supabase.table(SUPABASE_TABLE).select(
-            "alcaldia_hecho, anio_hecho, fecha_hecho, hora_hecho, hora, delito, latitud, longitud"
-        ).execute()
-        
-        df = pd.DataFrame(response.data)
-        
-        if df.empty:
-            return df
-        
-        df['fecha_hecho'] = pd.to_datetime(df['fecha_hecho'], errors='coerce')
-        df['year'] = df['fecha_hecho'].dt.year
-        df['month'] = df['fecha_hecho'].dt.month
-        df['day_of_week'] = df['fecha_hecho'].dt.dayofweek
-        df['date'] = df['fecha_hecho'].dt.date
-        
-        # Use 'hora' column if available (should be numeric)
-        if 'hora' in df.columns:
-            df['hour'] = pd.to_numeric(df['hora'], errors='coerce')
-            # If values are 1-24, convert to 0-23
-            if df['hour'].max() == 24:
-                df['hour'] = df['hour'].replace(24, 0)
-            # Ensure values are in 0-23 range
-            df['hour'] = df['hour'].apply(lambda x: x if pd.isna(x) or (0 <= x <= 23) else None)
-        else:
-            df['hour'] = None
-        
-        df['alcaldia_normalized'] = df['alcaldia_hecho'].apply(normalize_alcaldia_name)
-        df['violence_category'] = df['delito'].apply(categorize_violence)
-        df = df[df['alcaldia_normalized'].notna()]
-        
-        return df
-    except Exception as e:
-        st.error(f"Error loading data: {e}")
-        return pd.DataFrame()
+    """Load preprocessed crime data from the shared crime store"""
+    return get_crime_data(ALCALDIA_DASHBOARD_COLUMNS)
 
 @st.cache_data
 def load_population_data():
@@ -116,7 +63,7 @@ def load_population_data():
         if 'alc' not in pop_df.columns:
             return None
         
-        pop_df['alc_normalized'] = pop_df['alc'].apply(normalize_alcaldia_name)
+        pop_df['alc_normalized'] = normalize_alcaldia_series(pop_df['alc'])
         pop_df['pob'] = pd.to_numeric(pop_df['pob'], errors='coerce')
         population_by_alcaldia = pop_df.groupby('alc_normalized')['pob'].sum().to_dict()
         
@@ -133,7 +80,7 @@ def load_cuadrantes_count():
         
         if response.data:
             cuad_df = pd.DataFrame(response.data)
-            cuad_df['alcaldia_normalized'] = cuad_df['alcaldia'].apply(normalize_alcaldia_name)
+            cuad_df['alcaldia_normalized'] = normalize_alcaldia_series(cuad_df['alcaldia'])
             cuadrantes_count = cuad_df.groupby('alcaldia_normalized').size().to_dict()
             return cuadrantes_count
         return None
@@ -143,23 +90,12 @@ def load_cuadrantes_count():
 def load_cuadrantes_geojson():
     """Load cuadrantes GeoJSON data from Supabase"""
     try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        response = supabase.table(SUPABASE_TABLE_CUADRANTS).select("*").execute()
+        cuad_df = load_cuadrantes_table()
         
-        if response.data:
-            cuad_df = pd.DataFrame(response.data)
-            cuad_df['alcaldia_normalized'] = cuad_df['alcaldia'].apply(normalize_alcaldia_name)
-            
-            # Parse geo_shape if it's a string
-            import ast
-            def parse_shape(v):
-                try:
-                    return ast.literal_eval(v) if isinstance(v, str) else v
-                except:
-                    return None
-            
-            cuad_df['geo_shape'] = cuad_df['geo_shape'].apply(parse_shape)
-            
+        if not cuad_df.empty:
+            cuad_df = cuad_df.drop(columns=['geometry'])
+            # The hotspot map shows one alcaldía, so the detail tier is plenty
+            cuad_df['geo_shape'] = cuad_df['geo_shape'].map(lambda g: simplify_geometry(g, 'detail'))
             return cuad_df
         return pd.DataFrame()
     except Exception as e:
@@ -248,8 +184,8 @@ def show():
     # Convert back to normalized name
     selected_alcaldia = alcaldias_list[alcaldias_display.index(selected_alcaldia_display)]
     
-    # Filter data for selected alcaldía
-    alcaldia_df = df[df['alcaldia_normalized'] == selected_alcaldia].copy()
+    # Filters for the selected alcaldía, evaluated by the query engine (no full-table mask or copy)
+    alcaldia_query = crime_query().alcaldias(selected_alcaldia)
     
     st.divider()
     
@@ -258,25 +194,19 @@ def show():
     # ===============================
     st.markdown('<div class="section-header">📅 Sección 1: Actividad Reciente (Últimos 30 Días)</div>', unsafe_allow_html=True)
     
-    # Calculate last 30 days data
-    max_date = alcaldia_df['fecha_hecho'].max()
-    if pd.notna(max_date):
-        last_30_days_start = max_date - timedelta(days=30)
-        last_30_df = alcaldia_df[alcaldia_df['fecha_hecho'] >= last_30_days_start]
-        
-        # Previous 30 days for comparison
-        previous_30_start = last_30_days_start - timedelta(days=30)
-        previous_30_df = alcaldia_df[
-            (alcaldia_df['fecha_hecho'] >= previous_30_start) & 
-            (alcaldia_df['fecha_hecho'] < last_30_days_start)
-        ]
+    # Last 30 days vs the previous 30, from the alcaldía's precomputed daily series
+    daily_series = get_daily_series(selected_alcaldia)
+    if daily_series is not None:
+        window_30d = daily_series.window(days=30)
+        last_30_days_start = window_30d['start']
+        max_date = window_30d['end']
         
         # Display actual date range
         st.caption(f"Datos del {last_30_days_start.strftime('%Y-%m-%d')} al {max_date.strftime('%Y-%m-%d')}")
         
         # Calculate metrics
-        total_crimes_30d = len(last_30_df)
-        previous_crimes_30d = len(previous_30_df)
+        total_crimes_30d = window_30d['total']
+        previous_crimes_30d = window_30d['previous_total']
         daily_avg_30d = total_crimes_30d / 30
         
         # YoY change for 30 days
@@ -286,24 +216,26 @@ def show():
             change_30d = 0
         
         # Most common crime
-        if not last_30_df.empty:
-            top_crime = last_30_df['delito'].value_counts().index[0]
-            top_crime_count = last_30_df['delito'].value_counts().iloc[0]
+        crime_counts_30d = window_30d['delitos']
+        if not crime_counts_30d.empty:
+            top_crime = crime_counts_30d.index[0]
+            top_crime_count = crime_counts_30d.iloc[0]
         else:
             top_crime = "N/A"
             top_crime_count = 0
         
         # Violence breakdown
-        violent_count = len(last_30_df[last_30_df['violence_category'] == 'violent'])
-        non_violent_count = len(last_30_df[last_30_df['violence_category'] == 'non_violent'])
+        violent_count = window_30d['violent']
+        non_violent_count = window_30d['non_violent']
         violent_pct = (violent_count / total_crimes_30d * 100) if total_crimes_30d > 0 else 0
         
         # Busiest day
-        if not last_30_df.empty:
-            daily_counts = last_30_df.groupby('date').size()
-            busiest_day = daily_counts.idxmax()
-            busiest_day_count = daily_counts.max()
+        daily_counts = window_30d['daily']
+        if total_crimes_30d > 0:
+            busiest_day = window_30d['busiest_day']
+            busiest_day_count = window_30d['busiest_day_count']
         else:
+            daily_counts = daily_counts.iloc[:0]
             busiest_day = "N/A"
             busiest_day_count = 0
         
@@ -531,18 +463,11 @@ def show():
             
             st.markdown("**Delitos por Hora**")
             
-            if not last_30_df.empty and 'hour' in last_30_df.columns:
-                # Filter valid hours
-                hourly_df = last_30_df[last_30_df['hour'].notna()].copy()
+            if total_crimes_30d > 0:
+                # Crimes per hour (all 24 hours, zero-filled) from the daily series
+                hourly_counts = pd.DataFrame({'hour': range(24), 'count': window_30d['hourly']})
                 
-                if not hourly_df.empty:
-                    # Count crimes per hour
-                    hourly_counts = hourly_df.groupby('hour').size().reset_index(name='count')
-                    
-                    # Ensure all 24 hours are present (fill missing with 0)
-                    all_hours = pd.DataFrame({'hour': range(24)})
-                    hourly_counts = all_hours.merge(hourly_counts, on='hour', how='left').fillna(0)
-                    hourly_counts['count'] = hourly_counts['count'].astype(int)
+                if hourly_counts['count'].sum() > 0:
                     
                     # Create radial/polar bar chart
                     import plotly.graph_objects as go
@@ -638,9 +563,9 @@ def show():
             
             st.markdown("**Delitos Comunes**")
             
-            if not last_30_df.empty:
+            if not crime_counts_30d.empty:
                 # Get top crimes (up to 10)
-                top_crimes = last_30_df['delito'].value_counts().head(10).reset_index()
+                top_crimes = crime_counts_30d.head(10).reset_index()
                 top_crimes.columns = ['delito', 'count']
                 
                 # Create DataFrame for AgGrid
@@ -724,7 +649,7 @@ def show():
                 )
                 
                 # Add caption
-                total_crime_types = last_30_df['delito'].nunique()
+                total_crime_types = len(crime_counts_30d)
                 st.caption(f"📋 Mostrando {len(top_crimes)} de {total_crime_types} tipos de delitos")
                 
             else:
@@ -750,26 +675,37 @@ def show():
     
     start_year, end_year = year_range
     
-    # Filter data for historical section
-    filtered_alcaldia_df = alcaldia_df[(alcaldia_df['year'] >= start_year) & (alcaldia_df['year'] <= end_year)].copy()
+    # Rows for the historical section only feed the hotspot map: located crimes, map columns only
+    filtered_alcaldia_df = alcaldia_query.years(start_year, end_year).located().rows(
+        'longitud', 'latitud', 'delito', 'fecha_hecho', 'violence_category'
+    )
+    
+    # KPI counts come from server-side aggregates (alcaldía × year × month × violence)
+    kpi_cube = get_kpi_cube()
+    year_cube = kpi_cube.slice(year=range(start_year, end_year + 1))
+    alcaldia_cube = kpi_cube.slice(alcaldia_normalized=selected_alcaldia)
+    kpi_alcaldia_cube = year_cube.slice(alcaldia_normalized=selected_alcaldia)
+    
+    # Hotspot stats break down by day of week, which needs the in-process crime cube
+    crime_cube = get_crime_cube()
+    filtered_alcaldia_cube = crime_cube.slice(
+        year=range(start_year, end_year + 1), alcaldia_normalized=selected_alcaldia
+    )
     
     # ===============================
     # CALCULATE KPI METRICS
     # ===============================
     
     # 1. CRIME RANKING
-    all_alcaldias_counts = df[
-        (df['year'] >= start_year) & (df['year'] <= end_year)
-    ].groupby('alcaldia_normalized').size().sort_values(ascending=False)
+    all_alcaldias_counts = year_cube.rollup('alcaldia_normalized').sort_values(ascending=False)
     
     alcaldia_rank = list(all_alcaldias_counts.index).index(selected_alcaldia) + 1
     total_alcaldias = len(all_alcaldias_counts)
     
     # 2. AVERAGE CRIMES PER MONTH
-    if not filtered_alcaldia_df.empty:
-        filtered_alcaldia_df['year_month'] = filtered_alcaldia_df['fecha_hecho'].dt.to_period('M')
-        unique_months = filtered_alcaldia_df['year_month'].nunique()
-        total_crimes = len(filtered_alcaldia_df)
+    if not kpi_alcaldia_cube.empty:
+        unique_months = len(kpi_alcaldia_cube.rollup('year', 'month'))
+        total_crimes = kpi_alcaldia_cube.total()
         avg_crimes_per_month = total_crimes / unique_months if unique_months > 0 else 0
     else:
         total_crimes = 0
@@ -779,8 +715,8 @@ def show():
     latest_year = end_year
     previous_year = latest_year - 1
     
-    latest_year_crimes = len(alcaldia_df[alcaldia_df['year'] == latest_year])
-    previous_year_crimes = len(alcaldia_df[alcaldia_df['year'] == previous_year])
+    latest_year_crimes = alcaldia_cube.slice(year=latest_year).total()
+    previous_year_crimes = alcaldia_cube.slice(year=previous_year).total()
     
     if previous_year_crimes > 0:
         yoy_change = ((latest_year_crimes - previous_year_crimes) / previous_year_crimes) * 100
@@ -849,26 +785,21 @@ def show():
     
     show_breakdown_historical = st.checkbox("Mostrar desglose por violencia", key="violence_breakdown_historical")
     
-    if not filtered_alcaldia_df.empty:
+    if not kpi_alcaldia_cube.empty:
         # Aggregate by month
-        monthly_crimes = filtered_alcaldia_df.groupby([filtered_alcaldia_df['fecha_hecho'].dt.to_period('M')]).size().reset_index(name='total')
-        monthly_crimes['fecha_hecho'] = monthly_crimes['fecha_hecho'].dt.to_timestamp()
-        monthly_crimes = monthly_crimes.sort_values('fecha_hecho')
+        monthly_crimes = kpi_alcaldia_cube.monthly()
+        monthly_crimes.columns = ['fecha_hecho', 'total']
         
         # Apply Spanish month names
         monthly_crimes['date_label'] = monthly_crimes['fecha_hecho'].apply(get_spanish_month_name)
         
         if show_breakdown_historical:
             # By violence category
-            violent_monthly = filtered_alcaldia_df[filtered_alcaldia_df['violence_category'] == 'violent'].groupby(
-                filtered_alcaldia_df[filtered_alcaldia_df['violence_category'] == 'violent']['fecha_hecho'].dt.to_period('M')
-            ).size().reset_index(name='violent')
-            violent_monthly['fecha_hecho'] = violent_monthly['fecha_hecho'].dt.to_timestamp()
+            violent_monthly = kpi_alcaldia_cube.slice(violence_category='violent').monthly()
+            violent_monthly.columns = ['fecha_hecho', 'violent']
             
-            non_violent_monthly = filtered_alcaldia_df[filtered_alcaldia_df['violence_category'] == 'non_violent'].groupby(
-                filtered_alcaldia_df[filtered_alcaldia_df['violence_category'] == 'non_violent']['fecha_hecho'].dt.to_period('M')
-            ).size().reset_index(name='non_violent')
-            non_violent_monthly['fecha_hecho'] = non_violent_monthly['fecha_hecho'].dt.to_timestamp()
+            non_violent_monthly = kpi_alcaldia_cube.slice(violence_category='non_violent').monthly()
+            non_violent_monthly.columns = ['fecha_hecho', 'non_violent']
             
             # Merge
             monthly_crimes = monthly_crimes.merge(violent_monthly, on='fecha_hecho', how='left')
@@ -972,20 +903,20 @@ def show():
     with map_col_left:
         st.markdown("#### 📊 Resumen de Criminalidad")
         
-        if not filtered_alcaldia_df.empty:
+        if not filtered_alcaldia_cube.empty:
             # Calculate metrics
-            total_crimes_map = len(filtered_alcaldia_df)
+            total_crimes_map = filtered_alcaldia_cube.total()
             
             # Weekend vs Weekday
             # Weekend = Saturday (5) and Sunday (6)
-            weekend_crimes = len(filtered_alcaldia_df[filtered_alcaldia_df['day_of_week'].isin([5, 6])])
+            weekend_crimes = filtered_alcaldia_cube.slice(day_of_week=[5, 6]).total()
             weekday_crimes = total_crimes_map - weekend_crimes
             weekend_ratio = (weekend_crimes / total_crimes_map * 100) if total_crimes_map > 0 else 0
             weekday_ratio = 100 - weekend_ratio
             
             # Violent vs Non-Violent
-            violent_crimes_map = len(filtered_alcaldia_df[filtered_alcaldia_df['violence_category'] == 'violent'])
-            non_violent_crimes_map = len(filtered_alcaldia_df[filtered_alcaldia_df['violence_category'] == 'non_violent'])
+            violent_crimes_map = filtered_alcaldia_cube.slice(violence_category='violent').total()
+            non_violent_crimes_map = filtered_alcaldia_cube.slice(violence_category='non_violent').total()
             violent_ratio_map = (violent_crimes_map / total_crimes_map * 100) if total_crimes_map > 0 else 0
             non_violent_ratio_map = 100 - violent_ratio_map
             
@@ -1085,9 +1016,8 @@ def show():
     
     with map_col_right:
         if not filtered_alcaldia_df.empty:
-            # Filter data with valid coordinates
-            map_crimes = filtered_alcaldia_df.dropna(subset=['latitud', 'longitud']).copy()
-            map_crimes = map_crimes[(map_crimes['latitud'] != 0) & (map_crimes['longitud'] != 0)]
+            # Already restricted to valid coordinates by the query
+            map_crimes = filtered_alcaldia_df
             
             if not map_crimes.empty:
                 # Toggle for view mode
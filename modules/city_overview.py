@@ -4,17 +4,17 @@ import json
 import os
 os.environ['MAPBOX_API_KEY'] = "pk.eyJ1IjoiYW5keTMxMiIsImEiOiJjbWh0dnljOTUxdDg4Mm5wdnpiYnYxbWhrIn0.p2bRkfMhXBf2V3Gf94gI7w"
 from datetime import datetime, timedelta
-from supabase import create_client
 from components.charts import render_crime_timeline_chart
 from components.mckinsey_styling import apply_mckinsey_styles
+from utils.crime_store import get_crime_data, refresh_crime_store
+from utils.crime_cube import get_crime_cube
+from utils.crime_aggregates import get_kpi_cube, refresh_aggregates
+from utils.crime_query import crime_query
+from utils.alcaldia_names import normalize_alcaldia_series
 
 # ===============================
 # Configuration
 # ===============================
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-SUPABASE_TABLE = os.getenv("SUPABASE_TABLE", "FGJ")
-
 # McKinsey Color Palette
 MCKINSEY_COLORS = {
     'primary_blue': '#0066CC',
@@ -33,76 +33,15 @@ MCKINSEY_COLORS = {
 # ===============================
 # Helper Functions
 # ===============================
-def normalize_alcaldia_name(name):
-    """Normalize alcaldía names for matching"""
-    if pd.isna(name):
-        return None
-    name = str(name).upper()
-    replacements = {
-        'Á': 'A', 'É': 'E', 'Í': 'I', 'Ó': 'O', 'Ú': 'U',
-        'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u'
-    }
-    for old, new in replacements.items():
-        name = name.replace(old, new)
-    
-    name = name.replace('.', '').strip()
-    if name.endswith(' DE MORELOS'):
-        name = name.replace(' DE MORELOS', '')
-    if name.startswith('LA '):
-        name = name[3:]
-    return name
+CITY_OVERVIEW_COLUMNS = [
+    'alcaldia_hecho', 'fecha_hecho', 'delito', 'latitud', 'longitud',
+    'year', 'month', 'day_of_week', 'date', 'hour',
+    'alcaldia_normalized', 'violence_category'
+]
 
-def categorize_violence(delito_text):
-    """Categorize crime by violence"""
-    if pd.isna(delito_text):
-        return 'unknown'
-    delito_lower = str(delito_text).lower()
-    if 'con violencia' in delito_lower:
-        return 'violent'
-    elif 'sin violencia' in delito_lower:
-        return 'non_violent'
-    return 'unknown'
-
-@st.cache_data(ttl=3600)
 def load_crime_data():
-    """Load and preprocess crime data from Supabase"""
-    try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        
-        response = supabase.table(SUPABASE_TABLE).select(
-            "alcaldia_hecho, anio_hecho, fecha_hecho, hora_hecho, hora, delito, latitud, longitud"
-        ).execute()
-        
-        df = pd.DataFrame(response.data)
-        
-        if df.empty:
-            return df
-        
-        df['fecha_hecho'] = pd.to_datetime(df['fecha_hecho'], errors='coerce')
-        df['year'] = df['fecha_hecho'].dt.year
-        df['month'] = df['fecha_hecho'].dt.month
-        df['day_of_week'] = df['fecha_hecho'].dt.dayofweek
-        df['date'] = df['fecha_hecho'].dt.date
-        
-        # Use 'hora' column if available (should be numeric)
-        if 'hora' in df.columns:
-            df['hour'] = pd.to_numeric(df['hora'], errors='coerce')
-            # If values are 1-24, convert a 0-23
-            if df['hour'].max() == 24:
-                df['hour'] = df['hour'].replace(24, 0)
-            # Ensure values are in 0-23 range
-            df['hour'] = df['hour'].apply(lambda x: x if pd.isna(x) or (0 <= x <= 23) else None)
-        else:
-            df['hour'] = None
-        
-        df['alcaldia_normalized'] = df['alcaldia_hecho'].apply(normalize_alcaldia_name)
-        df['violence_category'] = df['delito'].apply(categorize_violence)
-        df = df[df['alcaldia_normalized'].notna()]
-        
-        return df
-    except Exception as e:
-        st.error(f"Error loading data: {e}")
-        return pd.DataFrame()
+    """Load preprocessed crime data from the shared crime store"""
+    return get_crime_data(CITY_OVERVIEW_COLUMNS)
 
 @st.cache_data
 def load_population_data():
@@ -124,7 +63,7 @@ def load_population_data():
         if 'alc' not in pop_df.columns:
             return None
         
-        pop_df['alc_normalized'] = pop_df['alc'].apply(normalize_alcaldia_name)
+        pop_df['alc_normalized'] = normalize_alcaldia_series(pop_df['alc'])
         pop_df['pob'] = pd.to_numeric(pop_df['pob'], errors='coerce')
         population_by_alcaldia = pop_df.groupby('alc_normalized')['pob'].sum().to_dict()
         
@@ -137,7 +76,7 @@ def estimate_population_from_crimes(df):
     """Fallback: estimate rough population distribution from crime density"""
     CDMX_TOTAL_POP = 9200000
     
-    alcaldia_crime_counts = df.groupby('alcaldia_normalized').size()
+    alcaldia_crime_counts = df.groupby('alcaldia_normalized', observed=True).size()
     total_crimes = alcaldia_crime_counts.sum()
     
     population_by_alcaldia = {}
@@ -447,6 +386,8 @@ def show():
     # Refresh button in sidebar
     if st.sidebar.button("🔄 Actualizar Datos", use_container_width=True, key='sidebar_refresh'):
         st.cache_data.clear()
+        refresh_crime_store()
+        refresh_aggregates()
         st.rerun()
     
     # Info section
@@ -495,6 +436,8 @@ def show():
     with col3:
         if st.button("🔄 Actualizar", use_container_width=True, key='top_refresh'):
             st.cache_data.clear()
+            refresh_crime_store()
+            refresh_aggregates()
             st.rerun()
     
     st.markdown('</div>', unsafe_allow_html=True)
@@ -503,45 +446,43 @@ def show():
     start_year, end_year = st.session_state.year_range
     violence_filter = st.session_state.violence_filter
     
-    filtered_df = df[(df['year'] >= start_year) & (df['year'] <= end_year)].copy()
-    
-    if violence_filter == "Solo Violentos":
-        filtered_df = filtered_df[filtered_df['violence_category'] == 'violent']
-    elif violence_filter == "Solo No Violentos":
-        filtered_df = filtered_df[filtered_df['violence_category'] == 'non_violent']
+    def filter_cube(cube):
+        """Apply the violence filter, then the year range; returns (violence_cube, filtered_cube)"""
+        if violence_filter == "Solo Violentos":
+            cube = cube.slice(violence_category='violent')
+        elif violence_filter == "Solo No Violentos":
+            cube = cube.slice(violence_category='non_violent')
+        return cube, cube.slice(year=range(start_year, end_year + 1))
+    
+    # Headline metrics come from server-side aggregates (alcaldía × year × month × violence);
+    # the charts below need hour/day breakdowns and use the in-process crime cube
+    kpi_violence_cube, kpi_filtered_cube = filter_cube(get_kpi_cube())
+    violence_cube, filtered_cube = filter_cube(get_crime_cube())
     # ===============================
     # CALCULATE METRICS
     # ===============================
-    total_crimes_current = len(filtered_df)
+    total_crimes_current = kpi_filtered_cube.total()
     
     latest_year = end_year
     previous_year = latest_year - 1
     
-    latest_df = filtered_df[filtered_df['year'] == latest_year]
-    total_crimes_latest = len(latest_df)
-    
-    previous_df = df[(df['year'] == previous_year)]
-    if violence_filter == "Solo Violentos":
-        previous_df = previous_df[previous_df['violence_category'] == 'violent']
-    elif violence_filter == "Solo No Violentos":
-        previous_df = previous_df[previous_df['violence_category'] == 'non_violent']
-    total_crimes_previous = len(previous_df)
+    total_crimes_latest = kpi_filtered_cube.slice(year=latest_year).total()
+    total_crimes_previous = kpi_violence_cube.slice(year=previous_year).total()
     
     if total_crimes_previous > 0:
         yoy_change = ((total_crimes_latest - total_crimes_previous) / total_crimes_previous) * 100
     else:
         yoy_change = 0
     
-    violent_count = len(filtered_df[filtered_df['violence_category'] == 'violent'])
+    violent_count = kpi_filtered_cube.slice(violence_category='violent').total()
     violent_pct = (violent_count / total_crimes_current * 100) if total_crimes_current > 0 else 0
     
-    alcaldia_counts = filtered_df.groupby('alcaldia_normalized').size().sort_values(ascending=False)
+    alcaldia_counts = kpi_filtered_cube.rollup('alcaldia_normalized').sort_values(ascending=False)
     most_dangerous_alcaldia = alcaldia_counts.index[0] if len(alcaldia_counts) > 0 else "N/A"
     most_dangerous_count = alcaldia_counts.iloc[0] if len(alcaldia_counts) > 0 else 0
     
     if total_crimes_current > 0:
-        filtered_df['year_month'] = filtered_df['fecha_hecho'].dt.to_period('M')
-        unique_months = filtered_df['year_month'].nunique()
+        unique_months = len(kpi_filtered_cube.rollup('year', 'month'))
         avg_crimes_per_month = total_crimes_current / unique_months if unique_months > 0 else 0
     else:
         avg_crimes_per_month = 0
@@ -616,9 +557,8 @@ def show():
     st.session_state.breakdown_option = breakdown_option
     
     if st.session_state.breakdown_option == "Delitos Totales":
-        time_series = filtered_df.groupby(filtered_df['fecha_hecho'].dt.to_period('M')).size().reset_index()
+        time_series = filtered_cube.monthly()
         time_series.columns = ['month', 'crimes']
-        time_series['month'] = time_series['month'].dt.to_timestamp()
         
         chart_data = [{
             'date': row['month'].strftime('%Y-%m-%d'),
@@ -629,12 +569,8 @@ def show():
         mode = 'single'
         
     else:
-        time_series_breakdown = filtered_df.groupby([
-            filtered_df['fecha_hecho'].dt.to_period('M'),
-            'violence_category'
-        ]).size().reset_index()
+        time_series_breakdown = filtered_cube.monthly('violence_category')
         time_series_breakdown.columns = ['month', 'category', 'crimes']
-        time_series_breakdown['month'] = time_series_breakdown['month'].dt.to_timestamp()
         
         time_series_breakdown = time_series_breakdown[
             time_series_breakdown['category'].isin(['violent', 'non_violent'])
@@ -687,22 +623,20 @@ def show():
             })
         
         # 2. Peak Hour Analysis
-        if not filtered_df.empty and 'hour' in filtered_df.columns:
-            valid_hours_df = filtered_df[filtered_df['hour'].notna()]
-            if not valid_hours_df.empty:
-                hourly_crimes = valid_hours_df.groupby('hour').size()
-                if not hourly_crimes.empty:
-                    peak_hour = int(hourly_crimes.idxmax())
-                    peak_hour_count = hourly_crimes.max()
-                    insights.append({
-                        'icon': '🕐',
-                        'text': f'Hora pico de delitos: {peak_hour:02d}:00-{(peak_hour+1)%24:02d}:00 ({format_number(peak_hour_count)} incidentes)',
-                        'color': MCKINSEY_COLORS['primary_blue']
-                    })
+        if not filtered_cube.empty:
+            hourly_crimes = filtered_cube.rollup('hour')
+            if not hourly_crimes.empty:
+                peak_hour = int(hourly_crimes.idxmax())
+                peak_hour_count = hourly_crimes.max()
+                insights.append({
+                    'icon': '🕐',
+                    'text': f'Hora pico de delitos: {peak_hour:02d}:00-{(peak_hour+1)%24:02d}:00 ({format_number(peak_hour_count)} incidentes)',
+                    'color': MCKINSEY_COLORS['primary_blue']
+                })
         
         # 3. Peak Day Analysis
         day_names = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
-        daily_crimes = filtered_df.groupby('day_of_week').size()
+        daily_crimes = filtered_cube.rollup('day_of_week')
         if not daily_crimes.empty:
             peak_day_num = daily_crimes.idxmax()
             peak_day_name = day_names[int(peak_day_num)]
@@ -773,15 +707,11 @@ def show():
         st.markdown("#### 🗓️ Mapa de Calor de Delitos: Día × Hora")
         
         # Prepare heatmap data
-        if not filtered_df.empty and 'hour' in filtered_df.columns:
-            # Filter out rows with no hour data
-            valid_heatmap_df = filtered_df[filtered_df['hour'].notna()].copy()
+        if not filtered_cube.empty:
+            # Cells with no hour data drop out of the day × hour rollup
+            heatmap_pivot = filtered_cube.pivot('day_of_week', 'hour')
             
-            if not valid_heatmap_df.empty:
-                # Create pivot table for heatmap
-                heatmap_data = valid_heatmap_df.groupby(['day_of_week', 'hour']).size().reset_index(name='count')
-                heatmap_pivot = heatmap_data.pivot(index='day_of_week', columns='hour', values='count').fillna(0)
-                
+            if not heatmap_pivot.empty:
                 # Reindex a ensure all hours and days are present
                 heatmap_pivot = heatmap_pivot.reindex(index=range(7), columns=range(24), fill_value=0)
                 
@@ -835,8 +765,8 @@ def show():
                 st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': False})
                 
                 # Show data quality note
-                total_with_hour = len(valid_heatmap_df)
-                total_filtered = len(filtered_df)
+                total_with_hour = int(heatmap_pivot.values.sum())
+                total_filtered = filtered_cube.total()
                 coverage_pct = (total_with_hour / total_filtered * 100) if total_filtered > 0 else 0
                 st.caption(f"📊 Mostrando {format_number(total_with_hour)} delitos con datos de tiempo ({coverage_pct:.1f}% de los datos filtrados)")
             else:
@@ -886,7 +816,8 @@ def show():
         # Prepare data based on composition type
         if st.session_state.composition_type == "Delitos Totales":
             # Simple aggregation
-            alcaldia_stats = filtered_df.groupby('alcaldia_normalized').size().reset_index(name='crimes')
+            alcaldia_stats = filtered_cube.rollup('alcaldia_normalized').reset_index(name='crimes')
+            alcaldia_stats = alcaldia_stats.astype({'alcaldia_normalized': str})
             
             # Add population data if needed
             if st.session_state.measurement_type == "Per Cápita (por 100k)" and population_data:
@@ -926,14 +857,8 @@ def show():
             
         else:  # Violence Breakdown
             # Aggregate by alcaldia and violence category
-            alcaldia_violence = filtered_df.groupby(['alcaldia_normalized', 'violence_category']).size().reset_index(name='crimes')
-            
             # Pivot a get violent and non-violent columns
-            alcaldia_pivot = alcaldia_violence.pivot(
-                index='alcaldia_normalized', 
-                columns='violence_category', 
-                values='crimes'
-            ).fillna(0)
+            alcaldia_pivot = filtered_cube.pivot('alcaldia_normalized', 'violence_category')
             
             # Ensure both columns exist
             if 'violent' not in alcaldia_pivot.columns:
@@ -1098,7 +1023,7 @@ def show():
         try:
             agencias_df = pd.read_csv('agencias_geocoded.csv')
             agencias_df = agencias_df.dropna(subset=['latitud', 'longitud'])
-            agencias_df['agencia_normalized'] = agencias_df['agencia'].apply(normalize_alcaldia_name)
+            agencias_df['agencia_normalized'] = normalize_alcaldia_series(agencias_df['agencia'])
             return agencias_df
         except FileNotFoundError:
             st.error("❌ Archivo 'agencias_geocoded.csv' no encontrado.")
@@ -1107,46 +1032,31 @@ def show():
             st.error(f"Error loading agencias: {e}")
             return pd.DataFrame()
 
-    # Load crime data with agencia field
+    # Crime counts per raw agencia name (all years, valid coordinates only)
     @st.cache_data(ttl=3600)
-    def load_crime_data_with_agencia():
-        """Load crime data including agencia field"""
+    def load_agencia_crime_counts():
+        """Count crimes per agencia with the query engine (no row copies)"""
         try:
-            supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-            response = supabase.table(SUPABASE_TABLE).select(
-                "alcaldia_hecho, anio_hecho, fecha_hecho, agencia, delito, latitud, longitud"
-            ).execute()
-            
-            df = pd.DataFrame(response.data)
-            if df.empty:
-                return df
-            
-            df['fecha_hecho'] = pd.to_datetime(df['fecha_hecho'], errors='coerce')
-            df['year'] = df['fecha_hecho'].dt.year
-            df['agencia_normalized'] = df['agencia'].apply(normalize_alcaldia_name)
-            df = df.dropna(subset=['latitud', 'longitud'])
-            df = df[(df['latitud'] != 0) & (df['longitud'] != 0)]
-            
-            return df
+            counts = crime_query().located().group_by('agencia')
+            counts = counts[
+                counts['agencia'].notna() &
+                (counts['agencia'].astype(str) != '') &
+                (counts['agencia'].astype(str) != 'nan')
+            ].astype({'agencia': str}).reset_index(drop=True)
+            counts['agencia_normalized'] = normalize_alcaldia_series(counts['agencia'])
+            return counts
         except Exception as e:
             st.error(f"Error loading crime data: {e}")
-            return pd.DataFrame()
+            return pd.DataFrame(columns=['agencia', 'crimes', 'agencia_normalized'])
 
     agencias_df = load_agencias_geocoded()
-    crime_df_agencia = load_crime_data_with_agencia()
+    agencia_counts = load_agencia_crime_counts()
 
     if agencias_df.empty:
         st.warning("⚠️ No hay datos de agencias disponibles")
     else:
-        # Get unique agencias from crimes database (excluding NaN)
-        crime_agencias_with_names = crime_df_agencia[
-            crime_df_agencia['agencia'].notna() & 
-            (crime_df_agencia['agencia'] != '') &
-            (crime_df_agencia['agencia'] != 'nan')
-        ].copy()
-        
         # Get unique agencia names and normalized names from crimes
-        unique_crime_agencias = crime_agencias_with_names[['agencia', 'agencia_normalized']].drop_duplicates()
+        unique_crime_agencias = agencia_counts[['agencia', 'agencia_normalized']].drop_duplicates()
         
         # Match with coordinates from agencias_geocoded
         agencias_with_crimes = agencias_df.merge(
@@ -1159,7 +1069,9 @@ def show():
         agencias_with_crimes = agencias_with_crimes.drop_duplicates(subset=['agencia_normalized'])
         
         # Add crime counts a agencias
-        agencia_crime_counts = crime_agencias_with_names.groupby('agencia_normalized').size().reset_index(name='crime_count')
+        agencia_crime_counts = (
+            agencia_counts.groupby('agencia_normalized')['crimes'].sum().reset_index(name='crime_count')
+        )
         agencias_with_crimes = agencias_with_crimes.merge(agencia_crime_counts, on='agencia_normalized', how='left')
         agencias_with_crimes['crime_count'] = agencias_with_crimes['crime_count'].fillna(0).astype(int)
         
@@ -1232,25 +1144,21 @@ def show():
                     st.session_state.selected_agencia_map = None
                     st.rerun()
         
-        # Filter crimes by year range (respecting dashboard filters) - only crimes with valid agencia names
-        filtered_crime_df = crime_df_agencia[
-            (crime_df_agencia['year'] >= start_year) &
-            (crime_df_agencia['year'] <= end_year) &
-            (crime_df_agencia['agencia'].notna()) &
-            (crime_df_agencia['agencia'] != '') &
-            (crime_df_agencia['agencia'] != 'nan')
-        ]
-        
         # Info panel for selected agencia
         if st.session_state.selected_agencia_map:
             selected_agencia_info = agencias_with_crimes[
                 agencias_with_crimes['agencia_normalized'] == st.session_state.selected_agencia_map
             ].iloc[0]
             
-            # Filter crimes by selected agencia
-            selected_crimes = filtered_crime_df[
-                filtered_crime_df['agencia_normalized'] == st.session_state.selected_agencia_map
+            # Crimes of the selected agencia in the year range (respecting dashboard filters);
+            # only the columns the map and the detail panel read are materialized
+            agencia_names = agencia_counts.loc[
+                agencia_counts['agencia_normalized'] == st.session_state.selected_agencia_map, 'agencia'
             ]
+            selected_crimes = (
+                crime_query().years(start_year, end_year).located().agencias(*agencia_names)
+                .rows('latitud', 'longitud', 'violence_category', 'delito', 'alcaldia_hecho', 'fecha_hecho', 'year')
+            )
             
             # Get agencia name (use agencia_x from merge, which is from crimes database)
             agencia_display_name = selected_agencia_info['agencia_x']
@@ -1340,7 +1248,7 @@ def show():
             if view_mode == "Mapa de Calor":
                 crime_layer = pdk.Layer(
                     "HeatmapLayer",
-                    data=selected_crimes,
+                    data=selected_crimes[['latitud', 'longitud']],
                     get_position='[longitud, latitud]',
                     opacity=0.8,
                     threshold=0.05,
@@ -1360,7 +1268,7 @@ def show():
             elif view_mode == "Puntos":
                 crime_layer = pdk.Layer(
                     "ScatterplotLayer",
-                    data=selected_crimes,
+                    data=selected_crimes[['latitud', 'longitud']],
                     get_position='[longitud, latitud]',
                     get_radius=40,
                     get_fill_color=[220, 20, 60, 160],
@@ -1370,7 +1278,7 @@ def show():
             else:  # Hexágonos
                 crime_layer = pdk.Layer(
                     "HexagonLayer",
-                    data=selected_crimes,
+                    data=selected_crimes[['latitud', 'longitud']],
                     get_position='[longitud, latitud]',
                     radius=150,
                     elevation_scale=1.5,
@@ -1461,7 +1369,10 @@ def show():
         st.markdown("---")
         
         # Calculate crime counts per agencia for current year range (only valid agencias)
-        agencia_crime_ranking = filtered_crime_df.groupby('agencia_normalized').size().reset_index(name='crime_count')
+        range_counts = crime_query().years(start_year, end_year).located().group_by('agencia')
+        range_counts = range_counts[range_counts['agencia'].notna()].astype({'agencia': str})
+        range_counts['agencia_normalized'] = normalize_alcaldia_series(range_counts['agencia'])
+        agencia_crime_ranking = range_counts.groupby('agencia_normalized')['crimes'].sum().reset_index(name='crime_count')
         agencia_crime_ranking = agencia_crime_ranking.merge(
             agencias_with_crimes[['agencia_normalized', 'agencia_x']], 
             on='agencia_normalized', 
@@ -1552,9 +1463,7 @@ def show():
             stat_col1, stat_col2, stat_col3, stat_col4 = st.columns(4)
             
             # Calculate stats
-            selected_violent = len(selected_crimes[
-                selected_crimes['delito'].str.contains('con violencia', case=False, na=False)
-            ])
+            selected_violent = int((selected_crimes['violence_category'] == 'violent').sum())
             violent_pct_selected = (selected_violent / len(selected_crimes) * 100) if len(selected_crimes) > 0 else 0
             
             # Most common crime
@@ -1678,7 +1587,7 @@ def show():
     # Debug info
     with st.expander("🔍 Información de Depuración"):
         st.write(f"Total records loaded: {len(df):,}")
-        st.write(f"Filtered records: {len(filtered_df):,}")
+        st.write(f"Filtered records: {total_crimes_current:,}")
         st.write(f"Date range: {df['fecha_hecho'].min()} a {df['fecha_hecho'].max()}")
         st.write(f"Alcaldías: {df['alcaldia_normalized'].nunique()}")
         st.write(f"Selected range: {start_year} a {end_year}")
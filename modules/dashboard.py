@@ -1,5 +1,6 @@
 import streamlit as st
 import plotly.express as px
+from utils.crime_query import crime_query
 from utils.data_loader import load_data
 
 def format_number(n):
@@ -25,18 +26,19 @@ def show():
         years = sorted(df["anio_hecho"].dropna().unique())
         selected_year = st.selectbox("Select Year", [None] + list(years), index=0)
 
-    # Apply filters
-    filtered_df = df.copy()
+    # Apply filters (bitmap index lookup, only the plotted columns are gathered)
+    query = crime_query()
     if selected_boroughs:
-        filtered_df = filtered_df[filtered_df["alcaldia_hecho"].isin(selected_boroughs)]
+        query = query.where("alcaldia_hecho", "in", selected_boroughs)
     if selected_year is not None:
-        filtered_df = filtered_df[filtered_df["anio_hecho"] == selected_year]
+        query = query.years([selected_year])
+    filtered_df = query.rows("alcaldia_hecho", "violence_category", "fecha_hecho")
 
     # ===============================
     # KPIs
     # ===============================
     total_incidents = len(filtered_df)
-    violent_incidents = filtered_df[filtered_df["delito"].str.contains("con violencia", case=False, na=False)].shape[0]
+    violent_incidents = int((filtered_df["violence_category"] == "violent").sum())
     top_borough = filtered_df["alcaldia_hecho"].value_counts().idxmax() if not filtered_df.empty else "N/A"
     active_boroughs = filtered_df["alcaldia_hecho"].nunique()
 
@@ -54,7 +56,8 @@ def show():
     # Visualizations
     # ===============================
     def plot_crimes_by_borough(df):
-        counts = df["alcaldia_hecho"].value_counts().reset_index()
+        counts = df["alcaldia_hecho"].value_counts()
+        counts = counts[counts > 0].reset_index()
         counts.columns = ["Borough", "Cases"]
         fig = px.bar(counts, x="Borough", y="Cases", color="Cases", text=counts["Cases"].apply(format_number))
         fig.update_traces(textposition="outside")
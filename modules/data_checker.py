@@ -2,18 +2,15 @@
 import streamlit as st
 import pandas as pd
 import json
-import ast
-from supabase import create_client
+from utils.supabase_fetcher import fetch_table
+from utils.crime_store import get_crime_store
+from utils.alcaldia_names import unmapped_alcaldias
+from utils.cuadrantes import load_cuadrantes_table
 
 # -------------------------
 # Supabase Configuration
 # -------------------------
-SUPABASE_URL = "https://xzeycsqwynjxnzgctydr.supabase.co"
-SUPABASE_KEY = "sb_publishable_wSTGdAAY_IIuYKNpr6N6GA_rGZy-y29"
 SUPABASE_TABLE = "FGJ"
-SUPABASE_TABLE_CUADRANTS = "cuadrantes"
-
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 # -------------------------
 # Data Loading Functions
@@ -22,16 +19,7 @@ supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 def load_crime_data():
     """Load crime data from Supabase"""
     st.info("📡 Loading crime data...")
-    all_data = []
-    batch_size = 1000
-    offset = 0
-
-    while True:
-        res = supabase.table(SUPABASE_TABLE).select("*").range(offset, offset + batch_size - 1).execute()
-        if not res.data:
-            break
-        all_data.extend(res.data)
-        offset += batch_size
+    all_data = fetch_table(SUPABASE_TABLE, "*")
 
     df = pd.DataFrame(all_data)
     df = df.dropna(subset=['latitud', 'longitud'])
@@ -45,16 +33,9 @@ def load_crime_data():
 def load_cuadrantes():
     """Load cuadrantes from Supabase"""
     st.info("📡 Loading cuadrantes...")
-    res = supabase.table(SUPABASE_TABLE_CUADRANTS).select("*").execute()
-    cuadrantes = pd.DataFrame(res.data)
-    
-    if "geo_shape" in cuadrantes.columns:
-        def parse_shape(v):
-            try:
-                return ast.literal_eval(v) if isinstance(v, str) else v
-            except:
-                return None
-        cuadrantes["geo_shape"] = cuadrantes["geo_shape"].apply(parse_shape)
+    cuadrantes = load_cuadrantes_table()
+    if 'geometry' in cuadrantes.columns:
+        cuadrantes = cuadrantes.drop(columns=['geometry'])
     
     st.success(f"✅ Loaded {len(cuadrantes)} cuadrantes")
     return cuadrantes
@@ -94,6 +75,13 @@ def show():
                 st.write("  Unique values:", df[col].nunique())
                 st.write("  Value counts:")
                 st.dataframe(df[col].value_counts())
+
+                unmapped = unmapped_alcaldias(df[col])
+                if unmapped.empty:
+                    st.success("✅ All alcaldía spellings map to one of the 16 alcaldías")
+                else:
+                    st.warning(f"⚠️ {len(unmapped)} alcaldía spellings do not map to a known alcaldía")
+                    st.dataframe(unmapped)
     
     # ==========================================
     # CUADRANTES DATA STRUCTURE
@@ -261,4 +249,24 @@ def show():
         
     else:
         st.error("❌ 'agencia' column not found in dataset")
-        st.write("**Available columns:**", df.columns.tolist())
\ No newline at end of file
+        st.write("**Available columns:**", df.columns.tolist())
+    # ==========================================
+    # CRIME STORE MEMORY
+    # ==========================================
+    st.header("6️⃣ Crime Store Memory")
+    st.write("Per-column dtype and memory usage of the shared, preprocessed crime store.")
+
+    try:
+        store = get_crime_store()
+        report = store.memory_report()
+        raw_mb = df.memory_usage(deep=True, index=False).sum() / 1024 ** 2
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.metric("Crime store (compact schema)", f"{report['memory_mb'].iloc[-1]:,.1f} MB")
+        with col2:
+            st.metric("Raw rows (this page)", f"{raw_mb:,.1f} MB")
+
+        st.dataframe(report, use_container_width=True)
+    except Exception as e:
+        st.error(f"Error building memory report: {e}")
@@ -1,9 +1,31 @@
 import streamlit as st
 import json
+import threading
 import pandas as pd
 import streamlit.components.v1 as components
-from supabase import create_client
-import ast
+from utils.crime_store import get_crime_partitions, get_crime_store
+from utils.crime_query import crime_query
+from utils.crime_cube import get_crime_cube
+from utils.cuadrantes import load_cuadrantes_table
+from utils.geometry_tiers import simplify_feature_collection, simplify_geometry
+from utils.geojson_builder import (
+    date_column, grouped_counts, point_feature_collections, text_column
+)
+from utils.alcaldia_names import normalize_alcaldia_name, normalize_alcaldia_series
+from utils.vector_tiles import VECTOR_TILES_DEFAULT, get_tile_server
+
+# Columns the map page reads from the shared crime store
+MAP_CRIME_COLUMNS = [
+    'alcaldia_hecho', 'anio_hecho', 'fecha_hecho', 'latitud', 'longitud',
+    'delito', 'agencia', 'month', 'day_of_week', 'alcaldia_normalized', 'violence_category', 'cuadrante_id'
+]
+
+# Store violence categories -> labels used by the map legend and colors
+MAP_VIOLENCE_LABELS = {
+    'violent': 'con_violencia',
+    'non_violent': 'sin_violencia',
+    'unknown': 'unknown'
+}
 
 def show():
     """Display the interactive crime map"""
@@ -12,36 +34,11 @@ def show():
     # -------------------------
     # Configuration
     # -------------------------
-    SUPABASE_URL = "https://xzeycsqwynjxnzgctydr.supabase.co"
-    SUPABASE_KEY = "sb_publishable_wSTGdAAY_IIuYKNpr6N6GA_rGZy-y29"
-    SUPABASE_TABLE = "FGJ"
-    SUPABASE_TABLE_CUADRANTS = "cuadrantes"
-
     CDMX_CENTER = [19.4326, -99.1332]
 
-    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-
     # -------------------------
     # Helper Functions
     # -------------------------
-    def normalize_alcaldia_name(name):
-        """Normalize alcaldia names for matching"""
-        if pd.isna(name):
-            return None
-        import unicodedata
-        
-        name = str(name).upper().strip()
-        name = ''.join(c for c in unicodedata.normalize('NFD', name) 
-                    if unicodedata.category(c) != 'Mn')
-        name = name.replace('.', '')
-        name = name.replace(' DE MORELOS', '')
-        if name.startswith('LA '):
-            name = name[3:]
-        name = ' '.join(name.split())
-        
-        return name
-
-
     def match_alcaldia_name(alcaldia_name, cuadrantes_alcaldia_name):
         """Check if two alcaldia names match"""
         norm1 = normalize_alcaldia_name(alcaldia_name)
@@ -81,7 +78,8 @@ def show():
                     'bounds': [[min(lons), min(lats)], [max(lons), max(lats)]]
                 }
             
-            return geojson, alcaldia_bounds
+            # Bounds come from full precision; the map itself gets the lighter city tier
+            return simplify_feature_collection(geojson, 'city'), alcaldia_bounds
         except FileNotFoundError:
             st.error("❌ alcaldias.json not found")
             return None, {}
@@ -106,7 +104,7 @@ def show():
             # Group by alcaldía and sum population
             pop_df = df.groupby('alc')['pob'].sum().reset_index()
             pop_df.columns = ['alcaldia', 'population']
-            pop_df['alcaldia_normalized'] = pop_df['alcaldia'].apply(normalize_alcaldia_name)
+            pop_df['alcaldia_normalized'] = normalize_alcaldia_series(pop_df['alcaldia'])
             
             # Create dictionary for easy lookup
             pop_dict = dict(zip(pop_df['alcaldia_normalized'], pop_df['population']))
@@ -122,18 +120,10 @@ def show():
     @st.cache_data(show_spinner=False, ttl=3600)
     def load_cuadrantes():
         """Load cuadrantes from Supabase and organize by alcaldía"""
-        res = supabase.table(SUPABASE_TABLE_CUADRANTS).select("*").execute()
-        cuadrantes_df = pd.DataFrame(res.data)
-        
-        if "geo_shape" in cuadrantes_df.columns:
-            def parse_shape(v):
-                try:
-                    return ast.literal_eval(v) if isinstance(v, str) else v
-                except:
-                    return None
-            cuadrantes_df["geo_shape"] = cuadrantes_df["geo_shape"].apply(parse_shape)
-        
-        cuadrantes_df['alcaldia_normalized'] = cuadrantes_df['alcaldia'].apply(normalize_alcaldia_name)
+        cuadrantes_df = load_cuadrantes_table()
+        if cuadrantes_df.empty:
+            return {}, cuadrantes_df
+        cuadrantes_df = cuadrantes_df.drop(columns=['geometry'])
         
         # Organize cuadrantes by alcaldía
         cuadrantes_by_alcaldia = {}
@@ -146,7 +136,7 @@ def show():
                 if row['geo_shape'] and isinstance(row['geo_shape'], dict) and 'coordinates' in row['geo_shape']:
                     feature = {
                         'type': 'Feature',
-                        'geometry': row['geo_shape'],
+                        'geometry': simplify_geometry(row['geo_shape'], 'detail'),
                         'properties': {
                             'id': str(row['id']),
                             'no_cuadran': str(row['no_cuadran']),
@@ -167,118 +157,43 @@ def show():
         
         return cuadrantes_by_alcaldia, cuadrantes_df
 
-    @st.cache_data(show_spinner=False)
-    def perform_spatial_join_optimized(crime_points_df, cuadrantes_by_alcaldia):
+    def summarize_cuadrante_crimes(crime_points_df, cuadrantes_by_alcaldia):
         """
-        Optimized spatial join using GeoPandas with spatial indexing.
-        Returns the same cuadrante_crime_data structure as the original implementation.
+        Count crimes per cuadrante from the `cuadrante_id` tagged at ingest.
+        Returns {cuadrante_id: {'crime_count': int, 'crime_types': {delito: count}}}
+        with the 5 most frequent crime types per cuadrante.
         """
-        import geopandas as gpd
-        from shapely.geometry import shape
-        
-        # Step 1: Convert cuadrantes to GeoDataFrame
-        # Extract all cuadrante features from the nested dict
-        cuadrante_records = []
-        for alcaldia_norm, cuadrante_geojson in cuadrantes_by_alcaldia.items():
-            for feature in cuadrante_geojson['features']:
-                cuadrante_records.append({
-                    'cuadrante_id': feature['properties']['id'],
-                    'alcaldia_normalized': alcaldia_norm,
-                    'geometry': shape(feature['geometry']),
-                    'no_cuadran': feature['properties']['no_cuadran'],
-                    'alcaldia': feature['properties']['alcaldia'],
-                    'sector': feature['properties']['sector'],
-                    'zona': feature['properties']['zona']
-                })
-        
-        cuadrantes_gdf = gpd.GeoDataFrame(cuadrante_records, crs='EPSG:4326')
-        
-        # Step 2: Convert crimes to GeoDataFrame
-        crimes_gdf = gpd.GeoDataFrame(
-            crime_points_df,
-            geometry=gpd.points_from_xy(
-                crime_points_df['longitud'], 
-                crime_points_df['latitud']
-            ),
-            crs='EPSG:4326'
-        )
+        tagged = crime_points_df[crime_points_df['cuadrante_id'].notna()]
+        tagged = tagged.assign(crime_type=text_column(tagged['delito'], 'Unknown'))
+        crime_counts = tagged.groupby('cuadrante_id', observed=True).size().to_dict()
+        crime_types = grouped_counts(tagged, 'cuadrante_id', 'crime_type', top=5)
         
-        # Step 3: Perform spatial join with GeoPandas (uses spatial index automatically)
-        joined = gpd.sjoin(crimes_gdf, cuadrantes_gdf, how='left', predicate='within')
-        
-        # Step 4: Initialize cuadrante_crime_data structure
         cuadrante_crime_data = {}
-        for cuadrante_id in cuadrantes_gdf['cuadrante_id'].unique():
-            cuadrante_crime_data[cuadrante_id] = {
-                'crimes': [],
-                'crime_types': {}
-            }
-        
-        # Step 5: Process joined results and populate cuadrante_crime_data
-        for idx, row in joined[joined['cuadrante_id'].notna()].iterrows():
-            cuadrante_id = row['cuadrante_id']
-            crime_type = row['delito'] if pd.notna(row['delito']) else 'Unknown'
-            
-            cuadrante_crime_data[cuadrante_id]['crimes'].append({
-                'type': crime_type,
-                'date': row['fecha_hecho'].strftime('%Y-%m-%d') if pd.notna(row['fecha_hecho']) else 'N/A',
-                'agencia': row['agencia'] if pd.notna(row['agencia']) else 'N/A'
-            })
-            
-            if crime_type not in cuadrante_crime_data[cuadrante_id]['crime_types']:
-                cuadrante_crime_data[cuadrante_id]['crime_types'][crime_type] = 0
-            cuadrante_crime_data[cuadrante_id]['crime_types'][crime_type] += 1
+        for cuadrante_geojson in cuadrantes_by_alcaldia.values():
+            for feature in cuadrante_geojson['features']:
+                cuadrante_id = feature['properties']['id']
+                cuadrante_crime_data[cuadrante_id] = {
+                    'crime_count': int(crime_counts.get(cuadrante_id, 0)),
+                    'crime_types': crime_types.get(cuadrante_id, {})
+                }
         
         return cuadrante_crime_data
 
-    @st.cache_data(show_spinner=True, ttl=3600)
     def load_crime_data(selected_years):
-        """Load crime data from Supabase filtered by years"""
-        st.info(f"📡 Loading crime data for {', '.join(map(str, selected_years))}...")
-        
-        all_data = []
-        batch_size = 1000
-        
+        """Load crime data for the selected years from the shared crime store"""
         # Get data for selected years plus the previous year for comparison
         latest_year = max(selected_years)
         years_to_load = list(set(selected_years + [latest_year - 1]))
         
-        for year in years_to_load:
-            offset = 0
-            while True:
-                res = supabase.table(SUPABASE_TABLE)\
-                    .select("alcaldia_hecho, anio_hecho, fecha_hecho, latitud, longitud, delito, agencia")\
-                    .eq("anio_hecho", year)\
-                    .range(offset, offset + batch_size - 1)\
-                    .execute()
-                
-                if not res.data:
-                    break
-                all_data.extend(res.data)
-                offset += batch_size
-        
-        df = pd.DataFrame(all_data)
-        df['alcaldia_normalized'] = df['alcaldia_hecho'].apply(normalize_alcaldia_name)
-        
-        # Parse fecha_hecho and extract month and day of week
-        df['fecha_hecho'] = pd.to_datetime(df['fecha_hecho'], errors='coerce')
-        df['month'] = df['fecha_hecho'].dt.month  # 1-12
-        df['day_of_week'] = df['fecha_hecho'].dt.dayofweek  # 0=Monday, 6=Sunday
-        
-        # Convert lat/lon to numeric
-        df['latitud'] = pd.to_numeric(df['latitud'], errors='coerce')
-        df['longitud'] = pd.to_numeric(df['longitud'], errors='coerce')
+        # Assembled from per-year partitions of the store (no full-table mask)
+        df = get_crime_partitions('anio_hecho', years_to_load, MAP_CRIME_COLUMNS)
         
-        st.success(f"✅ Loaded {len(df):,} crime records")
         return df, latest_year
 
-    def calculate_crime_counts(crime_df, alcaldias_geojson, selected_years, population_data):
+    def calculate_crime_counts(crime_cube, alcaldias_geojson, selected_years, population_data):
         """Calculate crime counts and crimes per capita per alcaldía"""
-        # Filter to only selected years for the main count
-        selected_df = crime_df[crime_df['anio_hecho'].isin(selected_years)]
-        
-        # Get crime counts by normalized alcaldía name
-        crime_counts = selected_df.groupby('alcaldia_normalized').size().to_dict()
+        # Get crime counts by normalized alcaldía name for the selected years
+        crime_counts = crime_cube.slice(year=selected_years).rollup('alcaldia_normalized').to_dict()
         
         # Match to alcaldías in geojson and add crime count property
         all_crime_counts = []
@@ -313,84 +228,68 @@ def show():
             'per_capita': {'min': min_per_capita, 'max': max_per_capita}
         }
 
-    def prepare_alcaldia_analytics(crime_df, alcaldia_normalized, selected_years, latest_year, population_data):
-        """Prepare all analytics data for a specific alcaldía"""
-        
-        # Filter data for this alcaldía
-        alcaldia_df = crime_df[crime_df['alcaldia_normalized'] == alcaldia_normalized]
-        
-        # Get population
-        population = population_data.get(alcaldia_normalized, None)
-        
-        # 1. Total crimes for selected years
-        selected_df = alcaldia_df[alcaldia_df['anio_hecho'].isin(selected_years)]
-        total_crimes = len(selected_df)
-        
-        # Calculate crimes per capita (per 1,000 people)
-        crimes_per_capita = (total_crimes / population * 1000) if population and population > 0 else None
+    def prepare_alcaldia_analytics(crime_cube, alcaldia_names, selected_years, latest_year, population_data):
+        """
+        Prepare side panel analytics for every alcaldía at once.
+
+        Each breakdown (totals and ranking, year-over-year, monthly trend, day of
+        week) is a single rollup over the crime cube grouped by alcaldía, then
+        split per alcaldía. Returns {alcaldia_normalized: analytics dict}.
+        """
+        selected_cube = crime_cube.slice(year=selected_years)
         
-        # 2. Year-over-year change (latest year vs previous year)
-        latest_crimes = len(alcaldia_df[alcaldia_df['anio_hecho'] == latest_year])
-        previous_crimes = len(alcaldia_df[alcaldia_df['anio_hecho'] == latest_year - 1])
+        # 1. Totals for the selected years and the citywide ranking (computed once)
+        ranking = selected_cube.rollup('alcaldia_normalized').sort_values(ascending=False, kind='stable')
+        totals = {str(name): int(count) for name, count in ranking.items()}
+        ranks = {name: position + 1 for position, name in enumerate(totals)}
         
-        if previous_crimes > 0:
-            yoy_change = ((latest_crimes - previous_crimes) / previous_crimes) * 100
-        else:
-            yoy_change = 0 if latest_crimes == 0 else 100
+        # 2. Latest and previous year per alcaldía for the year-over-year change
+        yearly = crime_cube.slice(year=[latest_year, latest_year - 1]).rollup('alcaldia_normalized', 'year')
+        yearly = {(str(name), int(year)): int(count) for (name, year), count in yearly.items()}
         
         # 3. Monthly trend data (separate lines for each year)
-        # Month is already extracted from fecha_hecho as numeric (1-12)
-        monthly_data = []
-        for year in selected_years:
-            year_df = alcaldia_df[alcaldia_df['anio_hecho'] == year].copy()
-            # Filter out rows with invalid months
-            year_df = year_df[year_df['month'].notna()]
-            
-            if len(year_df) > 0:
-                monthly_counts = year_df.groupby('month').size().reset_index()
-                monthly_counts.columns = ['month', 'crimes']
-                monthly_counts['month'] = monthly_counts['month'].astype(int)
-                monthly_counts['year'] = year
-                monthly_data.append(monthly_counts)
-        
-        monthly_df = pd.concat(monthly_data, ignore_index=True) if monthly_data else pd.DataFrame()
-        
-        # 4. Day of week data (aggregated across all selected years)
-        # Day of week is already extracted from fecha_hecho as numeric (0=Mon, 6=Sun)
-        dow_df = selected_df[selected_df['day_of_week'].notna()].copy()
-        
-        if len(dow_df) > 0:
-            dow_counts = dow_df.groupby('day_of_week').size().reset_index()
-            dow_counts.columns = ['day', 'crimes']
-            dow_counts['day'] = dow_counts['day'].astype(int)
-            dow_counts = dow_counts.sort_values('day')
-            dow_df = dow_counts
-        else:
-            # No valid day of week data
-            dow_df = pd.DataFrame()
+        monthly_df = selected_cube.rollup('alcaldia_normalized', 'year', 'month').reset_index()
+        monthly_by_alcaldia = {
+            str(name): group[['year', 'month', 'crimes']].astype(int).to_dict('records')
+            for name, group in monthly_df.groupby('alcaldia_normalized', observed=True, sort=False)
+        }
         
-        # 5. Ranking among all alcaldías
-        all_alcaldias_df = crime_df[crime_df['anio_hecho'].isin(selected_years)]
-        ranking_df = all_alcaldias_df.groupby('alcaldia_normalized').size().reset_index()
-        ranking_df.columns = ['alcaldia', 'crimes']
-        ranking_df = ranking_df.sort_values('crimes', ascending=False).reset_index(drop=True)
-        ranking_df['rank'] = ranking_df.index + 1
+        # 4. Day of week data (aggregated across all selected years, 0=Mon, 6=Sun)
+        dow_df = selected_cube.rollup('alcaldia_normalized', 'day_of_week').reset_index()
+        dow_df = dow_df.rename(columns={'day_of_week': 'day'})
+        dow_by_alcaldia = {
+            str(name): group[['day', 'crimes']].astype(int).sort_values('day').to_dict('records')
+            for name, group in dow_df.groupby('alcaldia_normalized', observed=True, sort=False)
+        }
         
-        current_rank = ranking_df[ranking_df['alcaldia'] == alcaldia_normalized]['rank'].values
-        rank = int(current_rank[0]) if len(current_rank) > 0 else 0
-        total_alcaldias = len(ranking_df)
+        analytics = {}
+        for alcaldia_normalized in alcaldia_names:
+            population = population_data.get(alcaldia_normalized, None)
+            total_crimes = totals.get(alcaldia_normalized, 0)
+            
+            # Crimes per capita (per 1,000 people)
+            crimes_per_capita = (total_crimes / population * 1000) if population and population > 0 else None
+            
+            latest_crimes = yearly.get((alcaldia_normalized, latest_year), 0)
+            previous_crimes = yearly.get((alcaldia_normalized, latest_year - 1), 0)
+            if previous_crimes > 0:
+                yoy_change = ((latest_crimes - previous_crimes) / previous_crimes) * 100
+            else:
+                yoy_change = 0 if latest_crimes == 0 else 100
+            
+            analytics[alcaldia_normalized] = {
+                'total_crimes': total_crimes,
+                'population': int(population) if population else None,
+                'crimes_per_capita': round(crimes_per_capita, 2) if crimes_per_capita else None,
+                'yoy_change': yoy_change,
+                'latest_year': latest_year,
+                'monthly_trend': monthly_by_alcaldia.get(alcaldia_normalized, []),
+                'day_of_week': dow_by_alcaldia.get(alcaldia_normalized, []),
+                'rank': ranks.get(alcaldia_normalized, 0),
+                'total_alcaldias': len(ranks)
+            }
         
-        return {
-            'total_crimes': total_crimes,
-            'population': int(population) if population else None,
-            'crimes_per_capita': round(crimes_per_capita, 2) if crimes_per_capita else None,
-            'yoy_change': yoy_change,
-            'latest_year': latest_year,
-            'monthly_trend': monthly_df.to_dict('records'),
-            'day_of_week': dow_df.to_dict('records'),
-            'rank': rank,
-            'total_alcaldias': total_alcaldias
-        }
+        return analytics
 
     # -------------------------
     # Sidebar - Year Filter
@@ -418,6 +317,13 @@ def show():
         index=0,
         help="Elige cómo colorear el mapa: por el total de delitos o por la tasa de delitos por cada 1,000 habitantes."
     )
+    use_vector_tiles = st.sidebar.checkbox(
+        "Cargar detalle bajo demanda",
+        value=VECTOR_TILES_DEFAULT,
+        help="Sirve los cuadrantes y los puntos de delito como teselas vectoriales, y el panel de cada "
+             "alcaldía como JSON, desde un servidor local en lugar de incrustarlos en la página. "
+             "Recomendado para varios años."
+    )
 
     # -------------------------
     # Load Data
@@ -456,48 +362,34 @@ def show():
         'unknown': '#6c757d'             # Gray for unknown
     }
 
-    def categorize_crime_by_violence(delito_text):
-        """Categorize crime by violence level"""
-        if pd.isna(delito_text):
-            return 'unknown'
-        
-        delito_lower = str(delito_text).lower()
-        
-        if 'con violencia' in delito_lower:
-            return 'con_violencia'
-        elif 'sin violencia' in delito_lower:
-            return 'sin_violencia'
-        else:
-            return 'unknown'
-
-    # Categorize each crime
-    crime_points_df['violence_category'] = crime_points_df['delito'].apply(categorize_crime_by_violence)
+    # The store already classified each delito; rename to the labels the map JS expects
+    crime_points_df['violence_category'] = crime_points_df['violence_category'].cat.rename_categories(
+        MAP_VIOLENCE_LABELS
+    )
 
-    # Assign colors based on violence category
-    for _, row in crime_points_df.iterrows():
-        delito = row['delito'] if pd.notna(row['delito']) else 'Unknown'
-        violence_cat = row['violence_category']
-        crime_type_colors[delito] = VIOLENCE_COLORS[violence_cat]
+    # Assign colors based on violence category (one entry per distinct delito)
+    crime_types_df = pd.DataFrame({
+        'delito': text_column(crime_points_df['delito'], 'Unknown'),
+        'violence_category': crime_points_df['violence_category'].astype(str).tolist()
+    }).drop_duplicates('delito', keep='last')
+    for delito, violence_cat in zip(crime_types_df['delito'], crime_types_df['violence_category']):
+        crime_type_colors[delito] = VIOLENCE_COLORS.get(violence_cat, VIOLENCE_COLORS['unknown'])
         crime_violence_categories[delito] = violence_cat
 
     # Count crimes by violence category for legend
     violence_counts = crime_points_df['violence_category'].value_counts().to_dict()
 
-    # Spatial join: match crimes to cuadrantes using optimized GeoPandas
-    st.info("🔄 Performing spatial join to match crimes to cuadrantes...")
-
-    # Use optimized spatial join function
-    cuadrante_crime_data = perform_spatial_join_optimized(crime_points_df, cuadrantes_by_alcaldia)
+    # Crimes were matched to cuadrantes once when the crime store loaded
+    cuadrante_crime_data = summarize_cuadrante_crimes(crime_points_df, cuadrantes_by_alcaldia)
 
     # Update cuadrante features with crime counts and top crime types
     for alcaldia_norm, cuadrante_geojson in cuadrantes_by_alcaldia.items():
         for feature in cuadrante_geojson['features']:
             cuadrante_id = feature['properties']['id']
-            crime_count = len(cuadrante_crime_data[cuadrante_id]['crimes'])
+            crime_count = cuadrante_crime_data[cuadrante_id]['crime_count']
             
-            # Get top 5 crime types
-            crime_types = cuadrante_crime_data[cuadrante_id]['crime_types']
-            top_crimes = sorted(crime_types.items(), key=lambda x: x[1], reverse=True)[:5]
+            # Top 5 crime types, already sorted by count
+            top_crimes = cuadrante_crime_data[cuadrante_id]['crime_types'].items()
             
             feature['properties']['crime_count'] = crime_count
             feature['properties']['top_crimes'] = [
@@ -505,33 +397,63 @@ def show():
                 for crime_type, count in top_crimes
             ]
 
-    # Organize crime points by alcaldía
-    crime_points_by_alcaldia = {}
-    for alcaldia_norm in crime_points_df['alcaldia_normalized'].unique():
-        alcaldia_crimes = crime_points_df[crime_points_df['alcaldia_normalized'] == alcaldia_norm]
-        
-        features = []
-        for _, row in alcaldia_crimes.iterrows():
-            feature = {
-                'type': 'Feature',
-                'geometry': {
-                    'type': 'Point',
-                    'coordinates': [float(row['longitud']), float(row['latitud'])]
-                },
-                'properties': {
-                    'delito': str(row['delito']) if pd.notna(row['delito']) else 'Unknown',
-                    'agencia': str(row['agencia']) if pd.notna(row['agencia']) else 'N/A',
-                    'fecha': row['fecha_hecho'].strftime('%Y-%m-%d') if pd.notna(row['fecha_hecho']) else 'N/A',
-                    'color': crime_type_colors.get(row['delito'], '#999999')
-                }
-            }
-            features.append(feature)
-        
-        crime_points_by_alcaldia[alcaldia_norm] = {
-            'type': 'FeatureCollection',
-            'features': features
+    def crime_point_properties():
+        """Per-point popup properties, built column-wise (no row loop)"""
+        point_delitos = text_column(crime_points_df['delito'], 'Unknown')
+        return {
+            'delito': point_delitos,
+            'agencia': text_column(crime_points_df['agencia'], 'N/A'),
+            'fecha': date_column(crime_points_df['fecha_hecho']),
+            'color': [
+                crime_type_colors[delito] if has_delito else '#999999'
+                for delito, has_delito in zip(point_delitos, crime_points_df['delito'].notna().tolist())
+            ]
         }
 
+    cuadrante_counts = {
+        alcaldia_norm: len(cuadrante_geojson['features'])
+        for alcaldia_norm, cuadrante_geojson in cuadrantes_by_alcaldia.items()
+    }
+    point_alcaldias = sorted(str(a) for a in crime_points_df['alcaldia_normalized'].dropna().unique())
+
+    # Tile mode: register cuadrantes and points with the local tile server so the
+    # page only carries source URLs; otherwise embed them as inline GeoJSON
+    tile_server = get_tile_server() if use_vector_tiles else None
+    if use_vector_tiles and tile_server is None:
+        st.sidebar.caption("⚠️ Servidor de teselas no disponible; usando GeoJSON en la página.")
+
+    if tile_server:
+        snapshot = get_crime_store().loaded_at.strftime('%Y%m%d%H%M%S')
+        years_key = '_'.join(str(year) for year in sorted(selected_years))
+        cuadrantes_key = f"cuadrantes-{years_key}-{snapshot}"
+        points_key = f"crime-points-{years_key}-{snapshot}"
+
+        # source_spec is None when the key is new or was evicted by another session
+        cuadrantes_source = tile_server.source_spec(cuadrantes_key)
+        if cuadrantes_source is None:
+            cuadrantes_source = tile_server.register_polygons(cuadrantes_key, 'cuadrantes', [
+                {**feature, 'properties': {**feature['properties'], 'alcaldia_normalized': alcaldia_norm}}
+                for alcaldia_norm, cuadrante_geojson in cuadrantes_by_alcaldia.items()
+                for feature in cuadrante_geojson['features']
+            ])
+        points_source = tile_server.source_spec(points_key)
+        if points_source is None:
+            properties = crime_point_properties()
+            properties['alcaldia_normalized'] = text_column(crime_points_df['alcaldia_normalized'], '')
+            points_source = tile_server.register_points(
+                points_key, 'crime-points',
+                crime_points_df['longitud'], crime_points_df['latitud'], properties
+            )
+
+        tile_sources = {'cuadrantes': cuadrantes_source, 'crime-points': points_source}
+        inline_cuadrantes, crime_points_by_alcaldia = {}, {}
+    else:
+        tile_sources = None
+        inline_cuadrantes = cuadrantes_by_alcaldia
+        crime_points_by_alcaldia = point_feature_collections(
+            crime_points_df, 'alcaldia_normalized', crime_point_properties()
+        )
+
     # Calculate min/max for cuadrante coloring
     all_cuadrante_counts = []
     for cuadrante_geojson in cuadrantes_by_alcaldia.values():
@@ -541,10 +463,12 @@ def show():
     cuadrante_min = min(all_cuadrante_counts) if all_cuadrante_counts else 0
     cuadrante_max = max(all_cuadrante_counts) if all_cuadrante_counts else 0
 
-    st.success("✅ Spatial join complete!")
+    st.success("✅ Crime counts per cuadrante ready!")
 
     # Calculate crime counts and add to alcaldías
-    alcaldias_geojson, metric_ranges = calculate_crime_counts(crime_df, alcaldias_geojson, selected_years, population_data)
+    # Year dimension from anio_hecho, like the points, partitions and footer totals
+    crime_cube = get_crime_cube('anio_hecho')
+    alcaldias_geojson, metric_ranges = calculate_crime_counts(crime_cube, alcaldias_geojson, selected_years, population_data)
 
     # Determine which metric to use for map coloring
     map_metric_key = 'per_capita' if map_metric == "Crimes per Capita" else 'total'
@@ -554,12 +478,33 @@ def show():
     # -------------------------
     # Prepare Analytics Data for Panel
     # -------------------------
-    # Prepare analytics for all alcaldías
-    analytics_data = {}
-    for feature in alcaldias_geojson['features']:
-        alcaldia_norm = feature['properties']['name_normalized']
-        analytics_data[alcaldia_norm] = prepare_alcaldia_analytics(
-            crime_df, alcaldia_norm, selected_years, latest_year, population_data
+    alcaldia_names = [feature['properties']['name_normalized'] for feature in alcaldias_geojson['features']]
+
+    # Filled by the tile server's request threads; the lock makes the first
+    # request build the batch while concurrent ones wait for it
+    analytics_batch = {}
+    analytics_lock = threading.Lock()
+
+    def build_analytics(alcaldia_norm):
+        """Side panel analytics for one alcaldía (None if unknown); all alcaldías are prepared on first use"""
+        with analytics_lock:
+            if not analytics_batch:
+                analytics_batch.update(prepare_alcaldia_analytics(
+                    crime_cube, alcaldia_names, selected_years, latest_year, population_data
+                ))
+            return analytics_batch.get(alcaldia_norm)
+
+    if tile_server:
+        # On demand: the panel fetches one alcaldía's analytics when it opens
+        analytics_key = f"analytics-{years_key}-{snapshot}"
+        tile_server.register_documents(analytics_key, build_analytics)
+        analytics_url = tile_server.document_url(analytics_key)
+        analytics_data = {}
+    else:
+        # Inline: prepare analytics for all alcaldías in one pass
+        analytics_url = None
+        analytics_data = prepare_alcaldia_analytics(
+            crime_cube, alcaldia_names, selected_years, latest_year, population_data
         )
 
     # -------------------------
@@ -836,13 +781,17 @@ def show():
             // Data from Python
             const alcaldiasData = {json.dumps(alcaldias_geojson)};
             const alcaldiaBounds = {json.dumps(alcaldia_bounds)};
-            const cuadrantesData = {json.dumps(cuadrantes_by_alcaldia)};
+            const cuadrantesData = {json.dumps(inline_cuadrantes)};
             const crimePointsData = {json.dumps(crime_points_by_alcaldia)};
+            const tileSources = {json.dumps(tile_sources)};
+            const cuadranteCounts = {json.dumps(cuadrante_counts)};
+            const pointAlcaldias = {json.dumps(point_alcaldias)};
             const crimeTypeColors = {json.dumps(crime_type_colors)};
             const violenceCounts = {json.dumps(violence_counts)};
             const cuadranteMin = {cuadrante_min};
             const cuadranteMax = {cuadrante_max};
             const analyticsData = {json.dumps(analytics_data)};
+            const analyticsUrl = {json.dumps(analytics_url)};
             const mapMetric = {json.dumps(map_metric_key)};
             const minValue = {min_value};
             const maxValue = {max_value};
@@ -863,28 +812,44 @@ def show():
                 }}
             }}
             
-            // Color interpolation for cuadrantes
-            function getCuadranteColor(count) {{
+            // Color interpolation for cuadrantes, evaluated by MapLibre on each
+            // feature's crime_count (works for inline GeoJSON and vector tiles)
+            function cuadranteColorExpression() {{
                 if (cuadranteMax === cuadranteMin) return 'rgb(173, 216, 230)';
                 
-                const normalized = (count - cuadranteMin) / (cuadranteMax - cuadranteMin);
-                
-                if (normalized < 0.2) {{
-                    const t = normalized / 0.2;
-                    return `rgb(${{173 + (100-173)*t}}, ${{216 + (149-216)*t}}, ${{230 + (237-230)*t}})`;
-                }} else if (normalized < 0.4) {{
-                    const t = (normalized - 0.2) / 0.2;
-                    return `rgb(${{100 + (65-100)*t}}, ${{149 + (105-149)*t}}, ${{237 + (225-237)*t}})`;
-                }} else if (normalized < 0.6) {{
-                    const t = (normalized - 0.4) / 0.2;
-                    return `rgb(${{65 + (255-65)*t}}, ${{105 + (140-105)*t}}, ${{225 + (0-225)*t}})`;
-                }} else if (normalized < 0.8) {{
-                    const t = (normalized - 0.6) / 0.2;
-                    return `rgb(255, ${{140 + (69-140)*t}}, 0)`;
-                }} else {{
-                    const t = (normalized - 0.8) / 0.2;
-                    return `rgb(${{255 + (220-255)*t}}, ${{69 + (20-69)*t}}, ${{0 + (60-0)*t}})`;
+                const range = cuadranteMax - cuadranteMin;
+                return [
+                    'interpolate', ['linear'], ['get', 'crime_count'],
+                    cuadranteMin, 'rgb(173, 216, 230)',
+                    cuadranteMin + range * 0.2, 'rgb(100, 149, 237)',
+                    cuadranteMin + range * 0.4, 'rgb(65, 105, 225)',
+                    cuadranteMin + range * 0.6, 'rgb(255, 140, 0)',
+                    cuadranteMin + range * 0.8, 'rgb(255, 69, 0)',
+                    cuadranteMax, 'rgb(220, 20, 60)'
+                ];
+            }}
+            
+            // Source for one alcaldía's drill-down layer: its own inline GeoJSON
+            // source, or the shared vector tile source filtered to the alcaldía
+            function layerSource(kind, alcaldiaNormalized, inlineData) {{
+                if (tileSources) {{
+                    const sourceId = kind + '-tiles';
+                    if (!map.getSource(sourceId)) {{
+                        map.addSource(sourceId, tileSources[kind]);
+                    }}
+                    return {{
+                        'source': sourceId,
+                        'source-layer': kind,
+                        'filter': ['==', ['get', 'alcaldia_normalized'], alcaldiaNormalized]
+                    }};
                 }}
+                
+                const sourceId = kind + '-' + alcaldiaNormalized;
+                map.addSource(sourceId, {{
+                    'type': 'geojson',
+                    'data': inlineData[alcaldiaNormalized]
+                }});
+                return {{ 'source': sourceId }};
             }}
             
             // Color interpolation function (Blue → Red)
@@ -914,6 +879,34 @@ def show():
             
             // Side panel functions
             function openSidePanel(alcaldiaName, crimeCount, alcaldiaNormalized) {{
+                // Served on demand: fetch this alcaldía's analytics once, then render
+                if (analyticsUrl && !analyticsData[alcaldiaNormalized]) {{
+                    document.getElementById('side-panel-content').innerHTML = `
+                        <div class="panel-title">${{alcaldiaName}}</div>
+                        <div class="panel-stat">
+                            <div class="panel-stat-label">Cargando</div>
+                            <div class="panel-stat-value">...</div>
+                        </div>
+                    `;
+                    document.getElementById('side-panel').classList.add('open');
+                    document.getElementById('legend').classList.add('panel-open');
+                    
+                    fetch(analyticsUrl.replace('{{name}}', encodeURIComponent(alcaldiaNormalized)))
+                        .then(function(response) {{ return response.ok ? response.json() : null; }})
+                        .catch(function() {{ return null; }})
+                        .then(function(analytics) {{
+                            if (analytics) {{
+                                analyticsData[alcaldiaNormalized] = analytics;
+                            }}
+                            renderSidePanel(alcaldiaName, crimeCount, alcaldiaNormalized);
+                        }});
+                    return;
+                }}
+                
+                renderSidePanel(alcaldiaName, crimeCount, alcaldiaNormalized);
+            }}
+            
+            function renderSidePanel(alcaldiaName, crimeCount, alcaldiaNormalized) {{
                 const panel = document.getElementById('side-panel');
                 const legend = document.getElementById('legend');
                 const content = document.getElementById('side-panel-content');
@@ -936,8 +929,7 @@ def show():
                 }}
                 
                 // Count cuadrantes for this alcaldía
-                const cuadranteCount = cuadrantesData[alcaldiaNormalized] ? 
-                    cuadrantesData[alcaldiaNormalized].features.length : 0;
+                const cuadranteCount = cuadranteCounts[alcaldiaNormalized] || 0;
                 
                 // Format year-over-year change
                 const yoyClass = analytics.yoy_change >= 0 ? 'change-positive' : 'change-negative';
@@ -1319,41 +1311,25 @@ def show():
                 }});
                 
                 // Add cuadrantes sources and layers (initially hidden)
-                Object.keys(cuadrantesData).forEach(function(alcaldiaNormalized) {{
-                    const sourceId = 'cuadrantes-' + alcaldiaNormalized;
+                Object.keys(cuadranteCounts).forEach(function(alcaldiaNormalized) {{
+                    const layerId = 'cuadrantes-' + alcaldiaNormalized;
+                    const source = layerSource('cuadrantes', alcaldiaNormalized, cuadrantesData);
                     
-                    map.addSource(sourceId, {{
-                        'type': 'geojson',
-                        'data': cuadrantesData[alcaldiaNormalized]
-                    }});
-                    
-                    // Create color expression for cuadrantes based on crime count
-                    const cuadranteColorExpression = ['case'];
-                    cuadrantesData[alcaldiaNormalized].features.forEach(function(feature) {{
-                        const count = feature.properties.crime_count;
-                        const color = getCuadranteColor(count);
-                        cuadranteColorExpression.push(['==', ['get', 'no_cuadran'], feature.properties.no_cuadran]);
-                        cuadranteColorExpression.push(color);
-                    }});
-                    cuadranteColorExpression.push('rgb(173, 216, 230)'); // fallback
-                    
-                    map.addLayer({{
-                        'id': sourceId + '-fill',
+                    map.addLayer(Object.assign({{
+                        'id': layerId + '-fill',
                         'type': 'fill',
-                        'source': sourceId,
                         'paint': {{
-                            'fill-color': cuadranteColorExpression,
+                            'fill-color': cuadranteColorExpression(),
                             'fill-opacity': 0.6
                         }},
                         'layout': {{
                             'visibility': 'none'
                         }}
-                    }});
+                    }}, source));
                     
-                    map.addLayer({{
-                        'id': sourceId + '-outline',
+                    map.addLayer(Object.assign({{
+                        'id': layerId + '-outline',
                         'type': 'line',
-                        'source': sourceId,
                         'paint': {{
                             'line-color': 'darkblue',
                             'line-width': 1.5
@@ -1361,22 +1337,17 @@ def show():
                         'layout': {{
                             'visibility': 'none'
                         }}
-                    }});
+                    }}, source));
                 }});
                 
                 // Add crime points sources and layers (initially hidden)
-                Object.keys(crimePointsData).forEach(function(alcaldiaNormalized) {{
-                    const sourceId = 'crime-points-' + alcaldiaNormalized;
-                    
-                    map.addSource(sourceId, {{
-                        'type': 'geojson',
-                        'data': crimePointsData[alcaldiaNormalized]
-                    }});
+                pointAlcaldias.forEach(function(alcaldiaNormalized) {{
+                    const layerId = 'crime-points-' + alcaldiaNormalized;
+                    const source = layerSource('crime-points', alcaldiaNormalized, crimePointsData);
                     
-                    map.addLayer({{
-                        'id': sourceId,
+                    map.addLayer(Object.assign({{
+                        'id': layerId,
                         'type': 'circle',
-                        'source': sourceId,
                         'paint': {{
                             'circle-radius': 4,
                             'circle-color': ['get', 'color'],
@@ -1387,7 +1358,7 @@ def show():
                         'layout': {{
                             'visibility': 'none'
                         }}
-                    }});
+                    }}, source));
                 }});
                 
                 // Add hover effect for alcaldías
@@ -1473,7 +1444,7 @@ def show():
                 }});
                 
                 // Add hover tooltips and click handlers for cuadrantes
-                Object.keys(cuadrantesData).forEach(function(alcaldiaNormalized) {{
+                Object.keys(cuadranteCounts).forEach(function(alcaldiaNormalized) {{
                     const layerId = 'cuadrantes-' + alcaldiaNormalized + '-fill';
                     
                     map.on('mouseenter', layerId, function(e) {{
@@ -1535,7 +1506,7 @@ def show():
                 }});
                 
                 // Add hover and click handlers for crime points
-                Object.keys(crimePointsData).forEach(function(alcaldiaNormalized) {{
+                pointAlcaldias.forEach(function(alcaldiaNormalized) {{
                     const layerId = 'crime-points-' + alcaldiaNormalized;
                     
                     map.on('mouseenter', layerId, function() {{
@@ -1651,7 +1622,7 @@ def show():
                 map.setFilter('alcaldias-outline', null);
                 
                 // Hide all cuadrantes layers and crime points
-                Object.keys(cuadrantesData).forEach(function(alcaldiaNormalized) {{
+                Object.keys(cuadranteCounts).forEach(function(alcaldiaNormalized) {{
                     const sourceId = 'cuadrantes-' + alcaldiaNormalized;
                     if (map.getLayer(sourceId + '-fill')) {{
                         map.setLayoutProperty(sourceId + '-fill', 'visibility', 'none');
@@ -1716,7 +1687,8 @@ def show():
     # -------------------------
     total_alcaldias = len(alcaldias_geojson['features'])
     total_cuadrantes = sum(len(geojson['features']) for geojson in cuadrantes_by_alcaldia.values())
-    total_crimes = len(crime_df[crime_df['anio_hecho'].isin(selected_years)])
+    selected_query = crime_query().years(selected_years, column='anio_hecho')
+    total_crimes = selected_query.count()
 
     col1, col2, col3 = st.columns(3)
     col1.metric("Total Alcaldías", total_alcaldias)
@@ -1725,6 +1697,12 @@ def show():
 
     # Show top 5 alcaldías by crime
     st.subheader("📊 Top 5 Alcaldías por conteo de crimen")
-    selected_crime_df = crime_df[crime_df['anio_hecho'].isin(selected_years)]
-    crime_by_alcaldia = selected_crime_df.groupby('alcaldia_hecho').size().sort_values(ascending=False).head(5)
+    crime_by_alcaldia = (
+        selected_query.group_by('alcaldia_hecho')
+        .dropna(subset=['alcaldia_hecho'])
+        .astype({'alcaldia_hecho': str})
+        .set_index('alcaldia_hecho')['crimes']
+        .sort_values(ascending=False)
+        .head(5)
+    )
     st.bar_chart(crime_by_alcaldia)
\ No newline at end of file
@@ -4,12 +4,18 @@ import numpy as np
 from datetime import datetime, timedelta
 from supabase import create_client
 import folium
-from streamlit_folium import st_folium
+import streamlit.components.v1 as components
 import plotly.graph_objects as go
 import json
 import os
-import requests
+import threading
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from utils.alcaldia_names import normalize_alcaldia_name, normalize_alcaldia_series
+from utils.cuadrantes import load_cuadrantes_table
+from utils.geometry_tiers import simplify_feature_collection, simplify_geometry
+from utils.supabase_fetcher import MAX_WORKERS, fetch_key_range, get_key_bounds
+from utils.n8n_client import N8N_WEBHOOK_URL, get_chat_client
 
 # ===============================
 # Configuration
@@ -17,8 +23,13 @@ import uuid
 SUPABASE_URL = "https://xzeycsqwynjxnzgctydr.supabase.co"
 SUPABASE_KEY = "sb_publishable_wSTGdAAY_IIuYKNpr6N6GA_rGZy-y29"
 
-# N8N Chatbot Configuration
-N8N_WEBHOOK_URL = "https://thebuttoncdmx.app.n8n.cloud/webhook/thaleschat"
+# Predictions table: only the columns the page uses
+PREDICTIONS_TABLE = "CrimePredictions"
+PREDICTION_COLUMNS = ['Cuadrante', 'Fecha', 'Turno', 'HOLIDAY', 'PAY_DAY', 'Crímenes Predichos']
+PREDICTION_SELECT = ", ".join(f'"{column}"' for column in PREDICTION_COLUMNS)
+
+# N8N Chatbot Configuration (webhook URL overridable with N8N_WEBHOOK_URL)
+CHAT_POLL_SECONDS = 1.0
 
 # McKinsey Color Palette (matching rest of app)
 MCKINSEY_COLORS = {
@@ -177,53 +188,6 @@ def get_risk_label(crimes):
         return 'Variable'
 
 
-def normalize_alcaldia_name(name):
-    """Normalize alcaldía name for matching between geojson and database"""
-    # The alcaldias.json uses proper capitalization like "Álvaro Obregón"
-    # The cuadrantes table uses uppercase like "ALVARO OBREGON"
-    
-    name_upper = name.upper()
-    
-    # Remove accents for matching
-    replacements = {
-        'Á': 'A', 'É': 'E', 'Í': 'I', 'Ó': 'O', 'Ú': 'U',
-        'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u'
-    }
-    
-    normalized = name_upper
-    for old, new in replacements.items():
-        normalized = normalized.replace(old, new)
-    
-    # Remove periods
-    normalized = normalized.replace('.', '')
-    
-    # Handle special cases for matching
-    # Map alcaldias.json names to database format
-    special_mappings = {
-        'GUSTAVO A MADERO': 'GUSTAVO A MADERO',
-        'CUAJIMALPA DE MORELOS': 'CUAJIMALPA',
-        'LA MAGDALENA CONTRERAS': 'MAGDALENA CONTRERAS',
-        'ALVARO OBREGON': 'ALVARO OBREGON',
-        'BENITO JUAREZ': 'BENITO JUAREZ',
-        'MIGUEL HIDALGO': 'MIGUEL HIDALGO',
-        'VENUSTIANO CARRANZA': 'VENUSTIANO CARRANZA',
-        'AZCAPOTZALCO': 'AZCAPOTZALCO',
-        'COYOACAN': 'COYOACAN',
-        'CUAUHTEMOC': 'CUAUHTEMOC',
-        'IZTACALCO': 'IZTACALCO',
-        'IZTAPALAPA': 'IZTAPALAPA',
-        'MILPA ALTA': 'MILPA ALTA',
-        'TLAHUAC': 'TLAHUAC',
-        'TLALPAN': 'TLALPAN',
-        'XOCHIMILCO': 'XOCHIMILCO'
-    }
-    
-    normalized = normalized.strip()
-    
-    # Return mapped version if exists
-    return special_mappings.get(normalized, normalized)
-
-
 # ===============================
 # Data Loading Functions
 # ===============================
@@ -239,7 +203,7 @@ def load_alcaldias_geojson():
         with open(alcaldias_path, 'r', encoding='utf-8') as f:
             alcaldias_data = json.load(f)
         
-        return alcaldias_data
+        return simplify_feature_collection(alcaldias_data, 'city')
     
     except FileNotFoundError:
         st.error("❌ No se encontró el archivo alcaldias.json")
@@ -249,30 +213,95 @@ def load_alcaldias_geojson():
         return None
 
 
+@st.cache_resource
+def get_predictions_client():
+    """One Supabase client for every predictions query in this process"""
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+class PredictionPartitions:
+    """Prediction frames of one forecast window fetched so far, keyed by (Fecha, Turno); shared by all sessions"""
+    
+    def __init__(self):
+        self._frames = {}
+        self._lock = threading.Lock()
+    
+    def load(self, keys, fetch):
+        """Frames for `keys`, calling `fetch(missing_keys)` only for partitions not held yet"""
+        with self._lock:
+            missing = [key for key in keys if key not in self._frames]
+        if missing:
+            fetched = fetch(missing)
+            with self._lock:
+                for key, frame in zip(missing, fetched):
+                    self._frames.setdefault(key, frame)
+        with self._lock:
+            return [self._frames[key] for key in keys]
+
+
+@st.cache_resource(ttl=3600)
+def get_prediction_partitions(first_date):
+    """Partition store for the forecast window starting on `first_date` (a new window starts empty)"""
+    return PredictionPartitions()
+
+
 @st.cache_data(ttl=3600)
-def load_predictions():
-    """Load crime predictions from Supabase"""
+def load_first_prediction_date():
+    """First Fecha in CrimePredictions (day 1 of the forecast window), or None if the table is empty"""
+    first, _ = get_key_bounds(get_predictions_client(), PREDICTIONS_TABLE, key='Fecha')
+    return pd.Timestamp(first).normalize() if first else None
+
+
+def fetch_prediction_partition(client, fecha, turno):
+    """Fetch the projected rows of one (Fecha, Turno) partition, paging past the row limit"""
+    next_day = (fecha + timedelta(days=1)).strftime('%Y-%m-%d')
+    rows = fetch_key_range(
+        client, PREDICTIONS_TABLE, PREDICTION_SELECT, 'Fecha',
+        fecha.strftime('%Y-%m-%d'), next_day, filters={'Turno': turno},
+        tiebreaker=('Cuadrante',)  # one row per cuadrante within a (Fecha, Turno) partition
+    )
+    df = pd.DataFrame(rows, columns=PREDICTION_COLUMNS)
+    
+    # Convert date column
+    df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
+    
+    # Ensure numeric types
+    df['Cuadrante'] = df['Cuadrante'].astype(str)
+    df['Crímenes Predichos'] = pd.to_numeric(df['Crímenes Predichos'], errors='coerce')
+    df['HOLIDAY'] = pd.to_numeric(df['HOLIDAY'], errors='coerce')
+    df['PAY_DAY'] = pd.to_numeric(df['PAY_DAY'], errors='coerce')
+    
+    return df
+
+
+def load_predictions(days_ahead, turnos):
+    """
+    Load the predictions of the first `days_ahead` days for the selected turnos.
+    
+    Only (Fecha, Turno) partitions not fetched yet are queried, in parallel,
+    so widening the window or adding a turno downloads just the new slices.
+    """
+    if not turnos:
+        return pd.DataFrame()
+    
     try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        
-        # Query predictions table
-        response = supabase.table("CrimePredictions").select("*").execute()
-        
-        df = pd.DataFrame(response.data)
-        
-        if df.empty:
+        first_date = load_first_prediction_date()
+        if first_date is None:
             return pd.DataFrame()
         
-        # Convert date column
-        df['Fecha'] = pd.to_datetime(df['Fecha'], errors='coerce')
+        keys = [
+            (first_date + timedelta(days=offset), turno)
+            for offset in range(days_ahead)
+            for turno in turnos
+        ]
         
-        # Ensure numeric types
-        df['Cuadrante'] = df['Cuadrante'].astype(str)
-        df['Crímenes Predichos'] = pd.to_numeric(df['Crímenes Predichos'], errors='coerce')
-        df['HOLIDAY'] = pd.to_numeric(df['HOLIDAY'], errors='coerce')
-        df['PAY_DAY'] = pd.to_numeric(df['PAY_DAY'], errors='coerce')
+        def fetch(missing):
+            client = get_predictions_client()
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+                return list(pool.map(lambda key: fetch_prediction_partition(client, *key), missing))
         
-        return df
+        frames = get_prediction_partitions(first_date).load(keys, fetch)
+        return pd.concat(frames, ignore_index=True)
     
     except Exception as e:
         st.error(f"❌ Error al cargar predicciones: {e}")
@@ -283,14 +312,10 @@ def load_predictions():
 def load_cuadrantes_geojson():
     """Load cuadrantes geographic data from Supabase"""
     try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-        
-        # Query cuadrantes table
-        response = supabase.table("cuadrantes").select("*").execute()
+        # Shared loader: geo_shape already parsed (JSON first, WKB disk cache)
+        cuadrantes_df = load_cuadrantes_table()
         
-        cuadrantes_data = response.data
-        
-        if not cuadrantes_data:
+        if cuadrantes_df.empty:
             st.error("❌ No se encontraron datos en la tabla cuadrantes")
             return None
         
@@ -298,31 +323,10 @@ def load_cuadrantes_geojson():
         features = []
         invalid_count = 0
         
-        for item in cuadrantes_data:
+        for item in cuadrantes_df[['id', 'alcaldia', 'geo_shape']].to_dict('records'):
             try:
-                # Get geometry from geo_shape field (the correct field name in your DB)
                 geometry = item.get('geo_shape')
                 
-                if not geometry:
-                    invalid_count += 1
-                    continue
-                
-                # Parse geometry if it's a string (handle multiple formats)
-                if isinstance(geometry, str):
-                    # Remove any extra whitespace
-                    geometry = geometry.strip()
-                    
-                    # Try to parse as JSON
-                    try:
-                        geometry = json.loads(geometry)
-                    except json.JSONDecodeError:
-                        # If that fails, try replacing single quotes with double quotes
-                        try:
-                            geometry = json.loads(geometry.replace("'", '"'))
-                        except json.JSONDecodeError:
-                            invalid_count += 1
-                            continue
-                
                 # Validate geometry has required fields
                 if not isinstance(geometry, dict):
                     invalid_count += 1
@@ -344,7 +348,7 @@ def load_cuadrantes_geojson():
                         "name": f"Cuadrante {item.get('id', '')}",
                         "alcaldia": str(item.get('alcaldia', '')).strip().upper()  # Normalize
                     },
-                    "geometry": geometry
+                    "geometry": simplify_geometry(geometry, 'detail')
                 }
                 features.append(feature)
                 
@@ -369,59 +373,145 @@ def load_cuadrantes_geojson():
         return None
 
 
-@st.cache_data(ttl=3600)
-def get_alcaldia_cuadrantes(_geojson, alcaldia):
+class CuadranteLookup:
+    """Cuadrante → alcaldía table with per-alcaldía feature slices"""
+    
+    def __init__(self, geojson):
+        self.features = geojson['features']
+        self.by_alcaldia = {}
+        alcaldia_of = {}
+        
+        for feature in self.features:
+            properties = feature['properties']
+            alcaldia = properties.get('alcaldia', '').upper().strip()
+            alcaldia_of[str(properties['id'])] = alcaldia
+            self.by_alcaldia.setdefault(alcaldia, []).append(feature)
+        
+        # Series for vectorized .map() over the predictions frame
+        self.alcaldia_of = pd.Series(alcaldia_of, dtype=object)
+        self.alcaldias = set(self.by_alcaldia)
+        self.cuadrantes = {
+            alcaldia: [str(feature['properties']['id']) for feature in features]
+            for alcaldia, features in self.by_alcaldia.items()
+        }
+        self.collections = {
+            alcaldia: {"type": "FeatureCollection", "features": features}
+            for alcaldia, features in self.by_alcaldia.items()
+        }
+
+
+@st.cache_resource(ttl=3600, show_spinner=False)
+def load_cuadrantes_lookup():
+    """Build the cuadrante lookup once per cuadrantes refresh (None if the cuadrantes failed to load)"""
+    geojson = load_cuadrantes_geojson()
+    if not geojson:
+        return None
+    return CuadranteLookup(geojson)
+
+
+def get_alcaldia_cuadrantes(alcaldia):
     """Get list of cuadrante IDs for a given alcaldía"""
-    if _geojson is None:
+    lookup = load_cuadrantes_lookup()
+    if lookup is None:
         return []
     
     # Normalize alcaldía name for database lookup
     alcaldia_db = normalize_alcaldia_for_db(alcaldia)
-    
-    cuadrantes = []
-    alcaldias_found = set()  # Track what alcaldías we find
-    
-    for feature in _geojson['features']:
-        feature_alcaldia = feature['properties'].get('alcaldia', '').upper().strip()
-        alcaldias_found.add(feature_alcaldia)
-        
-        if feature_alcaldia == alcaldia_db:
-            cuadrantes.append(str(feature['properties']['id']))
+    cuadrantes = lookup.cuadrantes.get(alcaldia_db, [])
     
     # Debug: Show what alcaldías exist in geojson
     if not cuadrantes:
-        st.warning(f"⚠️ No se encontraron cuadrantes para '{alcaldia_db}'. Alcaldías en geojson: {sorted(alcaldias_found)[:10]}")
+        st.warning(f"⚠️ No se encontraron cuadrantes para '{alcaldia_db}'. Alcaldías en geojson: {sorted(lookup.alcaldias)[:10]}")
     
     return cuadrantes
 
 
-@st.cache_data(ttl=3600)
-def filter_geojson_by_alcaldia(_geojson, alcaldia):
+def filter_geojson_by_alcaldia(alcaldia):
     """Filter geojson to only include features from selected alcaldía"""
-    if _geojson is None:
+    lookup = load_cuadrantes_lookup()
+    if lookup is None:
         return None
     
     # Normalize alcaldía name for database lookup
     alcaldia_db = normalize_alcaldia_for_db(alcaldia)
+    return lookup.collections.get(alcaldia_db, {"type": "FeatureCollection", "features": []})
+
+
+# ===============================
+# Map Creation Function
+# ===============================
+
+RISK_LABELS = {
+    'very_high': 'Muy Alto',
+    'high': 'Alto',
+    'medium': 'Medio',
+    'low': 'Bajo',
+    'zero': 'Sin Predicciones'
+}
+
+
+def build_alcaldia_choropleth(alcaldia_summary, alcaldias_geojson, days_ahead):
+    """FeatureCollection of the alcaldías with crimes, risk level, label and color as properties"""
+    thresholds = get_dynamic_risk_thresholds(days_ahead)
     
-    filtered_features = []
-    for feature in _geojson['features']:
-        feature_alcaldia = feature['properties'].get('alcaldia', '').upper().strip()
-        if feature_alcaldia == alcaldia_db:
-            filtered_features.append(feature)
+    # Create crime dictionary for quick lookup
+    # Normalize alcaldía names for matching
+    crime_dict = dict(zip(
+        normalize_alcaldia_series(alcaldia_summary['Alcaldía']),
+        alcaldia_summary['Total_Crimes']
+    ))
+    
+    features = [
+        feature for feature in alcaldias_geojson['features']
+        if feature.get('geometry') and feature.get('properties', {}).get('NOMGEO')
+    ]
+    names = [feature['properties']['NOMGEO'] for feature in features]
+    crimes = np.array([crime_dict.get(normalize_alcaldia_name(name), 0) for name in names], dtype=float)
+    
+    # Risk level of every alcaldía at once (same cut points as get_risk_level)
+    levels = np.select(
+        [
+            crimes == 0,
+            crimes >= thresholds['very_high'],
+            crimes >= thresholds['high'],
+            crimes >= thresholds['medium']
+        ],
+        ['zero', 'very_high', 'high', 'medium'],
+        default='low'
+    )
+    period = f"{days_ahead} día{'s' if days_ahead > 1 else ''}"
     
     return {
-        "type": "FeatureCollection",
-        "features": filtered_features
+        'type': 'FeatureCollection',
+        'features': [
+            {
+                'type': 'Feature',
+                'geometry': feature['geometry'],
+                'properties': {
+                    'NOMGEO': name,
+                    'crimes': int(count),
+                    'risk_level': level,
+                    'risk_label': RISK_LABELS[level],
+                    'fill_color': RISK_COLORS[level],
+                    'period': period
+                }
+            }
+            for feature, name, count, level in zip(features, names, crimes, levels)
+        ]
     }
 
 
-# ===============================
-# Map Creation Function
-# ===============================
+def summary_fingerprint(alcaldia_summary):
+    """Hashable snapshot of the alcaldía totals a choropleth is built from"""
+    return tuple(alcaldia_summary[['Alcaldía', 'Total_Crimes']].itertuples(index=False, name=None))
+
 
-def create_alcaldia_map(alcaldia_summary, alcaldias_geojson, days_ahead):
-    """Create Folium map showing all alcaldías colored by crime predictions"""
+def create_alcaldia_map(days_ahead, alcaldia_summary, alcaldias_geojson):
+    """
+    Create Folium map showing all alcaldías colored by crime predictions.
+    
+    One GeoJson layer styled from feature properties.
+    """
     
     if alcaldias_geojson is None or 'features' not in alcaldias_geojson:
         return None
@@ -437,111 +527,81 @@ def create_alcaldia_map(alcaldia_summary, alcaldias_geojson, days_ahead):
         dragging=True
     )
     
-    # Get dynamic thresholds based on days selected
-    thresholds = get_dynamic_risk_thresholds(days_ahead)
-    
-    # Create crime dictionary for quick lookup
-    # Normalize alcaldía names for matching
-    crime_dict = {}
-    for _, row in alcaldia_summary.iterrows():
-        normalized_name = normalize_alcaldia_name(row['Alcaldía'])
-        crime_dict[normalized_name] = row['Total_Crimes']
+    choropleth = build_alcaldia_choropleth(alcaldia_summary, alcaldias_geojson, days_ahead)
+    fields = ['NOMGEO', 'crimes', 'risk_label', 'period']
+    aliases = ['Alcaldía', 'Delitos Predichos', 'Nivel de Riesgo', 'Periodo']
     
     # Add choropleth layer
-    for feature in alcaldias_geojson['features']:
-        try:
-            alcaldia_name = feature['properties']['NOMGEO']
-            normalized_name = normalize_alcaldia_name(alcaldia_name)
-            
-            crime_count = crime_dict.get(normalized_name, 0)
-            
-            # Determine color using dynamic thresholds
-            fill_color = get_risk_color(crime_count, thresholds)
-            
-            # Get risk level label
-            risk_level = get_risk_level(crime_count, thresholds)
-            risk_labels = {
-                'very_high': 'Muy Alto',
-                'high': 'Alto',
-                'medium': 'Medio',
-                'low': 'Bajo',
-                'zero': 'Sin Predicciones'
-            }
-            risk_label = risk_labels.get(risk_level, 'N/A')
-            
-            # Create popup text
-            popup_text = f"""
-            <div style='font-family: Inter, sans-serif; padding: 8px;'>
-                <b>{alcaldia_name}</b><br>
-                Delitos Predichos: <b>{int(crime_count)}</b><br>
-                Nivel de Riesgo: <b>{risk_label}</b><br>
-                <small>({days_ahead} día{'s' if days_ahead > 1 else ''})</small>
-            </div>
-            """
-            
-            # Add GeoJson feature
-            folium.GeoJson(
-                feature,
-                style_function=lambda x, fc=fill_color: {
-                    'fillColor': fc,
-                    'color': '#333333',
-                    'weight': 2,
-                    'fillOpacity': 0.7,
-                    'opacity': 1
-                },
-                tooltip=folium.Tooltip(popup_text),
-                popup=folium.Popup(popup_text, max_width=250)
-            ).add_to(m)
-            
-        except Exception as e:
-            # Skip invalid features
-            continue
+    folium.GeoJson(
+        choropleth,
+        name='Alcaldías',
+        style_function=lambda feature: {
+            'fillColor': feature['properties']['fill_color'],
+            'color': '#333333',
+            'weight': 2,
+            'fillOpacity': 0.7,
+            'opacity': 1
+        },
+        tooltip=folium.GeoJsonTooltip(fields=fields, aliases=aliases, localize=True),
+        popup=folium.GeoJsonPopup(fields=fields, aliases=aliases, localize=True, max_width=250)
+    ).add_to(m)
     
     return m
 
 
+@st.cache_data(ttl=3600, max_entries=64, show_spinner=False)
+def render_alcaldia_map(days_ahead, turnos, summary_key, _alcaldia_summary, _alcaldias_geojson):
+    """
+    Rendered HTML of the alcaldía map, cached by (days_ahead, turnos) so
+    reruns from other widgets skip building and serializing the Map.
+    `summary_key` (summary_fingerprint) keeps a data refresh from serving a stale map.
+    """
+    crime_map = create_alcaldia_map(days_ahead, _alcaldia_summary, _alcaldias_geojson)
+    return crime_map.get_root().render() if crime_map else None
+
+
 # ===============================
 # Chatbot Functions
 # ===============================
 
-def send_prompt_to_n8n(prompt: str):
-    """Send prompt to n8n webhook"""
-    try:
-        session_id = uuid.uuid4().hex  # Generate unique sessionId
-        
-        payload = {
-            "prompt": prompt,
-            "sessionId": session_id
-        }
-        
-        response = requests.post(
-            N8N_WEBHOOK_URL,
-            json=payload,
-            timeout=120
-        )
-        response.raise_for_status()
-        
-        # Try to parse JSON
-        try:
-            result = response.json()
-        except:
-            result = {"output": response.text}
-        
-        if "output" not in result:
-            result = {"output": result}
-        
-        result["sessionId_enviado"] = session_id
-        return result
+def get_chat_session_id():
+    """Stable sessionId for this browser session, so n8n keeps the conversation memory"""
+    if 'chat_session_id' not in st.session_state:
+        st.session_state.chat_session_id = uuid.uuid4().hex
+    return st.session_state.chat_session_id
+
+
+def _chat_fragment(func):
+    """Rerun `func` on its own every CHAT_POLL_SECONDS (st.fragment, Streamlit >= 1.37)"""
+    fragment = getattr(st, 'fragment', None)
+    return fragment(run_every=CHAT_POLL_SECONDS)(func) if fragment else func
+
+
+@_chat_fragment
+def render_pending_answer():
+    """Show the answer streaming in for the pending prompt; move it to the history once complete"""
+    job = st.session_state.get('chat_job')
+    if job is None:
+        return
+    
+    placeholder = st.empty()
+    if getattr(st, 'fragment', None) is None:
+        # No fragments: stream into the placeholder until the answer is complete
+        while not job.done.wait(CHAT_POLL_SECONDS):
+            placeholder.markdown(f"**👤 {job.prompt}**\n\n🤖 {job.text or '⏳ Pensando...'}")
+    
+    if job.done.is_set():
+        st.session_state.chat_history.append({
+            'question': job.prompt,
+            'answer': job.result["output"],
+            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        })
+        st.session_state.chat_job = None
         
-    except requests.exceptions.Timeout:
-        return {"output": "⏱️ Error: La solicitud tardó demasiado tiempo. Por favor intenta de nuevo."}
-    except requests.exceptions.ConnectionError:
-        return {"output": "🔌 Error: No se pudo conectar con el servidor. Verifica tu conexión a internet."}
-    except requests.exceptions.RequestException as e:
-        return {"output": f"❌ Error de red: {str(e)}"}
-    except Exception as e:
-        return {"output": f"❌ Error inesperado: {str(e)}"}
-        return {"output": f"❌ Error inesperado: {str(e)}"}
+        # Rerun to show updated history
+        st.rerun()
+    else:
+        placeholder.markdown(f"**👤 {job.prompt}**\n\n🤖 {job.text or '⏳ Pensando...'}")
 
 
 # ===============================
@@ -762,20 +822,6 @@ def show():
     # LOAD DATA
     # ===============================
     
-    with st.spinner("⏳ Cargando datos de predicciones..."):
-        predictions_df = load_predictions()
-        cuadrantes_geojson = load_cuadrantes_geojson()
-        alcaldias_geojson = load_alcaldias_geojson()
-    
-    # Check if data loaded successfully
-    if predictions_df.empty:
-        st.error("❌ No se encontraron predicciones en la base de datos")
-        st.stop()
-    
-    if alcaldias_geojson is None:
-        st.error("❌ No se pudo cargar el mapa de alcaldías")
-        st.stop()
-    
     # ===============================
     # FILTERS SECTION (HIDDEN - Using map sidebar instead)
     # ===============================
@@ -786,10 +832,6 @@ def show():
     if 'days_ahead' not in st.session_state:
         st.session_state.days_ahead = 5
     
-    # ===============================
-    # FILTER DATA AND AGGREGATE BY ALCALDÍA
-    # ===============================
-    
     # Get filter values from session state (will be updated by map sidebar)
     selected_turnos = st.session_state.selected_turnos
     days_ahead = st.session_state.days_ahead
@@ -797,32 +839,34 @@ def show():
     # Convert turno names to Spanish for display (define early for use in chatbot)
     spanish_turnos = [TURNO_LABELS[t] for t in selected_turnos]
     
-    # Filter by turno
-    filtered_df = predictions_df[predictions_df['Turno'].isin(selected_turnos)].copy()
+    # ===============================
+    # LOAD DATA (date window and turnos pushed down to the query)
+    # ===============================
     
-    # Filter by days ahead
-    if not filtered_df.empty:
-        today = filtered_df['Fecha'].min()
-        max_date = today + timedelta(days=days_ahead - 1)
-        filtered_df = filtered_df[filtered_df['Fecha'] <= max_date]
+    with st.spinner("⏳ Cargando datos de predicciones..."):
+        filtered_df = load_predictions(days_ahead, tuple(selected_turnos))
+        cuadrante_lookup = load_cuadrantes_lookup()
+        alcaldias_geojson = load_alcaldias_geojson()
     
+    # Check if data loaded successfully
     if filtered_df.empty:
-        st.warning("⚠️ No hay predicciones disponibles con los filtros seleccionados")
+        if selected_turnos:
+            st.error("❌ No se encontraron predicciones en la base de datos")
+        else:
+            st.warning("⚠️ No hay predicciones disponibles con los filtros seleccionados")
         st.stop()
     
-    # Map cuadrantes to alcaldías
-    cuadrante_to_alcaldia = {}
-    alcaldias_in_db = set()
-    
-    if cuadrantes_geojson:
-        for feature in cuadrantes_geojson['features']:
-            cuadrante_id = str(feature['properties']['id'])
-            alcaldia_name = feature['properties'].get('alcaldia', '').strip().upper()
-            cuadrante_to_alcaldia[cuadrante_id] = alcaldia_name
-            alcaldias_in_db.add(alcaldia_name)
+    if alcaldias_geojson is None:
+        st.error("❌ No se pudo cargar el mapa de alcaldías")
+        st.stop()
     
-    # Add alcaldía column to predictions
-    filtered_df['Alcaldía_DB'] = filtered_df['Cuadrante'].map(cuadrante_to_alcaldia)
+    # Map cuadrantes to alcaldías (precomputed lookup, built once per cuadrantes refresh)
+    if cuadrante_lookup is not None:
+        alcaldias_in_db = cuadrante_lookup.alcaldias
+        filtered_df['Alcaldía_DB'] = filtered_df['Cuadrante'].map(cuadrante_lookup.alcaldia_of)
+    else:
+        alcaldias_in_db = set()
+        filtered_df['Alcaldía_DB'] = None
     
     # Remove rows without alcaldía mapping
     filtered_df = filtered_df[filtered_df['Alcaldía_DB'].notna()]
@@ -970,19 +1014,16 @@ def show():
     
     with map_col1:
         # Create and display alcaldía map
-        crime_map = create_alcaldia_map(alcaldia_summary, alcaldias_geojson, days_ahead)
+        map_html = render_alcaldia_map(
+            days_ahead, tuple(selected_turnos), summary_fingerprint(alcaldia_summary),
+            alcaldia_summary, alcaldias_geojson
+        )
         
-        if crime_map:
+        if map_html:
             st.markdown('<div class="map-container">', unsafe_allow_html=True)
             
-            # Display map
-            st_folium(
-                crime_map,
-                width=None,
-                height=650,
-                key="alcaldia_map",
-                returned_objects=[]
-            )
+            # Display map (no map events are read back, so plain HTML is enough)
+            components.html(map_html, height=650)
             
             st.markdown('</div>', unsafe_allow_html=True)
         else:
@@ -1043,20 +1084,17 @@ def show():
         if send_button:
             if not user_prompt.strip():
                 st.warning("⚠ Escribe una pregunta antes de enviar.")
+            elif st.session_state.get('chat_job') is not None:
+                st.info("⏳ Espera a que termine la respuesta anterior.")
             else:
-                # Send to n8n - simple and clean, just like original code
-                with st.spinner("⏳ Pensando..."):
-                    result = send_prompt_to_n8n(user_prompt)
-                
-                # Add to history
-                st.session_state.chat_history.append({
-                    'question': user_prompt,
-                    'answer': result["output"],
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                })
-                
-                # Rerun to show updated history
-                st.rerun()
+                # Post in the background; the rest of the page stays interactive
+                st.session_state.chat_job = get_chat_client(N8N_WEBHOOK_URL).submit(
+                    user_prompt, get_chat_session_id()
+                )
+        
+        # Answer in progress (polled without blocking the other widgets)
+        if st.session_state.get('chat_job') is not None:
+            render_pending_answer()
     
     # ===============================
     # MODEL PERFORMANCE SECTION
@@ -0,0 +1,97 @@
+-- ===============================
+-- crime_aggregates.sql - Server-side aggregation functions for the FGJ table
+-- ===============================
+-- Called through the Supabase RPC interface by utils/crime_aggregates.py, so
+-- pages that only show counts receive a few kilobytes of JSON instead of
+-- downloading raw rows. Both functions return a single jsonb value, which
+-- keeps responses clear of the PostgREST row limit.
+--
+-- Calendar parts follow utils/crime_store.py (day_of_week 0=Monday, hour
+-- 24 -> 0). Violence categories are not defined here: the caller passes
+-- utils/violence.VIOLENCE_RULES as `violence_rules` ([[substring, category],
+-- ...], first match wins), and each distinct delito is classified once.
+-- Alcaldía names are returned raw and normalized in Python.
+--
+-- Apply once in the Supabase SQL editor, or:
+--     psql "$DATABASE_URL" -f sql/crime_aggregates.sql
+
+-- Landing page summary: row count, latest date and distinct raw alcaldías
+create or replace function public.crime_summary()
+returns jsonb
+language sql
+stable
+as $$
+    select jsonb_build_object(
+        'total_crimes', count(*),
+        'most_recent_date', max(fecha_hecho),
+        'alcaldias', coalesce(
+            jsonb_agg(distinct alcaldia_hecho) filter (where alcaldia_hecho is not null),
+            '[]'::jsonb
+        )
+    )
+    from public."FGJ";
+$$;
+
+-- Crime counts grouped by any subset of
+--     alcaldia, year, month, day_of_week, hour, violence_category
+-- optionally restricted to [year_from, year_to]. Dimensions not listed in
+-- `dims` are collapsed (and left out of each returned object).
+drop function if exists public.crime_counts(text[], int, int);
+
+create or replace function public.crime_counts(
+    dims text[] default array['alcaldia', 'year'],
+    year_from int default null,
+    year_to int default null,
+    violence_rules jsonb default '[]'::jsonb
+)
+returns jsonb
+language sql
+stable
+as $$
+    with delitos as (
+        select distinct lower(coalesce(delito, '')) as delito
+        from public."FGJ"
+    ),
+    violence as (
+        select
+            d.delito,
+            coalesce((
+                select rule.value->>1
+                from jsonb_array_elements(violence_rules) with ordinality as rule(value, position)
+                where strpos(d.delito, lower(rule.value->>0)) > 0
+                order by rule.position
+                limit 1
+            ), 'unknown') as violence_category
+        from delitos d
+    ),
+    fgj as (
+        select
+            f.alcaldia_hecho,
+            f.fecha_hecho::timestamp as fecha,
+            case when f.hora::text ~ '^\s*\d+(\.\d+)?\s*$' then round(f.hora::text::numeric)::int end as hora_num,
+            v.violence_category
+        from public."FGJ" f
+        join violence v on v.delito = lower(coalesce(f.delito, ''))
+    ),
+    cells as (
+        select
+            case when 'alcaldia' = any(dims) then alcaldia_hecho end as alcaldia,
+            case when 'year' = any(dims) then extract(year from fecha)::int end as year,
+            case when 'month' = any(dims) then extract(month from fecha)::int end as month,
+            case when 'day_of_week' = any(dims) then extract(isodow from fecha)::int - 1 end as day_of_week,
+            case when 'hour' = any(dims) then
+                case when hora_num = 24 then 0 when hora_num between 0 and 23 then hora_num end
+            end as hour,
+            case when 'violence_category' = any(dims) then violence_category end as violence_category,
+            count(*) as crimes
+        from fgj
+        where (year_from is null or fecha >= make_date(year_from, 1, 1))
+          and (year_to is null or fecha < make_date(year_to + 1, 1, 1))
+        group by 1, 2, 3, 4, 5, 6
+    )
+    select coalesce(jsonb_agg(jsonb_strip_nulls(to_jsonb(cells))), '[]'::jsonb)
+    from cells;
+$$;
+
+grant execute on function public.crime_summary() to anon, authenticated;
+grant execute on function public.crime_counts(text[], int, int, jsonb) to anon, authenticated;
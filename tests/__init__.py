@@ -0,0 +1,14 @@
+"""
+Unit tests for the shared data layer in utils/
+
+The tests need no network or Supabase credentials: the query engines, cube,
+rolling windows, memo and violence rules run on synthetic frames, snapshot
+sync runs against an in-memory table on a temporary directory, and the n8n
+client talks to a local http.server stub.
+
+Setup:
+    pip install -r requirements-test.txt
+
+Run from the repository root:
+    python -m pytest tests
+"""
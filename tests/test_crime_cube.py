@@ -0,0 +1,71 @@
+"""
+test_crime_cube.py - CrimeCube answers like group-bys over the crime rows
+
+Run with:
+    python -m pytest tests/test_crime_cube.py
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils.crime_cube import CUBE_DIMENSIONS, CrimeCube
+
+
+def crime_frame(rows=2000, seed=3):
+    rng = np.random.default_rng(seed)
+    hour = pd.array(rng.integers(0, 24, rows), dtype='Int8')
+    hour[rng.random(rows) < 0.1] = pd.NA
+    return pd.DataFrame({
+        'alcaldia_normalized': rng.choice(['TLALPAN', 'COYOACAN', 'TLAHUAC'], rows),
+        'year': rng.choice([2022, 2023, 2024], rows),
+        'month': rng.integers(1, 13, rows),
+        'day_of_week': rng.integers(0, 7, rows),
+        'hour': hour,
+        'violence_category': rng.choice(['violent', 'non_violent', 'unknown'], rows),
+    })
+
+
+class CrimeCubeTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.frame = crime_frame()
+        cls.cube = CrimeCube.from_frame(cls.frame)
+
+    def test_total_keeps_rows_with_missing_hour(self):
+        self.assertEqual(self.cube.total(), len(self.frame))
+
+    def test_slice_and_rollup(self):
+        sliced = self.cube.slice(year=[2023, 2024], violence_category='violent')
+        mask = self.frame['year'].isin([2023, 2024]) & (self.frame['violence_category'] == 'violent')
+        expected = self.frame[mask].groupby('alcaldia_normalized').size()
+
+        self.assertEqual(sliced.total(), int(mask.sum()))
+        self.assertEqual(sliced.rollup('alcaldia_normalized').to_dict(), expected.to_dict())
+
+    def test_memoized_results_are_copies(self):
+        first = self.cube.rollup('year')
+        first[:] = 0
+        self.assertEqual(int(self.cube.rollup('year').sum()), len(self.frame))
+
+    def test_pivot_drops_missing_hours(self):
+        pivot = self.cube.pivot('day_of_week', 'hour')
+        self.assertEqual(int(pivot.values.sum()), int(self.frame['hour'].notna().sum()))
+
+    def test_monthly_periods(self):
+        monthly = self.cube.slice(year=2024).monthly()
+        expected = self.frame[self.frame['year'] == 2024].groupby('month').size()
+
+        self.assertEqual(list(monthly['period'].dt.month), list(expected.index))
+        self.assertEqual(list(monthly['crimes']), list(expected))
+
+    def test_missing_dimension_gives_empty_cube(self):
+        cube = CrimeCube.from_frame(self.frame.drop(columns=['hour']))
+        self.assertTrue(cube.empty)
+        self.assertEqual(list(cube.cells.columns), CUBE_DIMENSIONS + ['crimes'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+test_crime_query.py - The bitmap and DuckDB engines answer like plain pandas masks
+
+Run with:
+    python -m pytest tests/test_crime_query.py
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils.crime_query import BitmapEngine, CrimeQuery, DuckDBEngine, PandasEngine
+
+ALCALDIAS = ['TLALPAN', 'COYOACAN', 'IZTAPALAPA', 'BENITO JUAREZ']
+CATEGORIES = ['violent', 'non_violent', 'unknown']
+
+
+def crime_frame(rows=5000, seed=7):
+    """Synthetic store frame with the dtypes the store uses (categoricals, nullable hours)"""
+    rng = np.random.default_rng(seed)
+    fecha = pd.Timestamp('2022-01-01') + pd.to_timedelta(rng.integers(0, 3 * 365, rows), unit='D')
+    hour = pd.array(rng.integers(0, 24, rows), dtype='Int8')
+    hour[rng.random(rows) < 0.1] = pd.NA
+    latitud = rng.uniform(19.1, 19.6, rows)
+    latitud[rng.random(rows) < 0.05] = 0
+    return pd.DataFrame({
+        'fecha_hecho': fecha,
+        'year': pd.array(fecha.year, dtype='Int16'),
+        'month': pd.array(fecha.month, dtype='Int8'),
+        'hour': hour,
+        'alcaldia_normalized': pd.Categorical(rng.choice(ALCALDIAS, rows)),
+        'violence_category': pd.Categorical(rng.choice(CATEGORIES, rows), categories=CATEGORIES),
+        'latitud': latitud,
+        'longitud': rng.uniform(-99.3, -98.9, rows),
+    })
+
+
+def queries(engine):
+    """A spread of filter combinations (lists, ranges, dates, coordinates, empty matches)"""
+    base = CrimeQuery(engine)
+    return [
+        base,
+        base.years(2023),
+        base.years([2022, 2024]),
+        base.years(2022, 2023).alcaldias('TLALPAN', 'COYOACAN'),
+        base.violence('violent').where('hour', '>=', 18),
+        base.dates('2023-03-01', '2023-06-01').located(),
+        base.alcaldias('NO EXISTE'),
+    ]
+
+
+def expected_mask(frame, index):
+    """The same filters as `queries`, written as plain pandas masks"""
+    year, alcaldia, violence, hour = frame['year'], frame['alcaldia_normalized'], frame['violence_category'], frame['hour']
+    fecha = frame['fecha_hecho']
+    masks = [
+        pd.Series(True, index=frame.index),
+        year == 2023,
+        year.isin([2022, 2024]),
+        year.between(2022, 2023) & alcaldia.isin(['TLALPAN', 'COYOACAN']),
+        (violence == 'violent') & (hour >= 18),
+        (fecha >= '2023-03-01') & (fecha < '2023-06-01')
+        & frame['latitud'].notna() & (frame['latitud'] != 0)
+        & frame['longitud'].notna() & (frame['longitud'] != 0),
+        alcaldia == 'NO EXISTE',
+    ]
+    return masks[index].fillna(False).astype(bool).to_numpy()
+
+
+def normalized_counts(counts, dims):
+    """Group-by result with plain values and a stable row order, for comparison across engines"""
+    counts = counts.astype({dim: object for dim in dims})
+    counts = counts.astype({'crimes': int})
+    return counts.sort_values(list(dims), key=lambda column: column.astype(str)).reset_index(drop=True)
+
+
+class CrimeQueryEngineTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.frame = crime_frame()
+        cls.engines = [PandasEngine(cls.frame), BitmapEngine(cls.frame), DuckDBEngine(cls.frame)]
+
+    def test_count_and_positions_match_masks(self):
+        for engine in self.engines:
+            for index, query in enumerate(queries(engine)):
+                mask = expected_mask(self.frame, index)
+                with self.subTest(engine=engine.name, query=index):
+                    self.assertEqual(query.count(), int(mask.sum()))
+                    np.testing.assert_array_equal(query.positions(), np.flatnonzero(mask))
+
+    def test_group_by_matches_pandas_engine(self):
+        reference = queries(self.engines[0])
+        for engine in self.engines[1:]:
+            for index, query in enumerate(queries(engine)):
+                with self.subTest(engine=engine.name, query=index):
+                    expected = reference[index].group_by('alcaldia_normalized', 'year')
+                    actual = query.group_by('alcaldia_normalized', 'year')
+                    self.assertEqual(int(actual['crimes'].sum()), int(expected_mask(self.frame, index).sum()))
+                    pd.testing.assert_frame_equal(
+                        normalized_counts(actual, ['alcaldia_normalized', 'year']),
+                        normalized_counts(expected, ['alcaldia_normalized', 'year']),
+                        check_dtype=False
+                    )
+
+    def test_rows_returns_only_requested_columns(self):
+        for engine in self.engines:
+            query = queries(engine)[3]
+            rows = query.rows('latitud', 'longitud')
+            with self.subTest(engine=engine.name):
+                self.assertEqual(list(rows.columns), ['latitud', 'longitud'])
+                expected = self.frame.loc[expected_mask(self.frame, 3), 'latitud'].to_numpy()
+                np.testing.assert_allclose(np.sort(rows['latitud'].to_numpy()), np.sort(expected))
+
+    def test_key_ignores_filter_order(self):
+        engine = self.engines[1]
+        first = CrimeQuery(engine).years(2023).alcaldias('TLALPAN')
+        second = CrimeQuery(engine).alcaldias('TLALPAN').years(2023)
+        self.assertEqual(first.key, second.key)
+
+
+if __name__ == '__main__':
+    unittest.main()
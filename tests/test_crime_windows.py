@@ -0,0 +1,90 @@
+"""
+test_crime_windows.py - DailySeries.window agrees with plain pandas date masks
+
+Run with:
+    python -m pytest tests/test_crime_windows.py
+"""
+
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils.crime_windows import DailySeries, build_daily_series
+
+DELITOS = ['ROBO A NEGOCIO CON VIOLENCIA', 'FRAUDE', 'DAÑO EN PROPIEDAD AJENA', 'AMENAZAS']
+
+
+def alcaldia_frame(rows=3000, days=200, seed=11):
+    """Crimes of one alcaldía over `days` days, with gaps, missing hours and repeated delitos"""
+    rng = np.random.default_rng(seed)
+    offsets = rng.integers(0, days, rows)
+    offsets = offsets[(offsets < 40) | (offsets > 55)]  # a two-week gap with no crimes
+    n = len(offsets)
+    hour = pd.array(rng.integers(0, 24, n), dtype='Int8')
+    hour[rng.random(n) < 0.1] = pd.NA
+    return pd.DataFrame({
+        'date': pd.Timestamp('2024-01-01') + pd.to_timedelta(offsets, unit='D'),
+        'alcaldia_normalized': 'TLALPAN',
+        'violence_category': rng.choice(['violent', 'non_violent', 'unknown'], n),
+        'hour': hour,
+        'delito': rng.choice(DELITOS, n),
+    })
+
+
+def expected_window(frame, days):
+    """The window KPIs computed with boolean masks over the raw rows"""
+    end = frame['date'].max()
+    start = end - pd.Timedelta(days=days - 1)
+    current = frame[(frame['date'] >= start) & (frame['date'] <= end)]
+    previous = frame[(frame['date'] >= start - pd.Timedelta(days=days)) & (frame['date'] < start)]
+    hours = current['hour'].dropna().astype(int)
+    return {
+        'start': start,
+        'total': len(current),
+        'previous_total': len(previous),
+        'violent': int((current['violence_category'] == 'violent').sum()),
+        'non_violent': int((current['violence_category'] == 'non_violent').sum()),
+        'hourly': np.bincount(hours, minlength=24),
+        'delitos': current['delito'].value_counts(),
+        'daily': current.groupby('date').size(),
+    }
+
+
+class DailySeriesTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.frame = alcaldia_frame()
+        cls.series = DailySeries(cls.frame)
+
+    def test_window_matches_masks(self):
+        for days in (1, 7, 30, 90, 500):
+            expected = expected_window(self.frame, days)
+            window = self.series.window(days=days)
+            with self.subTest(days=days):
+                self.assertEqual(window['start'], expected['start'])
+                self.assertEqual(window['end'], self.frame['date'].max())
+                for key in ('total', 'previous_total', 'violent', 'non_violent'):
+                    self.assertEqual(window[key], expected[key], key)
+                np.testing.assert_array_equal(window['hourly'], expected['hourly'])
+                self.assertEqual(window['delitos'].to_dict(), expected['delitos'].to_dict())
+
+    def test_daily_series_is_dense(self):
+        window = self.series.window(days=90)
+        daily = window['daily']
+        self.assertEqual(len(daily), 90)
+        self.assertEqual(int(daily.sum()), window['total'])
+        expected = expected_window(self.frame, 90)['daily']
+        self.assertEqual(daily[daily > 0].to_dict(), expected.to_dict())
+        self.assertEqual(window['busiest_day_count'], int(expected.max()))
+
+    def test_build_skips_missing_dates(self):
+        frame = pd.concat([self.frame, self.frame.head(5).assign(date=pd.NaT)], ignore_index=True)
+        series = build_daily_series(frame)
+        self.assertEqual(list(series), ['TLALPAN'])
+        self.assertEqual(series['TLALPAN'].window(days=30)['total'], self.series.window(days=30)['total'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+"""
+test_memo.py - BoundedLRU eviction and canonical filter keys
+
+Run with:
+    python -m pytest tests/test_memo.py
+"""
+
+import threading
+import unittest
+
+import numpy as np
+import pandas as pd
+
+from utils.memo import BoundedLRU, canonical, frame_bytes
+
+
+class BoundedLRUTest(unittest.TestCase):
+
+    def test_hit_skips_builder(self):
+        memo = BoundedLRU(maxsize=4)
+        calls = []
+
+        def build():
+            calls.append(1)
+            return 'value'
+
+        self.assertEqual(memo.get_or_build('key', build), 'value')
+        self.assertEqual(memo.get_or_build('key', build), 'value')
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(memo.stats()['hits'], 1)
+        self.assertEqual(memo.stats()['misses'], 1)
+
+    def test_evicts_least_recently_used(self):
+        memo = BoundedLRU(maxsize=2)
+        memo.get_or_build('a', lambda: 1)
+        memo.get_or_build('b', lambda: 2)
+        memo.get_or_build('a', lambda: 1)     # 'a' is now the most recent
+        memo.get_or_build('c', lambda: 3)     # evicts 'b'
+
+        self.assertEqual(len(memo), 2)
+        self.assertEqual(memo.get_or_build('a', lambda: 'rebuilt'), 1)
+        self.assertEqual(memo.get_or_build('b', lambda: 'rebuilt'), 'rebuilt')
+
+    def test_evicts_by_bytes_but_keeps_newest(self):
+        frame = pd.DataFrame({'x': np.zeros(1000)})
+        size = frame_bytes(frame)
+        memo = BoundedLRU(maxsize=100, max_bytes=int(size * 2.5))
+        for key in range(4):
+            memo.get_or_build(key, frame.copy)
+
+        self.assertEqual(len(memo), 2)
+        self.assertEqual(memo.stats()['bytes'], 2 * size)
+
+        # A single entry larger than the budget is still kept
+        huge = BoundedLRU(maxsize=100, max_bytes=size // 2)
+        huge.get_or_build('only', frame.copy)
+        self.assertEqual(len(huge), 1)
+
+    def test_clear_resets_bytes(self):
+        memo = BoundedLRU(maxsize=4)
+        memo.get_or_build('frame', lambda: pd.Series(range(10)))
+        memo.clear()
+        self.assertEqual(memo.stats()['entries'], 0)
+        self.assertEqual(memo.stats()['bytes'], 0)
+
+    def test_concurrent_builds_store_one_value(self):
+        memo = BoundedLRU(maxsize=4)
+        barrier = threading.Barrier(8)
+        results = []
+
+        def worker(i):
+            barrier.wait()
+            results.append(memo.get_or_build('shared', lambda: i))
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(memo), 1)
+        self.assertEqual(len(results), 8)
+        self.assertIn(memo.get_or_build('shared', lambda: 'rebuilt'), results)
+
+
+class CanonicalTest(unittest.TestCase):
+
+    def test_order_independent(self):
+        self.assertEqual(canonical({'year': [2024, 2023], 'alcaldia': 'TLALPAN'}),
+                         canonical({'alcaldia': 'TLALPAN', 'year': (2023, 2024)}))
+        self.assertEqual(canonical(range(2020, 2023)), canonical({2022, 2021, 2020}))
+
+    def test_numpy_scalars_become_python(self):
+        self.assertEqual(canonical(np.int64(5)), 5)
+        self.assertIsInstance(canonical(np.int64(5)), int)
+        self.assertEqual(canonical(pd.Timestamp('2024-01-01')), pd.Timestamp('2024-01-01'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+"""
+test_n8n_client.py - N8NChatClient against a local http.server webhook stub
+
+Run with:
+    python -m pytest tests/test_n8n_client.py
+"""
+
+import json
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from utils.n8n_client import N8NChatClient
+
+STREAM_CHUNKS = ['Hola', ', ', 'Iztapalapa']
+
+
+class WebhookStub(BaseHTTPRequestHandler):
+    """Answers /stream with n8n NDJSON chunks and /json with one plain JSON body"""
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+
+        if self.path == '/stream':
+            lines = [{'type': 'begin'}]
+            lines += [{'type': 'item', 'content': chunk} for chunk in STREAM_CHUNKS]
+            lines += [{'type': 'end'}]
+            body = ''.join(json.dumps(line) + '\n' for line in lines).encode()
+            content_type = 'application/x-ndjson'
+        else:
+            body = json.dumps([{'output': f"echo: {request['prompt']}"}]).encode()
+            content_type = 'application/json'
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class N8NChatClientTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), WebhookStub)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_streamed_ndjson(self):
+        client = N8NChatClient(f"{self.base_url}/stream", timeout=5, workers=2)
+        job = client.submit('¿Qué alcaldía?', 'session-1')
+
+        self.assertEqual(job.wait(timeout=10)['output'], 'Hola, Iztapalapa')
+        self.assertEqual(job.text, 'Hola, Iztapalapa')
+        self.assertEqual(job.result['sessionId_enviado'], 'session-1')
+
+    def test_plain_json(self):
+        client = N8NChatClient(f"{self.base_url}/json", timeout=5, workers=2)
+        job = client.submit('hola', 'session-2')
+
+        self.assertEqual(job.wait(timeout=10), {'output': 'echo: hola', 'sessionId_enviado': 'session-2'})
+        self.assertEqual(job.text, 'echo: hola')
+
+
+if __name__ == '__main__':
+    unittest.main()
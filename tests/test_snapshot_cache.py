@@ -0,0 +1,118 @@
+"""
+test_snapshot_cache.py - Delta sync of the local Parquet snapshot
+
+Supabase is replaced by an in-memory table (`fetch_table` is patched), so
+these tests exercise the snapshot and metadata files on a temporary directory.
+
+Run with:
+    python -m pytest tests/test_snapshot_cache.py
+"""
+
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pandas as pd
+
+from utils import snapshot_cache
+from utils.snapshot_cache import metadata_path, read_metadata, sync_snapshot
+
+TABLE = 'FGJ'
+COLUMNS = ['id', 'fecha_hecho', 'delito']
+
+
+class FakeTable:
+    """In-memory stand-in for a Supabase table, answering fetch_table calls"""
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.calls = []
+        self.error = None
+
+    def fetch_table(self, table, columns, key='fecha_hecho', start=None, **kwargs):
+        self.calls.append(start)
+        if self.error:
+            raise self.error
+        rows = [row for row in self.rows if start is None or row[key][:10] >= start]
+        return [{column: row[column] for column in columns} for row in rows]
+
+
+def row(id_, fecha, delito='ROBO'):
+    return {'id': id_, 'fecha_hecho': fecha, 'delito': delito}
+
+
+class SyncSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.table = FakeTable([
+            row(1, '2024-05-01T10:00:00'),
+            row(2, '2024-05-02T08:00:00'),
+            row(3, '2024-05-03T09:00:00'),
+        ])
+        patches = [
+            mock.patch.object(snapshot_cache, 'SNAPSHOT_DIR', self.directory.name),
+            mock.patch.object(snapshot_cache, 'fetch_table', self.table.fetch_table),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(self.directory.cleanup)
+
+    def test_first_sync_downloads_everything(self):
+        df = sync_snapshot(TABLE, COLUMNS)
+
+        self.assertEqual(sorted(df['id']), [1, 2, 3])
+        self.assertEqual(self.table.calls, [None])
+        metadata = read_metadata(TABLE)
+        self.assertEqual(metadata['row_count'], 3)
+        self.assertTrue(metadata['high_water_mark'].startswith('2024-05-03T09:00:00'))
+
+    def test_delta_replaces_the_boundary_day(self):
+        sync_snapshot(TABLE, COLUMNS)
+
+        # A late row for the boundary day, an edit on it, a new day, and an
+        # edit to an older day (only picked up by the periodic full resync)
+        self.table.rows[2] = row(3, '2024-05-03T09:00:00', 'FRAUDE')
+        self.table.rows += [row(4, '2024-05-03T23:00:00'), row(5, '2024-05-04T01:00:00')]
+        self.table.rows[0] = row(1, '2024-05-01T10:00:00', 'EDITADO')
+
+        df = sync_snapshot(TABLE, COLUMNS)
+
+        self.assertEqual(self.table.calls, [None, '2024-05-03'])
+        self.assertEqual(sorted(df['id']), [1, 2, 3, 4, 5])
+        delitos = dict(zip(df['id'], df['delito']))
+        self.assertEqual(delitos[3], 'FRAUDE')
+        self.assertEqual(delitos[1], 'ROBO')
+        self.assertTrue(read_metadata(TABLE)['high_water_mark'].startswith('2024-05-04T01:00:00'))
+
+    def test_column_change_forces_full_sync(self):
+        sync_snapshot(TABLE, COLUMNS)
+        df = sync_snapshot(TABLE, ['id', 'fecha_hecho'])
+
+        self.assertEqual(self.table.calls, [None, None])
+        self.assertEqual(list(df.columns), ['id', 'fecha_hecho'])
+
+    def test_fetch_failure_serves_stale_snapshot(self):
+        sync_snapshot(TABLE, COLUMNS)
+        with open(metadata_path(TABLE), encoding='utf-8') as f:
+            metadata_before = json.load(f)
+
+        self.table.error = ConnectionError('supabase unreachable')
+        df = sync_snapshot(TABLE, COLUMNS)
+
+        self.assertEqual(sorted(df['id']), [1, 2, 3])
+        with open(metadata_path(TABLE), encoding='utf-8') as f:
+            self.assertEqual(json.load(f), metadata_before)
+
+    def test_fetch_failure_without_snapshot_raises(self):
+        self.table.error = ConnectionError('supabase unreachable')
+        with self.assertRaises(ConnectionError):
+            sync_snapshot(TABLE, COLUMNS)
+        self.assertFalse(os.path.exists(metadata_path(TABLE)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+"""
+test_violence.py - Python classifier and server rule payload agree
+
+Run with:
+    python -m pytest tests/test_violence.py
+"""
+
+import unittest
+
+import pandas as pd
+
+from utils.violence import (
+    UNKNOWN_CATEGORY, VIOLENCE_RULES, categorize_violence, classify_violence, rules_payload
+)
+
+DELITOS = [
+    'ROBO A TRANSEUNTE EN VIA PUBLICA CON VIOLENCIA',
+    'Robo de vehículo sin violencia',
+    'FRAUDE',
+    'robo a negocio con violencia y sin violencia',
+    None,
+]
+
+# Mixed-case patterns, as a maintainer might type them
+MIXED_CASE_RULES = [('Con Violencia', 'violent'), ('SIN VIOLENCIA', 'non_violent')]
+
+
+def server_category(delito, payload):
+    """What crime_counts does with the payload: first rule contained in lower(delito)"""
+    delito = (delito or '').lower()
+    for pattern, category in payload:
+        if pattern in delito:
+            return category
+    return UNKNOWN_CATEGORY
+
+
+class ViolenceRulesTest(unittest.TestCase):
+
+    def assert_agree(self, rules):
+        payload = rules_payload(rules)
+        for delito in DELITOS:
+            self.assertEqual(categorize_violence(delito, rules), server_category(delito, payload), delito)
+
+    def test_default_rules_agree_with_payload(self):
+        self.assert_agree(VIOLENCE_RULES)
+
+    def test_mixed_case_rules_agree_with_payload(self):
+        self.assert_agree(MIXED_CASE_RULES)
+        self.assertEqual(categorize_violence(DELITOS[0], MIXED_CASE_RULES), 'violent')
+
+    def test_payload_is_lowercase(self):
+        self.assertEqual(rules_payload(MIXED_CASE_RULES), [['con violencia', 'violent'], ['sin violencia', 'non_violent']])
+
+    def test_series_matches_scalar(self):
+        series = pd.Series(DELITOS)
+        expected = [categorize_violence(delito, MIXED_CASE_RULES) for delito in DELITOS]
+        self.assertEqual(list(classify_violence(series, MIXED_CASE_RULES)), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
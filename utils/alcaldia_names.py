@@ -0,0 +1,78 @@
+"""
+alcaldia_names.py - Shared alcaldía name normalizer
+
+Crime rows, agencias, cuadrantes, population tables and alcaldias.json all
+spell the 16 alcaldías differently ("Álvaro Obregón", "ALVARO OBREGON",
+"CUAJIMALPA DE MORELOS", "LA MAGDALENA CONTRERAS", ...). There are only a few
+hundred distinct raw spellings, so each one is normalized once and the result
+is broadcast back over the whole column.
+
+Usage:
+    from utils.alcaldia_names import normalize_alcaldia_name, normalize_alcaldia_series
+    df['alcaldia_normalized'] = normalize_alcaldia_series(df['alcaldia_hecho'])
+    normalize_alcaldia_name("Gustavo A. Madero")   # 'GUSTAVO A MADERO'
+"""
+
+import unicodedata
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# ===============================
+# Canonical Names
+# ===============================
+CANONICAL_ALCALDIAS = [
+    'ALVARO OBREGON', 'AZCAPOTZALCO', 'BENITO JUAREZ', 'COYOACAN',
+    'CUAJIMALPA', 'CUAUHTEMOC', 'GUSTAVO A MADERO', 'IZTACALCO',
+    'IZTAPALAPA', 'MAGDALENA CONTRERAS', 'MIGUEL HIDALGO', 'MILPA ALTA',
+    'TLAHUAC', 'TLALPAN', 'VENUSTIANO CARRANZA', 'XOCHIMILCO'
+]
+
+
+# ===============================
+# Normalization
+# ===============================
+@lru_cache(maxsize=4096)
+def _normalize_text(name):
+    name = name.upper().strip()
+    name = ''.join(c for c in unicodedata.normalize('NFD', name)
+                   if unicodedata.category(c) != 'Mn')
+    name = name.replace('.', '')
+    name = name.replace(' DE MORELOS', '')
+    if name.startswith('LA '):
+        name = name[3:]
+    return ' '.join(name.split())
+
+
+def normalize_alcaldia_name(name):
+    """Normalize alcaldía names for matching"""
+    if pd.isna(name):
+        return None
+    return _normalize_text(str(name))
+
+
+def normalize_alcaldia_series(series):
+    """Normalize a whole Series, running the normalizer once per distinct value"""
+    codes, uniques = pd.factorize(series)
+    normalized = np.array([normalize_alcaldia_name(raw) for raw in uniques] + [None], dtype=object)
+    # factorize marks missing values with -1, which picks the trailing None
+    return pd.Series(normalized[codes], index=series.index, name=series.name)
+
+
+def unmapped_alcaldias(series):
+    """
+    Report raw spellings that do not normalize to one of the 16 alcaldías.
+
+    Returns a DataFrame with the raw value, its normalized form and how many
+    rows carry it, most frequent first.
+    """
+    counts = series.dropna().value_counts()
+    counts = counts[counts > 0]
+    report = pd.DataFrame({
+        'raw': counts.index.astype(str),
+        'normalized': [normalize_alcaldia_name(raw) for raw in counts.index],
+        'rows': counts.values,
+    })
+    report = report[~report['normalized'].isin(CANONICAL_ALCALDIAS)]
+    return report.reset_index(drop=True)
@@ -0,0 +1,241 @@
+"""
+crime_aggregates.py - Server-side crime counts through Supabase RPC
+
+Pages that only show totals (the landing page, the KPI rows of the
+dashboards) ask Postgres for grouped counts instead of downloading raw rows.
+The functions live in sql/crime_aggregates.sql and return one JSON value, so
+a whole KPI cube (alcaldía × year × month × violence) is a few kilobytes.
+
+Backends (CRIME_AGGREGATES_BACKEND):
+    supabase  - call the RPC functions (default)
+    sqlite    - run the same queries on an in-memory SQLite copy of the local
+                FGJ snapshot; a stand-in for tests and offline work
+    store     - skip aggregation and use the in-process crime cube
+
+Violence categories are not defined in SQL: every counts call sends
+utils/violence.VIOLENCE_RULES along, so server and store KPIs share one
+rule table.
+
+If the RPC functions fail, `get_kpi_cube()` falls back to the in-process
+crime cube and retries the server after BACKEND_RETRY_SECONDS.
+`refresh_aggregates()` drops the cached server cubes and retries at once.
+
+Usage:
+    from utils.crime_aggregates import fetch_crime_summary, get_kpi_cube
+    stats = fetch_crime_summary()
+    cube = get_kpi_cube().slice(year=range(2023, 2025))
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+import pandas as pd
+import streamlit as st
+
+from utils.alcaldia_names import normalize_alcaldia_series
+from utils.crime_cube import COUNT_COLUMN, CrimeCube, get_crime_cube
+from utils.crime_store import SUPABASE_TABLE
+from utils.snapshot_cache import snapshot_path
+from utils.supabase_fetcher import get_supabase_client
+from utils.violence import UNKNOWN_CATEGORY, rules_payload
+
+# ===============================
+# Configuration
+# ===============================
+AGGREGATES_BACKEND = os.getenv("CRIME_AGGREGATES_BACKEND", "supabase")
+AGGREGATES_TTL = 3600
+
+# Store column -> dimension name understood by the RPC functions
+RPC_DIMENSIONS = {
+    'alcaldia_normalized': 'alcaldia',
+    'year': 'year',
+    'month': 'month',
+    'day_of_week': 'day_of_week',
+    'hour': 'hour',
+    'violence_category': 'violence_category',
+}
+
+# Dimensions behind the KPI rows of the dashboards
+KPI_DIMENSIONS = ['alcaldia_normalized', 'year', 'month', 'violence_category']
+
+# After a backend error, pages use the store cube for this long before retrying
+BACKEND_RETRY_SECONDS = 300
+
+# Set while the aggregation backend is cooling down after an error
+_backend_failed = threading.Event()
+_backend_failed_at = 0.0
+
+
+# ===============================
+# Backends
+# ===============================
+class SupabaseAggregates:
+    """Calls the Postgres functions in sql/crime_aggregates.sql"""
+
+    def __init__(self, client):
+        self.client = client
+
+    def summary(self):
+        return self.client.rpc('crime_summary', {}).execute().data
+
+    def counts(self, dims, year_from=None, year_to=None):
+        params = {
+            'dims': list(dims), 'year_from': year_from, 'year_to': year_to,
+            'violence_rules': rules_payload()
+        }
+        return self.client.rpc('crime_counts', params).execute().data
+
+
+def _sqlite_violence_case(rules):
+    """CASE expression (and its parameters) applying the violence rules in order"""
+    branches, params = [], {}
+    for i, (pattern, category) in enumerate(rules):
+        branches.append(f"when instr(lower(delito), :rule_{i}) > 0 then :category_{i}")
+        params[f'rule_{i}'], params[f'category_{i}'] = pattern, category
+    params['unknown_category'] = UNKNOWN_CATEGORY
+    return f"case {' '.join(branches)} else :unknown_category end", params
+
+
+# Same grouping as public.crime_counts, in SQLite's dialect
+SQLITE_COUNTS_SQL = """
+    select
+        case when :alcaldia then alcaldia_hecho end as alcaldia,
+        case when :year then cast(strftime('%Y', fecha_hecho) as integer) end as year,
+        case when :month then cast(strftime('%m', fecha_hecho) as integer) end as month,
+        case when :day_of_week then (cast(strftime('%w', fecha_hecho) as integer) + 6) % 7 end as day_of_week,
+        case when :hour then
+            case when hora = 24 then 0 when hora between 0 and 23 then hora end
+        end as hour,
+        case when :violence_category then {violence_case} end as violence_category,
+        count(*) as crimes
+    from fgj
+    where (:date_from is null or fecha_hecho >= :date_from)
+      and (:date_to is null or fecha_hecho < :date_to)
+    group by 1, 2, 3, 4, 5, 6
+"""
+
+SQLITE_SUMMARY_SQL = """
+    select count(*), max(fecha_hecho) from fgj
+"""
+
+
+class SQLiteAggregates:
+    """Local stand-in for the RPC functions over an in-memory SQLite table"""
+
+    def __init__(self, frame):
+        rows = pd.DataFrame({
+            'alcaldia_hecho': frame['alcaldia_hecho'],
+            'fecha_hecho': pd.to_datetime(frame['fecha_hecho'], errors='coerce').dt.strftime('%Y-%m-%d %H:%M:%S'),
+            'hora': pd.to_numeric(frame['hora'], errors='coerce').round().astype('Int64'),
+            'delito': frame['delito'],
+        })
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(':memory:', check_same_thread=False)
+        rows.to_sql('fgj', self.connection, index=False)
+
+    @classmethod
+    def from_snapshot(cls, table=SUPABASE_TABLE):
+        """Load the local Parquet snapshot written by utils/snapshot_cache.py"""
+        return cls(pd.read_parquet(snapshot_path(table)))
+
+    def summary(self):
+        with self._lock:
+            total, most_recent = self.connection.execute(SQLITE_SUMMARY_SQL).fetchone()
+            alcaldias = [row[0] for row in self.connection.execute(
+                "select distinct alcaldia_hecho from fgj where alcaldia_hecho is not null"
+            )]
+        return {'total_crimes': total, 'most_recent_date': most_recent, 'alcaldias': alcaldias}
+
+    def counts(self, dims, year_from=None, year_to=None):
+        violence_case, params = _sqlite_violence_case(rules_payload())
+        params.update({name: name in dims for name in RPC_DIMENSIONS.values()})
+        params['date_from'] = f"{year_from}-01-01" if year_from is not None else None
+        params['date_to'] = f"{year_to + 1}-01-01" if year_to is not None else None
+        sql = SQLITE_COUNTS_SQL.format(violence_case=violence_case)
+        with self._lock:
+            counts = pd.read_sql_query(sql, self.connection, params=params)
+        return counts.to_dict('records')
+
+
+@st.cache_resource(show_spinner=False)
+def get_aggregates_backend():
+    """Return the configured aggregation backend (one per process)"""
+    if AGGREGATES_BACKEND == 'sqlite':
+        return SQLiteAggregates.from_snapshot()
+    return SupabaseAggregates(get_supabase_client())
+
+
+# ===============================
+# Queries
+# ===============================
+@st.cache_data(ttl=AGGREGATES_TTL, show_spinner=False)
+def fetch_crime_summary():
+    """Return total crimes, most recent date and number of alcaldías, aggregated server-side"""
+    summary = get_aggregates_backend().summary() or {}
+    alcaldias = normalize_alcaldia_series(pd.Series(summary.get('alcaldias') or [], dtype=object))
+    return {
+        'total_crimes': int(summary.get('total_crimes') or 0),
+        'most_recent_date': summary.get('most_recent_date') or "N/A",
+        'unique_alcaldias': int(alcaldias.nunique()),
+    }
+
+
+@st.cache_data(ttl=AGGREGATES_TTL, show_spinner=False)
+def fetch_crime_counts(dims=tuple(KPI_DIMENSIONS), year_from=None, year_to=None):
+    """
+    Return crime counts grouped by `dims` (store column names) as a DataFrame
+    with one column per dimension plus 'crimes'. Raw alcaldía spellings are
+    normalized and unmapped ones dropped, as in the crime store.
+    """
+    dims = list(dims)
+    rpc_dims = [RPC_DIMENSIONS[dim] for dim in dims]
+    records = get_aggregates_backend().counts(rpc_dims, year_from, year_to) or []
+
+    counts = pd.DataFrame(records).reindex(columns=rpc_dims + [COUNT_COLUMN])
+    counts.columns = dims + [COUNT_COLUMN]
+    if 'alcaldia_normalized' in dims:
+        counts['alcaldia_normalized'] = normalize_alcaldia_series(counts['alcaldia_normalized'])
+        counts = counts[counts['alcaldia_normalized'].notna()]
+    return counts.reset_index(drop=True)
+
+
+@st.cache_resource(ttl=AGGREGATES_TTL, show_spinner=False)
+def _server_kpi_cube(dims):
+    """One memoizing cube per set of server-side counts (shared across sessions)"""
+    return CrimeCube.from_counts(fetch_crime_counts(dims), dims)
+
+
+def _backend_available():
+    """False while the backend is cooling down after an error"""
+    if _backend_failed.is_set() and time.monotonic() - _backend_failed_at >= BACKEND_RETRY_SECONDS:
+        _backend_failed.clear()
+    return not _backend_failed.is_set()
+
+
+def _mark_backend_failed():
+    global _backend_failed_at
+    _backend_failed_at = time.monotonic()
+    _backend_failed.set()
+
+
+def refresh_aggregates():
+    """Drop the cached server-side KPI cubes and retry the backend on next use"""
+    _server_kpi_cube.clear()
+    _backend_failed.clear()
+
+
+def get_kpi_cube(dims=KPI_DIMENSIONS):
+    """
+    Return a CrimeCube over `dims` built from server-side counts.
+
+    Falls back to the in-process crime cube when the backend is 'store' or
+    the aggregation functions are unreachable (retried after BACKEND_RETRY_SECONDS).
+    """
+    if AGGREGATES_BACKEND != 'store' and _backend_available():
+        try:
+            return _server_kpi_cube(tuple(dims))
+        except Exception:
+            _mark_backend_failed()
+    return get_crime_cube()
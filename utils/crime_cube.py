@@ -0,0 +1,184 @@
+"""
+crime_cube.py - Pre-aggregated crime count cube
+
+Counts crimes once per store refresh over
+
+    alcaldía × year × month × day_of_week × hour × violence_category
+
+so dashboard widgets slice and sum a few thousand cells instead of scanning
+every crime row on each Streamlit rerun. Rows with a missing hour or date
+keep their own cell (with a missing key), so cube totals always match the
+row counts of the store.
+
+Slices and aggregates are memoized in one bounded LRU per cube snapshot,
+keyed by the canonical chain of filters that produced them, so reruns from
+widgets that do not change the filters reuse earlier results across all
+sessions. Aggregates are handed out as copies; callers may rename or add
+columns freely.
+
+Usage:
+    from utils.crime_cube import get_crime_cube
+    cube = get_crime_cube().slice(year=range(2023, 2025), violence_category='violent')
+    cube.total()                                  # number of crimes
+    cube.rollup('alcaldia_normalized')            # Series of counts
+    cube.pivot('day_of_week', 'hour')             # day × hour table
+    cube.monthly('violence_category')             # monthly series per category
+
+    # `year` keyed on FGJ's anio_hecho instead of the year of fecha_hecho
+    get_crime_cube('anio_hecho').slice(year=[2023, 2024])
+"""
+
+import pandas as pd
+
+from utils.crime_schema import apply_crime_schema
+from utils.crime_store import get_crime_store
+from utils.memo import BoundedLRU, canonical
+
+# ===============================
+# Configuration
+# ===============================
+CUBE_DIMENSIONS = [
+    'alcaldia_normalized', 'year', 'month', 'day_of_week', 'hour', 'violence_category'
+]
+
+COUNT_COLUMN = 'crimes'
+
+# Memoized slices/aggregates kept per cube snapshot
+CUBE_MEMO_SIZE = 512
+
+
+# ===============================
+# Cube
+# ===============================
+class CrimeCube:
+    """Crime counts per combination of CUBE_DIMENSIONS, with slice/rollup/pivot queries"""
+
+    def __init__(self, cells, memo=None, path=()):
+        self.cells = cells
+        # Shared with every slice of this cube; `path` is this slice's filter chain
+        self._memo = memo if memo is not None else BoundedLRU(CUBE_MEMO_SIZE)
+        self._path = path
+
+    def _memoized(self, key, builder):
+        value = self._memo.get_or_build(self._path + (key,), builder)
+        return value.copy() if isinstance(value, (pd.DataFrame, pd.Series)) else value
+
+    @classmethod
+    def from_frame(cls, frame):
+        """Aggregate a crime frame (with all CUBE_DIMENSIONS columns) into a cube"""
+        if frame.empty or any(dim not in frame.columns for dim in CUBE_DIMENSIONS):
+            return cls(pd.DataFrame(columns=CUBE_DIMENSIONS + [COUNT_COLUMN]))
+
+        cells = (
+            frame.groupby(CUBE_DIMENSIONS, observed=True, dropna=False)
+            .size()
+            .reset_index(name=COUNT_COLUMN)
+        )
+        cells[COUNT_COLUMN] = cells[COUNT_COLUMN].astype('int32')
+        return cls(cells)
+
+    @classmethod
+    def from_counts(cls, counts, dims):
+        """Build a cube over `dims` from rows that are already counted (a 'crimes' column), e.g. server-side aggregates"""
+        dims = list(dims)
+        if counts.empty:
+            return cls(pd.DataFrame(columns=dims + [COUNT_COLUMN]))
+
+        cells = (
+            counts.groupby(dims, observed=True, dropna=False)[COUNT_COLUMN]
+            .sum()
+            .reset_index()
+        )
+        cells[COUNT_COLUMN] = cells[COUNT_COLUMN].astype('int32')
+        return cls(apply_crime_schema(cells))
+
+    def __len__(self):
+        return len(self.cells)
+
+    @property
+    def empty(self):
+        return self.cells.empty
+
+    def slice(self, **filters):
+        """
+        Return the sub-cube matching every filter.
+
+        A scalar keeps cells equal to it; a list, tuple, set or range keeps
+        cells whose value is one of its members, e.g.
+        `cube.slice(year=range(2020, 2025), alcaldia_normalized='TLALPAN')`.
+        """
+        key = ('slice', canonical(filters))
+
+        def build():
+            mask = pd.Series(True, index=self.cells.index)
+            for dim, value in filters.items():
+                column = self.cells[dim]
+                if isinstance(value, (list, tuple, set, range)):
+                    mask &= column.isin(list(value))
+                else:
+                    mask &= (column == value).fillna(False).astype(bool)
+            return CrimeCube(self.cells[mask], self._memo, self._path + (key,))
+
+        return self._memoized(key, build)
+
+    def total(self):
+        """Number of crimes in the cube"""
+        return self._memoized(('total',), lambda: int(self.cells[COUNT_COLUMN].sum()))
+
+    def rollup(self, *dims):
+        """Sum crimes over every dimension not in `dims`; cells missing a `dims` key are dropped"""
+        return self._memoized(
+            ('rollup', dims),
+            lambda: self.cells.groupby(list(dims), observed=True)[COUNT_COLUMN].sum()
+        )
+
+    def pivot(self, index, columns, fill_value=0):
+        """Two-dimensional rollup with `index` as rows and `columns` as columns"""
+        table = self.rollup(index, columns).unstack(columns, fill_value=fill_value)
+        # Plain labels so callers can add/rename rows and columns freely
+        table.index = pd.Index(list(table.index), name=index)
+        table.columns = pd.Index(list(table.columns), name=columns)
+        return table
+
+    def monthly(self, *dims):
+        """
+        Roll up to calendar months.
+
+        Returns a DataFrame with a 'period' Timestamp (first day of the month),
+        one column per extra dimension in `dims` and the 'crimes' count,
+        sorted by period.
+        """
+        counts = self.rollup('year', 'month', *dims).reset_index()
+        if counts.empty:
+            return pd.DataFrame(columns=['period', *dims, COUNT_COLUMN])
+
+        period = pd.to_datetime(pd.DataFrame({
+            'year': counts['year'].astype(int),
+            'month': counts['month'].astype(int),
+            'day': 1,
+        }))
+        counts.insert(0, 'period', period)
+        counts = counts.drop(columns=['year', 'month'])
+        return counts.sort_values('period').reset_index(drop=True)
+
+
+def _cube_with_year(year_column):
+    """Builder of a cube whose `year` dimension is taken from `year_column`"""
+    def build(frame):
+        if year_column not in frame.columns:
+            return CrimeCube.from_frame(pd.DataFrame())
+        columns = [dim for dim in CUBE_DIMENSIONS if dim != 'year']
+        return CrimeCube.from_frame(frame[columns].assign(year=frame[year_column]))
+    return build
+
+
+def get_crime_cube(year_column='year'):
+    """
+    Return the cube for the current crime store snapshot (built once per refresh).
+
+    `year_column` picks the column behind the `year` dimension: 'year' (from
+    fecha_hecho) or 'anio_hecho', for pages that filter crimes on anio_hecho.
+    """
+    if year_column == 'year':
+        return get_crime_store().derived('crime_cube', CrimeCube.from_frame)
+    return get_crime_store().derived(f'crime_cube_{year_column}', _cube_with_year(year_column))
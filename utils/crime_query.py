@@ -0,0 +1,379 @@
+"""
+crime_query.py - Filter / group-by query builder over the crime store
+
+Pages describe the rows they need (years, alcaldías, violence, agencias,
+dates, valid coordinates) and get back a count, grouped counts or only the
+requested columns of the matching rows, instead of building boolean masks
+and copying the whole table on every rerun.
+
+Three engines answer the same queries:
+    bitmap  - one precomputed bitset per value of the low-cardinality
+              dimensions (year, alcaldía, violence, agencia, hour, ...);
+              a filter is a bitwise OR within a dimension and AND across
+              dimensions over rows/64 words, yielding a row-index array
+              that only the requested columns are gathered from (default)
+    duckdb  - embedded DuckDB scanning the store frame in place with
+              multithreaded vectorized scans (falls back to bitmap when
+              duckdb is not installed)
+    pandas  - boolean masks over the store frame
+
+Set CRIME_QUERY_ENGINE to pick one. Conditions are kept as
+a canonical, hashable tuple (see `CrimeQuery.key`) and every result is
+memoized per store snapshot in a bounded LRU shared by all sessions, so a
+rerun with the same filters does not scan the table again.
+
+Usage:
+    from utils.crime_query import crime_query
+    query = crime_query().years(2023, 2024).alcaldias('TLALPAN').violence('violent')
+    query.count()
+    query.group_by('month')                 # DataFrame: month, crimes
+    query.rows('latitud', 'longitud')       # only these columns, only matching rows
+    query.positions()                       # row positions in the store frame
+"""
+
+import os
+import threading
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+
+from utils.crime_cube import COUNT_COLUMN
+from utils.crime_store import get_crime_store
+from utils.memo import BoundedLRU
+
+# ===============================
+# Configuration
+# ===============================
+QUERY_ENGINE = os.getenv("CRIME_QUERY_ENGINE", "bitmap")
+
+# Comparison operators a condition may use (besides 'in' and 'notnull')
+COMPARISONS = ('>=', '<=', '<', '>', '!=')
+
+# Memoized query results kept per store snapshot
+QUERY_MEMO_SIZE = 256
+QUERY_MEMO_BYTES = 512 * 1024 ** 2
+
+# Low-cardinality dimensions indexed with one bitset per value
+BITMAP_COLUMNS = (
+    'year', 'anio_hecho', 'month', 'day_of_week', 'hour', 'alcaldia_hecho',
+    'alcaldia_normalized', 'violence_category', 'agencia', 'cuadrante_id'
+)
+
+# Bitsets kept for conditions on other columns (dates, coordinates)
+CONDITION_BITSET_CACHE = 64
+
+
+def _param(value):
+    """Plain Python scalar for engine parameters (numpy ints, Timestamps...)"""
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _compare(values, op, value):
+    """Boolean array of `values` (Series or Index) satisfying one condition"""
+    if op == 'in':
+        matches = values.isin(list(value))
+    elif op == 'notnull':
+        matches = values.notna()
+    else:
+        matches = {
+            '>=': values.__ge__, '<=': values.__le__, '<': values.__lt__,
+            '>': values.__gt__, '!=': values.__ne__,
+        }[op](value)
+    return np.asarray(pd.Series(matches).fillna(False), dtype=bool)
+
+
+def _conditions_mask(frame, conditions):
+    mask = np.ones(len(frame), dtype=bool)
+    for column, op, value in conditions:
+        mask &= _compare(frame[column], op, value)
+    return mask
+
+
+def _pack(mask):
+    """Pack a boolean row mask into a bitset of uint64 words"""
+    bits = np.packbits(mask, bitorder='little')
+    padding = -len(bits) % 8
+    if padding:
+        bits = np.concatenate([bits, np.zeros(padding, dtype=np.uint8)])
+    return bits.view(np.uint64)
+
+
+def _unpack(bits, length):
+    """Boolean row mask of the first `length` bits of a bitset"""
+    return np.unpackbits(bits.view(np.uint8), count=length, bitorder='little').astype(bool)
+
+
+def _take(frame, columns, positions):
+    """Only `columns` of the rows at `positions`, without copying the rest of the frame"""
+    return pd.DataFrame({
+        column: frame[column].take(positions).reset_index(drop=True)
+        for column in columns
+    })
+
+
+# ===============================
+# Engines
+# ===============================
+class PandasEngine:
+    """Evaluates queries with boolean masks over the store frame"""
+
+    name = 'pandas'
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.memo = BoundedLRU(QUERY_MEMO_SIZE, QUERY_MEMO_BYTES)
+
+    def _mask(self, conditions):
+        return _conditions_mask(self.frame, conditions)
+
+    def positions(self, conditions):
+        return np.flatnonzero(self._mask(conditions))
+
+    def count(self, conditions):
+        if self.frame.empty:
+            return 0
+        return int(self._mask(conditions).sum())
+
+    def group_by(self, conditions, dims):
+        if self.frame.empty:
+            return pd.DataFrame(columns=[*dims, COUNT_COLUMN])
+        selected = self.frame.loc[self._mask(conditions), list(dims)]
+        return (
+            selected.groupby(list(dims), observed=True, dropna=False)
+            .size()
+            .reset_index(name=COUNT_COLUMN)
+        )
+
+    def rows(self, conditions, columns):
+        if self.frame.empty:
+            return pd.DataFrame(columns=list(columns))
+        return self.frame.loc[self._mask(conditions), list(columns)].reset_index(drop=True)
+
+
+class BitmapEngine:
+    """Evaluates queries as bitwise AND/OR over precomputed per-value bitsets"""
+
+    name = 'bitmap'
+
+    def __init__(self, frame):
+        self.frame = frame
+        self.memo = BoundedLRU(QUERY_MEMO_SIZE, QUERY_MEMO_BYTES)
+        self._indexes = {}
+        self._condition_bits = BoundedLRU(CONDITION_BITSET_CACHE)
+        self._lock = threading.Lock()
+
+    def _index(self, column):
+        """(distinct values, one bitset per value) for an indexed column, built on first use"""
+        with self._lock:
+            if column not in self._indexes:
+                codes, uniques = pd.factorize(self.frame[column], sort=True)
+                bitsets = [_pack(codes == code) for code in range(len(uniques))]
+                self._indexes[column] = (pd.Index(uniques), bitsets)
+            return self._indexes[column]
+
+    def _bits(self, column, op, value):
+        if column in BITMAP_COLUMNS:
+            # OR the bitsets of every distinct value that satisfies the condition
+            uniques, bitsets = self._index(column)
+            selected = np.flatnonzero(_compare(uniques, op, value))
+            if not len(selected):
+                return _pack(np.zeros(len(self.frame), dtype=bool))
+            return reduce(np.bitwise_or, (bitsets[i] for i in selected))
+        return self._condition_bits.get_or_build(
+            (column, op, value),
+            lambda: _pack(_compare(self.frame[column], op, value))
+        )
+
+    def positions(self, conditions):
+        if not conditions:
+            return np.arange(len(self.frame))
+        bits = reduce(np.bitwise_and, (self._bits(*condition) for condition in conditions))
+        return np.flatnonzero(_unpack(bits, len(self.frame)))
+
+    def count(self, conditions):
+        return len(self.positions(conditions))
+
+    def group_by(self, conditions, dims):
+        selected = _take(self.frame, dims, self.positions(conditions))
+        if selected.empty:
+            return pd.DataFrame(columns=[*dims, COUNT_COLUMN])
+        return (
+            selected.groupby(list(dims), observed=True, dropna=False)
+            .size()
+            .reset_index(name=COUNT_COLUMN)
+        )
+
+    def rows(self, conditions, columns):
+        return _take(self.frame, columns, self.positions(conditions))
+
+
+class DuckDBEngine:
+    """Evaluates queries as SQL on an embedded DuckDB view of the store frame"""
+
+    name = 'duckdb'
+
+    def __init__(self, frame):
+        import duckdb
+
+        self.frame = frame
+        self.connection = duckdb.connect()
+        self.connection.register('crimes', frame)
+        self._lock = threading.Lock()
+        self.memo = BoundedLRU(QUERY_MEMO_SIZE, QUERY_MEMO_BYTES)
+
+    @staticmethod
+    def _where(conditions):
+        clauses, params = [], []
+        for column, op, value in conditions:
+            name = f'"{column}"'
+            if op == 'in':
+                if not value:
+                    clauses.append('false')
+                    continue
+                clauses.append(f"{name} IN ({', '.join('?' * len(value))})")
+                params.extend(_param(v) for v in value)
+            elif op == 'notnull':
+                clauses.append(f"{name} IS NOT NULL")
+            else:
+                clauses.append(f"{name} {op} ?")
+                params.append(_param(value))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return where, params
+
+    def _execute(self, sql, params):
+        # One connection per store; DuckDB parallelizes inside each query
+        with self._lock:
+            return self.connection.execute(sql, params).df()
+
+    def positions(self, conditions):
+        return np.flatnonzero(_conditions_mask(self.frame, conditions))
+
+    def count(self, conditions):
+        where, params = self._where(conditions)
+        result = self._execute(f"SELECT count(*) AS {COUNT_COLUMN} FROM crimes{where}", params)
+        return int(result[COUNT_COLUMN].iloc[0])
+
+    def group_by(self, conditions, dims):
+        where, params = self._where(conditions)
+        columns = ', '.join(f'"{dim}"' for dim in dims)
+        return self._execute(
+            f"SELECT {columns}, count(*) AS {COUNT_COLUMN} FROM crimes{where} "
+            f"GROUP BY {columns} ORDER BY {columns}",
+            params
+        )
+
+    def rows(self, conditions, columns):
+        where, params = self._where(conditions)
+        selected = ', '.join(f'"{column}"' for column in columns)
+        return self._execute(f"SELECT {selected} FROM crimes{where}", params)
+
+
+def _build_engine(frame):
+    """The configured engine; bitmap when DuckDB is unavailable, pandas for an empty store"""
+    if frame.empty or QUERY_ENGINE == 'pandas':
+        return PandasEngine(frame)
+    if QUERY_ENGINE == 'duckdb':
+        try:
+            return DuckDBEngine(frame)
+        except ImportError:
+            pass
+    return BitmapEngine(frame)
+
+
+def get_query_engine():
+    """Return the query engine for the current crime store snapshot (built once per refresh)"""
+    return get_crime_store().derived('query_engine', _build_engine)
+
+
+# ===============================
+# Query Builder
+# ===============================
+class CrimeQuery:
+    """Immutable conjunction of filters; each filter method returns a new query"""
+
+    def __init__(self, engine, conditions=()):
+        self.engine = engine
+        self.conditions = tuple(conditions)
+
+    @property
+    def key(self):
+        """Canonical, hashable description of the filters (order-independent)"""
+        return tuple(sorted(self.conditions, key=repr))
+
+    def where(self, column, op, value=None):
+        """Add a raw condition: op is 'in', 'notnull' or one of COMPARISONS"""
+        if op == 'in':
+            value = tuple(sorted({_param(v) for v in value}, key=repr))
+        elif op != 'notnull':
+            if op not in COMPARISONS:
+                raise ValueError(f"Unsupported operator: {op}")
+            value = _param(value)
+        return CrimeQuery(self.engine, self.conditions + ((column, op, value),))
+
+    def years(self, start, end=None, column='year'):
+        """Keep an inclusive year range, or a list of years when `end` is omitted"""
+        if end is None and not isinstance(start, (int, np.integer)):
+            return self.where(column, 'in', [int(year) for year in start])
+        end = start if end is None else end
+        return self.where(column, '>=', int(start)).where(column, '<=', int(end))
+
+    def alcaldias(self, *names):
+        return self.where('alcaldia_normalized', 'in', [str(name) for name in names])
+
+    def violence(self, *categories):
+        return self.where('violence_category', 'in', [str(category) for category in categories])
+
+    def agencias(self, *agencias):
+        return self.where('agencia', 'in', [str(agencia) for agencia in agencias])
+
+    def dates(self, start=None, end=None, column='fecha_hecho'):
+        """Keep start <= column < end (either bound optional)"""
+        query = self
+        if start is not None:
+            query = query.where(column, '>=', pd.Timestamp(start))
+        if end is not None:
+            query = query.where(column, '<', pd.Timestamp(end))
+        return query
+
+    def located(self):
+        """Keep crimes with usable (non-null, non-zero) coordinates"""
+        query = self
+        for column in ('latitud', 'longitud'):
+            query = query.where(column, 'notnull').where(column, '!=', 0)
+        return query
+
+    def _memoized(self, key, builder):
+        return self.engine.memo.get_or_build((key, self.key), builder)
+
+    def count(self):
+        """Number of matching crimes"""
+        return self._memoized(('count',), lambda: self.engine.count(self.conditions))
+
+    def group_by(self, *dims):
+        """Matching crimes counted per combination of `dims` (DataFrame with a 'crimes' column)"""
+        counts = self._memoized(('group_by', dims), lambda: self.engine.group_by(self.conditions, dims))
+        return counts.copy()
+
+    def rows(self, *columns):
+        """
+        Only `columns` of the matching rows. The frame is shared with other
+        sessions: add or replace columns freely, never modify values in place.
+        """
+        rows = self._memoized(('rows', columns), lambda: self.engine.rows(self.conditions, columns))
+        return rows.copy(deep=False)
+
+    def positions(self):
+        """Row positions of the matching crimes in the store frame (read-only array)"""
+        positions = self._memoized(('positions',), lambda: self.engine.positions(self.conditions))
+        positions.flags.writeable = False
+        return positions
+
+
+def crime_query():
+    """Start an unfiltered query over the shared crime store"""
+    return CrimeQuery(get_query_engine())
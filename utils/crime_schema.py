@@ -0,0 +1,84 @@
+"""
+crime_schema.py - Compact dtype schema for the FGJ crime table
+
+The raw rows come back as Python strings and float64 numbers. Almost every
+string column has a few dozen distinct values at most, so storing them as
+pandas categoricals and the calendar parts as small integers shrinks the
+shared store several times over and makes group-bys on them much faster.
+
+Calendar parts use the nullable integer dtypes (`Int8`/`Int16`) because rows
+with an unparseable `fecha_hecho` or `hora` keep a missing value.
+
+Group-bys on categorical columns should pass `observed=True`, otherwise
+pandas emits a row for every category, including ones filtered out.
+
+Usage:
+    from utils.crime_schema import apply_crime_schema, memory_report
+    df = apply_crime_schema(df)
+    print(memory_report(df))
+"""
+
+import pandas as pd
+
+# ===============================
+# Schema
+# ===============================
+CRIME_SCHEMA = {
+    'fecha_hecho': 'datetime64[ns]',
+    'date': 'datetime64[ns]',
+    'anio_hecho': 'Int16',
+    'year': 'Int16',
+    'month': 'Int8',
+    'day_of_week': 'Int8',
+    'hour': 'Int8',
+    'latitud': 'float32',
+    'longitud': 'float32',
+    'alcaldia_hecho': 'category',
+    'alcaldia_normalized': 'category',
+    'delito': 'category',
+    'agencia': 'category',
+    'violence_category': 'category',
+    'cuadrante_id': 'category',
+}
+
+
+# ===============================
+# Conversion
+# ===============================
+def _convert(series, dtype):
+    if dtype.startswith('datetime64'):
+        return pd.to_datetime(series, errors='coerce')
+    if dtype.startswith('float'):
+        return pd.to_numeric(series, errors='coerce').astype(dtype)
+    if dtype.startswith('Int'):
+        return pd.to_numeric(series, errors='coerce').round().astype(dtype)
+    return series.astype(dtype)
+
+
+def apply_crime_schema(df, schema=CRIME_SCHEMA):
+    """Cast every column of `df` listed in `schema` to its compact dtype"""
+    for column, dtype in schema.items():
+        if column in df.columns and str(df[column].dtype) != dtype:
+            df[column] = _convert(df[column], dtype)
+    return df
+
+
+# ===============================
+# Memory Report
+# ===============================
+def memory_report(df):
+    """Return a per-column DataFrame of dtype and memory usage (MB), largest first"""
+    usage = df.memory_usage(deep=True, index=False)
+    report = pd.DataFrame({
+        'column': usage.index,
+        'dtype': [str(df[c].dtype) for c in usage.index],
+        'memory_mb': (usage.values / 1024 ** 2).round(2),
+    })
+    report = report.sort_values('memory_mb', ascending=False).reset_index(drop=True)
+
+    total = pd.DataFrame([{
+        'column': 'TOTAL',
+        'dtype': '',
+        'memory_mb': round(usage.sum() / 1024 ** 2, 2),
+    }])
+    return pd.concat([report, total], ignore_index=True)
@@ -0,0 +1,225 @@
+"""
+crime_store.py - Shared FGJ crime store
+
+Fetches the FGJ table once per process, derives the calendar, alcaldía and
+violence columns once, tags every crime with its cuadrante, casts everything to the compact schema in
+utils/crime_schema.py, and hands every page a read-only projection of the
+result instead of letting each page download and post-process its own copy.
+
+Usage in your pages:
+    from utils.crime_store import get_crime_data, get_crime_partitions
+    df = get_crime_data(['alcaldia_normalized', 'year', 'violence_category'])
+    df_2024 = get_crime_partitions('anio_hecho', [2023, 2024], ['delito', 'latitud'])
+"""
+
+import importlib
+import logging
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+from dotenv import load_dotenv
+
+from utils.alcaldia_names import normalize_alcaldia_series
+from utils.crime_schema import apply_crime_schema, memory_report
+from utils.cuadrante_index import get_cuadrante_index
+from utils.snapshot_cache import sync_snapshot
+from utils.violence import classify_violence
+
+# ===============================
+# Configuration
+# ===============================
+load_dotenv()
+
+SUPABASE_TABLE = os.getenv("SUPABASE_TABLE", "FGJ")
+
+# Raw FGJ columns pulled from Supabase (union of what the pages use)
+RAW_COLUMNS = [
+    'alcaldia_hecho', 'anio_hecho', 'fecha_hecho', 'hora_hecho', 'hora',
+    'delito', 'agencia', 'latitud', 'longitud'
+]
+
+# Columns derived once at load time
+DERIVED_COLUMNS = [
+    'year', 'month', 'day_of_week', 'date', 'hour',
+    'alcaldia_normalized', 'violence_category', 'cuadrante_id'
+]
+
+STORE_TTL = 3600
+
+logger = logging.getLogger(__name__)
+
+# ===============================
+# Helper Functions
+# ===============================
+def fetch_crime_rows(columns=RAW_COLUMNS):
+    """Return the raw FGJ rows from the local snapshot, synced with Supabase"""
+    return sync_snapshot(SUPABASE_TABLE, columns)
+
+
+def _cuadrante_tag_errors():
+    """Failures that leave crimes untagged: shapely missing, bad geometries, cuadrantes unreachable or malformed"""
+    errors = [ImportError, OSError, KeyError, ValueError, TypeError]
+    for module, name in (('shapely.errors', 'ShapelyError'), ('postgrest.exceptions', 'APIError'), ('httpx', 'HTTPError')):
+        try:
+            errors.append(getattr(importlib.import_module(module), name))
+        except (ImportError, AttributeError):
+            pass
+    return tuple(errors)
+
+
+CUADRANTE_TAG_ERRORS = _cuadrante_tag_errors()
+
+
+def tag_cuadrantes(df):
+    """Return the cuadrante id of every crime, or all None if the index is unavailable"""
+    try:
+        return get_cuadrante_index().assign(df['longitud'], df['latitud'])
+    except CUADRANTE_TAG_ERRORS:
+        # Pages fall back to no cuadrante; log why, so a broken join does not go unnoticed
+        logger.warning("Crimes left without cuadrante tags", exc_info=True)
+        return None
+
+
+def prepare_crime_frame(df):
+    """Derive calendar, hour, alcaldía, violence and cuadrante columns from raw FGJ rows"""
+    if df.empty:
+        return df
+
+    df['fecha_hecho'] = pd.to_datetime(df['fecha_hecho'], errors='coerce')
+    df['year'] = df['fecha_hecho'].dt.year
+    df['month'] = df['fecha_hecho'].dt.month
+    df['day_of_week'] = df['fecha_hecho'].dt.dayofweek
+    df['date'] = df['fecha_hecho'].dt.normalize()
+
+    # Use 'hora' column if available (should be numeric)
+    if 'hora' in df.columns:
+        df['hour'] = pd.to_numeric(df['hora'], errors='coerce')
+        # If values are 1-24, convert to 0-23
+        if df['hour'].max() == 24:
+            df['hour'] = df['hour'].replace(24, 0)
+        # Ensure values are in 0-23 range
+        df['hour'] = df['hour'].where(df['hour'].between(0, 23))
+    else:
+        df['hour'] = None
+
+    df['latitud'] = pd.to_numeric(df['latitud'], errors='coerce')
+    df['longitud'] = pd.to_numeric(df['longitud'], errors='coerce')
+
+    df['alcaldia_normalized'] = normalize_alcaldia_series(df['alcaldia_hecho'])
+    df['violence_category'] = classify_violence(df['delito'])
+    df = df[df['alcaldia_normalized'].notna()].reset_index(drop=True)
+    df['cuadrante_id'] = tag_cuadrantes(df)
+
+    return apply_crime_schema(df)
+
+
+# ===============================
+# Crime Store
+# ===============================
+class CrimeStore:
+    """Process-wide, read-only holder for the preprocessed FGJ table"""
+
+    def __init__(self, frame):
+        self._frame = frame
+        self._derived = {}
+        self._lock = threading.Lock()
+        self.loaded_at = datetime.now()
+
+    def __len__(self):
+        return len(self._frame)
+
+    @property
+    def columns(self):
+        return list(self._frame.columns)
+
+    @property
+    def empty(self):
+        return self._frame.empty
+
+    def project(self, columns=None):
+        """
+        Return a view of the store restricted to `columns`.
+
+        The returned frame shares memory with the store. Pages may add
+        columns to it or filter it, but must never modify values in place.
+        """
+        if columns is None:
+            return self._frame.copy(deep=False)
+        if self._frame.empty:
+            return pd.DataFrame(columns=list(columns))
+
+        missing = [c for c in columns if c not in self._frame.columns]
+        if missing:
+            raise KeyError(f"Columns not in crime store: {missing}")
+
+        return pd.DataFrame({c: self._frame[c] for c in columns}, copy=False)
+
+    def partition(self, column, values, columns=None):
+        """
+        Return the rows whose `column` is one of `values`, projected to `columns`.
+
+        Row positions per distinct value are indexed once per snapshot, so a
+        selection is assembled by concatenating the matching partitions
+        instead of masking the whole table, and no combination of values is
+        ever stored twice.
+        """
+        partitions = self.derived(f'partitions:{column}', lambda frame: _partition_positions(frame, column))
+        parts = [partitions[value] for value in sorted(set(values)) if value in partitions]
+        positions = np.concatenate(parts) if parts else np.array([], dtype=np.intp)
+        return self.project(columns).take(positions).reset_index(drop=True)
+
+    def memory_report(self):
+        """Per-column dtype and memory usage of the stored frame"""
+        return memory_report(self._frame)
+
+    def derived(self, name, builder):
+        """Build `builder(frame)` once per store snapshot and reuse it afterwards"""
+        with self._lock:
+            if name not in self._derived:
+                self._derived[name] = builder(self._frame)
+            return self._derived[name]
+
+
+def _partition_positions(frame, column):
+    """Map each distinct value of `column` to the positions of its rows"""
+    if frame.empty or column not in frame.columns:
+        return {}
+    return frame.groupby(column, observed=True, sort=True).indices
+
+
+@st.cache_resource(ttl=STORE_TTL, show_spinner="📡 Cargando datos de delitos...")
+def get_crime_store():
+    """Sync and preprocess FGJ once per process; shared across all sessions"""
+    raw_df = fetch_crime_rows()
+    return CrimeStore(prepare_crime_frame(raw_df))
+
+
+def get_crime_data(columns=None):
+    """Return a read-only projection of the shared crime table"""
+    try:
+        return get_crime_store().project(columns)
+    except KeyError:
+        raise
+    except Exception as e:
+        st.error(f"Error loading data: {e}")
+        return pd.DataFrame(columns=list(columns or []))
+
+
+def get_crime_partitions(column, values, columns=None):
+    """Return a read-only projection of the rows whose `column` is in `values`"""
+    try:
+        return get_crime_store().partition(column, values, columns)
+    except KeyError:
+        raise
+    except Exception as e:
+        st.error(f"Error loading data: {e}")
+        return pd.DataFrame(columns=list(columns or []))
+
+
+def refresh_crime_store():
+    """Drop the shared store so the next access reloads it from Supabase"""
+    get_crime_store.clear()
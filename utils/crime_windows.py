@@ -0,0 +1,133 @@
+"""
+crime_windows.py - Per-alcaldía daily count series for rolling-window KPIs
+
+The "last 30 days" section of the alcaldía panel needs the window total, the
+previous window for comparison, the violence split, crimes per hour, the
+most common delitos and the busiest day. Instead of masking the alcaldía's
+rows on fecha_hecho at every rerun, each alcaldía gets a dense daily series
+built once per crime store snapshot:
+
+    cumulative total / violent / non-violent counts per day
+    cumulative counts per (day, hour)
+    crime days sorted by (delito, day) for per-delito window counts
+
+A window sum is the difference of two cumulative rows and per-delito counts
+are two binary searches per delito, so the cost does not grow with history.
+
+Usage:
+    from utils.crime_windows import get_daily_series
+    series = get_daily_series('TLALPAN')
+    window = series.window(days=30)
+    window['total'], window['previous_total'], window['delitos'].head(10)
+"""
+
+import numpy as np
+import pandas as pd
+
+from utils.crime_store import get_crime_store
+
+# Columns the daily series are built from
+WINDOW_COLUMNS = ['date', 'alcaldia_normalized', 'violence_category', 'hour', 'delito']
+
+
+def _cumulative(counts):
+    """Prefix sums with a leading zero row, so sum(lo:hi) = cum[hi] - cum[lo]"""
+    zeros = np.zeros((1, *counts.shape[1:]), dtype=np.int64)
+    return np.concatenate([zeros, np.cumsum(counts, axis=0, dtype=np.int64)])
+
+
+# ===============================
+# Daily Series
+# ===============================
+class DailySeries:
+    """Dense daily counts of one alcaldía, held as cumulative sums"""
+
+    def __init__(self, frame):
+        self.start = frame['date'].min()
+        self.end = frame['date'].max()
+        days = (frame['date'] - self.start).dt.days.to_numpy()
+        self.length = int(days.max()) + 1
+
+        self.daily = np.bincount(days, minlength=self.length)
+        self._totals = _cumulative(self.daily)
+
+        violence = frame['violence_category']
+        self._violent = _cumulative(
+            np.bincount(days[(violence == 'violent').to_numpy()], minlength=self.length)
+        )
+        self._non_violent = _cumulative(
+            np.bincount(days[(violence == 'non_violent').to_numpy()], minlength=self.length)
+        )
+
+        hours = pd.to_numeric(frame['hour'], errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+        valid = ~np.isnan(hours)
+        by_hour = np.bincount(
+            days[valid] * 24 + hours[valid].astype(int), minlength=self.length * 24
+        ).reshape(self.length, 24)
+        self._hours = _cumulative(by_hour)
+
+        # One sorted key per crime: delito code * length + day
+        codes, delitos = pd.factorize(frame['delito'])
+        known = codes >= 0
+        self.delitos = pd.Index(np.asarray(delitos, dtype=object))
+        self._delito_keys = np.sort(codes[known].astype(np.int64) * self.length + days[known])
+
+    def _bounds(self, end, days):
+        """Clipped day positions [lo, hi) of the `days` days before position `end`"""
+        return max(end - days, 0), max(min(end, self.length), 0)
+
+    @staticmethod
+    def _sum(cumulative, lo, hi):
+        return cumulative[hi] - cumulative[lo]
+
+    def delito_counts(self, lo, hi):
+        """Crimes per delito between day positions [lo, hi), most common first"""
+        offsets = np.arange(len(self.delitos), dtype=np.int64) * self.length
+        counts = (
+            np.searchsorted(self._delito_keys, offsets + hi)
+            - np.searchsorted(self._delito_keys, offsets + lo)
+        )
+        counts = pd.Series(counts, index=self.delitos)
+        return counts[counts > 0].sort_values(ascending=False, kind='stable')
+
+    def window(self, days=30):
+        """KPIs of the last `days` days of data and of the `days` days before them"""
+        lo, hi = self._bounds(self.length, days)
+        previous_lo, previous_hi = self._bounds(self.length - days, days)
+
+        daily = pd.Series(
+            self.daily[lo:hi],
+            index=pd.date_range(self.start + pd.Timedelta(days=lo), periods=hi - lo, freq='D')
+        )
+        busiest = int(daily.to_numpy().argmax()) if len(daily) else None
+
+        return {
+            'start': self.end - pd.Timedelta(days=days - 1),
+            'end': self.end,
+            'total': int(self._sum(self._totals, lo, hi)),
+            'previous_total': int(self._sum(self._totals, previous_lo, previous_hi)),
+            'violent': int(self._sum(self._violent, lo, hi)),
+            'non_violent': int(self._sum(self._non_violent, lo, hi)),
+            'hourly': self._sum(self._hours, lo, hi),
+            'delitos': self.delito_counts(lo, hi),
+            'daily': daily,
+            'busiest_day': daily.index[busiest] if busiest is not None else None,
+            'busiest_day_count': int(daily.iloc[busiest]) if busiest is not None else 0,
+        }
+
+
+def build_daily_series(frame):
+    """One DailySeries per alcaldía of the store frame"""
+    if frame.empty:
+        return {}
+    frame = frame.loc[frame['date'].notna(), WINDOW_COLUMNS]
+    return {
+        str(alcaldia): DailySeries(group)
+        for alcaldia, group in frame.groupby('alcaldia_normalized', observed=True)
+        if not group.empty
+    }
+
+
+def get_daily_series(alcaldia):
+    """Return the DailySeries of `alcaldia` for the current store snapshot (None if it has no data)"""
+    return get_crime_store().derived('daily_series', build_daily_series).get(alcaldia)
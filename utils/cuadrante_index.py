@@ -0,0 +1,91 @@
+"""
+cuadrante_index.py - Long-lived spatial index over the police cuadrantes
+
+Takes the cuadrante polygons parsed by utils/cuadrantes.py, prepares them
+for fast predicates and puts them in a Shapely STRtree. `assign(lon, lat)` then maps whole coordinate
+arrays to cuadrante ids in one vectorized query, so crimes can be tagged
+with their cuadrante when the crime store loads and no page has to run a
+live spatial join.
+
+Requires shapely>=2.0 (already pulled in by geopandas).
+
+Usage:
+    from utils.cuadrante_index import get_cuadrante_index
+    index = get_cuadrante_index()
+    df['cuadrante_id'] = index.assign(df['longitud'], df['latitud'])
+"""
+
+import numpy as np
+import streamlit as st
+
+from utils.cuadrantes import load_cuadrantes_table
+
+# ===============================
+# Configuration
+# ===============================
+INDEX_TTL = 3600
+
+
+# ===============================
+# Index
+# ===============================
+class CuadranteIndex:
+    """Prepared cuadrante polygons in an STRtree, queried with vectorized point lookups"""
+
+    def __init__(self, ids, alcaldias, geometries):
+        import shapely
+
+        self.ids = np.asarray(ids, dtype=object)
+        self.alcaldias = np.asarray(alcaldias, dtype=object)
+        self.geometries = np.asarray(geometries, dtype=object)
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+
+    @classmethod
+    def from_frame(cls, cuadrantes_df):
+        """Build the index from the shared cuadrantes table (see utils/cuadrantes.py)"""
+        ids, alcaldias, geometries = [], [], []
+        if 'geometry' in cuadrantes_df.columns:
+            for cuadrante_id, alcaldia, geometry in zip(
+                cuadrantes_df['id'], cuadrantes_df['alcaldia_normalized'], cuadrantes_df['geometry']
+            ):
+                if geometry is None:
+                    continue
+                ids.append(str(cuadrante_id))
+                alcaldias.append(alcaldia)
+                geometries.append(geometry)
+
+        return cls(ids, alcaldias, geometries)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def assign(self, lon, lat):
+        """
+        Return the cuadrante id containing each (lon, lat) point.
+
+        Points outside every cuadrante (or with missing coordinates) get
+        None. If polygons overlap, the first matching cuadrante wins.
+        """
+        import shapely
+
+        lon = np.asarray(lon, dtype='float64')
+        lat = np.asarray(lat, dtype='float64')
+        result = np.full(len(lon), None, dtype=object)
+        if len(self) == 0 or len(lon) == 0:
+            return result
+
+        valid = ~(np.isnan(lon) | np.isnan(lat))
+        positions = np.flatnonzero(valid)
+        points = shapely.points(lon[valid], lat[valid])
+
+        point_idx, tree_idx = self.tree.query(points, predicate='within')
+        point_idx, first = np.unique(point_idx, return_index=True)
+        result[positions[point_idx]] = self.ids[tree_idx[first]]
+        return result
+
+
+@st.cache_resource(ttl=INDEX_TTL, show_spinner=False)
+def get_cuadrante_index():
+    """Build the cuadrante index once per process and cuadrantes refresh"""
+    return CuadranteIndex.from_frame(load_cuadrantes_table())
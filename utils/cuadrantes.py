@@ -0,0 +1,165 @@
+"""
+cuadrantes.py - Shared loader and geometry parser for the cuadrantes table
+
+`geo_shape` arrives either as JSON text or as a Python-literal string
+("{'type': 'Polygon', ...}"). Every value goes through a fast JSON decoder
+first (orjson when installed), then the same decoder with single quotes
+swapped for double quotes, and only the rows that still fail fall back to
+`ast.literal_eval`.
+
+Parsed polygons are stored on disk as WKB next to the crime snapshot, so
+later loads rebuild Shapely geometries from binary instead of re-parsing
+coordinate text. The cache is refreshed every CUADRANTES_CACHE_DAYS.
+
+Usage:
+    from utils.cuadrantes import load_cuadrantes_table
+    cuadrantes_df = load_cuadrantes_table()
+    cuadrantes_df[['id', 'alcaldia_normalized', 'geo_shape', 'geometry']]
+"""
+
+import ast
+import json
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from utils.alcaldia_names import normalize_alcaldia_series
+from utils.snapshot_cache import SNAPSHOT_DIR, SNAPSHOT_ERRORS
+from utils.supabase_fetcher import get_supabase_client
+
+try:
+    import orjson
+    _json_loads = orjson.loads
+except ImportError:
+    _json_loads = json.loads
+
+# ===============================
+# Configuration
+# ===============================
+SUPABASE_TABLE_CUADRANTS = "cuadrantes"
+CUADRANTES_CACHE_DAYS = 7
+
+
+def geometry_cache_path():
+    return os.path.join(SNAPSHOT_DIR, f"{SUPABASE_TABLE_CUADRANTS}.geometry.parquet")
+
+
+# ===============================
+# Parsing
+# ===============================
+def parse_geo_shape(value):
+    """Parse one `geo_shape` value into a GeoJSON geometry dict, or None if it is unusable"""
+    if isinstance(value, dict):
+        return value
+    if not isinstance(value, str) or not value.strip():
+        return None
+
+    text = value.strip()
+    for candidate in (text, text.replace("'", '"')):
+        try:
+            parsed = _json_loads(candidate)
+            break
+        except ValueError:
+            continue
+    else:
+        try:
+            parsed = ast.literal_eval(text)
+        except (ValueError, SyntaxError):
+            return None
+
+    return parsed if isinstance(parsed, dict) else None
+
+
+def to_geometries(geo_shapes):
+    """Convert GeoJSON dicts to a list of Shapely geometries (None where invalid)"""
+    from shapely.geometry import shape
+
+    geometries = []
+    for geo_shape in geo_shapes:
+        try:
+            geometries.append(shape(geo_shape) if geo_shape and 'coordinates' in geo_shape else None)
+        except Exception:
+            geometries.append(None)
+    return geometries
+
+
+# ===============================
+# WKB Disk Cache
+# ===============================
+def _read_geometry_cache():
+    path = geometry_cache_path()
+    if not os.path.exists(path):
+        return None
+    age = datetime.now() - datetime.fromtimestamp(os.path.getmtime(path))
+    if age > timedelta(days=CUADRANTES_CACHE_DAYS):
+        return None
+
+    try:
+        import shapely
+        from shapely.geometry import mapping
+
+        cuadrantes_df = pd.read_parquet(path)
+        geometries = shapely.from_wkb(cuadrantes_df.pop('geo_wkb').to_numpy())
+    except SNAPSHOT_ERRORS:
+        return None
+
+    cuadrantes_df['geometry'] = list(geometries)
+    cuadrantes_df['geo_shape'] = [mapping(g) if g is not None else None for g in geometries]
+    return cuadrantes_df
+
+
+def _write_geometry_cache(cuadrantes_df):
+    import shapely
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    cache_df = cuadrantes_df.drop(columns=['geo_shape', 'geometry'])
+    cache_df['geo_wkb'] = shapely.to_wkb(cuadrantes_df['geometry'].to_numpy())
+
+    tmp_path = geometry_cache_path() + ".tmp"
+    cache_df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, geometry_cache_path())
+
+
+# ===============================
+# Loading
+# ===============================
+def fetch_cuadrantes():
+    """Fetch the cuadrantes table from Supabase and parse `geo_shape` (plus Shapely geometries if available)"""
+    res = get_supabase_client().table(SUPABASE_TABLE_CUADRANTS).select("*").execute()
+    cuadrantes_df = pd.DataFrame(res.data)
+    if cuadrantes_df.empty:
+        return cuadrantes_df
+
+    if 'geo_shape' not in cuadrantes_df.columns:
+        cuadrantes_df['geo_shape'] = None
+    cuadrantes_df['geo_shape'] = cuadrantes_df['geo_shape'].map(parse_geo_shape)
+
+    try:
+        cuadrantes_df['geometry'] = to_geometries(cuadrantes_df['geo_shape'])
+    except ImportError:
+        cuadrantes_df['geometry'] = None
+    return cuadrantes_df
+
+
+def load_cuadrantes_table(use_cache=True):
+    """
+    Return the cuadrantes table with parsed `geo_shape` dicts, Shapely
+    `geometry` objects and `alcaldia_normalized`.
+
+    Reads the WKB cache when it is fresh; otherwise fetches from Supabase and
+    rewrites the cache (write failures are ignored).
+    """
+    cuadrantes_df = _read_geometry_cache() if use_cache else None
+
+    if cuadrantes_df is None:
+        cuadrantes_df = fetch_cuadrantes()
+        if cuadrantes_df.empty:
+            return cuadrantes_df
+        try:
+            _write_geometry_cache(cuadrantes_df)
+        except SNAPSHOT_ERRORS:
+            pass
+
+    cuadrantes_df['alcaldia_normalized'] = normalize_alcaldia_series(cuadrantes_df['alcaldia'])
+    return cuadrantes_df
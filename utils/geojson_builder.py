@@ -0,0 +1,115 @@
+"""
+geojson_builder.py - Columnar GeoJSON helpers for the map pages
+
+Builds Point FeatureCollections and grouped counts straight from DataFrame
+columns instead of walking rows with `iterrows()`. Every column is converted
+to a plain Python list once, so building tens of thousands of features costs
+one pass over zipped lists rather than one pandas Series per row.
+
+Usage:
+    from utils.geojson_builder import point_feature_collections, grouped_counts
+    collections = point_feature_collections(
+        df, 'alcaldia_normalized',
+        {'delito': text_column(df['delito'], 'Unknown')}
+    )
+"""
+
+import numpy as np
+import pandas as pd
+
+# ===============================
+# Configuration
+# ===============================
+# ~0.1 m precision; keeps the embedded JSON small
+COORDINATE_DECIMALS = 6
+
+
+# ===============================
+# Column Helpers
+# ===============================
+def text_column(series, fill):
+    """Return `series` as a list of str, with missing values replaced by `fill`"""
+    values = series.astype(object)
+    return values.where(series.notna(), fill).astype(str).tolist()
+
+
+def date_column(series, fmt='%Y-%m-%d', fill='N/A'):
+    """Return a datetime Series formatted as a list of str, with missing values replaced by `fill`"""
+    return series.dt.strftime(fmt).fillna(fill).tolist()
+
+
+def coordinate_column(series):
+    """Return a coordinate Series as a list of rounded Python floats"""
+    return np.round(series.to_numpy(dtype='float64'), COORDINATE_DECIMALS).tolist()
+
+
+# ===============================
+# Feature Builders
+# ===============================
+def point_features(lon, lat, properties):
+    """Build GeoJSON Point features from coordinate lists and {name: list} properties"""
+    names = list(properties)
+    columns = [properties[name] for name in names]
+    return [
+        {
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [x, y]},
+            'properties': dict(zip(names, values))
+        }
+        for x, y, *values in zip(lon, lat, *columns)
+    ]
+
+
+def point_feature_collections(df, group_column, properties, lon_column='longitud', lat_column='latitud'):
+    """
+    Split the points in `df` into one FeatureCollection per value of `group_column`.
+
+    Args:
+        df: DataFrame with coordinate columns and `group_column`
+        group_column: column whose values key the returned dict
+        properties: {name: list} of per-row feature properties (same order as df)
+        lon_column, lat_column: coordinate columns
+
+    Returns:
+        {group value: FeatureCollection}; rows with a missing group are skipped
+    """
+    features = point_features(
+        coordinate_column(df[lon_column]),
+        coordinate_column(df[lat_column]),
+        properties
+    )
+
+    codes, groups = pd.factorize(df[group_column])
+    grouped = [[] for _ in range(len(groups))]
+    for code, feature in zip(codes.tolist(), features):
+        if code >= 0:
+            grouped[code].append(feature)
+
+    return {
+        str(group): {'type': 'FeatureCollection', 'features': group_features}
+        for group, group_features in zip(groups, grouped)
+    }
+
+
+# ===============================
+# Grouped Aggregation
+# ===============================
+def grouped_counts(df, group_column, value_column, top=None):
+    """
+    Count rows per (group, value) pair.
+
+    Returns {group: {value: count}} with values ordered from most to least
+    frequent, optionally keeping only the `top` most frequent per group.
+    """
+    counts = (
+        df.groupby([group_column, value_column], observed=True)
+        .size()
+        .sort_values(ascending=False, kind='stable')
+    )
+    if top is not None:
+        counts = counts.groupby(level=0, observed=True, sort=False).head(top)
+
+    result = {}
+    for (group, value), count in counts.items():
+        result.setdefault(group, {})[value] = int(count)
+    return result
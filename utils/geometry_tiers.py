@@ -0,0 +1,75 @@
+"""
+geometry_tiers.py - Zoom-dependent simplification of GeoJSON polygons
+
+Full-precision boundaries (alcaldias.json is ~770 KB) are far more detail
+than a browser needs at city zoom. Each tier pairs a topology-preserving
+Douglas-Peucker tolerance with coordinate quantization, so the JSON embedded
+in the map pages shrinks and serializes faster:
+
+    overview  - whole-city choropleths, small multiples     (~110 m, 4 decimals)
+    city      - default city view with all 16 alcaldías     (~20 m, 5 decimals)
+    detail    - drill-down into one alcaldía / cuadrantes   (~5 m, 6 decimals)
+
+Simplification uses Shapely when installed; without it geometries are only
+quantized.
+
+Usage:
+    from utils.geometry_tiers import simplify_feature_collection
+    geojson = simplify_feature_collection(geojson, 'city')
+"""
+
+import copy
+
+# ===============================
+# Tiers
+# ===============================
+# tolerance is in degrees (0.0001° ≈ 11 m in CDMX)
+GEOMETRY_TIERS = {
+    'overview': {'tolerance': 0.001, 'decimals': 4},
+    'city': {'tolerance': 0.0002, 'decimals': 5},
+    'detail': {'tolerance': 0.00005, 'decimals': 6},
+}
+
+DEFAULT_TIER = 'city'
+
+
+# ===============================
+# Helpers
+# ===============================
+def quantize_coordinates(coordinates, decimals):
+    """Round a (nested) GeoJSON coordinate array to `decimals` places"""
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return [round(value, decimals) for value in coordinates]
+    return [quantize_coordinates(part, decimals) for part in coordinates]
+
+
+def simplify_geometry(geometry, tier=DEFAULT_TIER):
+    """Return a simplified, quantized copy of a GeoJSON geometry dict"""
+    if not isinstance(geometry, dict) or 'coordinates' not in geometry:
+        return geometry
+
+    settings = GEOMETRY_TIERS[tier]
+    try:
+        from shapely.geometry import mapping, shape
+
+        simplified = shape(geometry).simplify(settings['tolerance'], preserve_topology=True)
+        if not simplified.is_empty:
+            geometry = mapping(simplified)
+    except Exception:
+        # No shapely (or a geometry it cannot handle): quantize only
+        pass
+
+    return {
+        'type': geometry['type'],
+        'coordinates': quantize_coordinates(geometry['coordinates'], settings['decimals'])
+    }
+
+
+def simplify_feature_collection(feature_collection, tier=DEFAULT_TIER):
+    """Return a copy of a FeatureCollection with every geometry simplified for `tier`"""
+    simplified = copy.copy(feature_collection)
+    simplified['features'] = [
+        {**feature, 'geometry': simplify_geometry(feature.get('geometry'), tier)}
+        for feature in feature_collection.get('features', [])
+    ]
+    return simplified
@@ -1,11 +1,13 @@
 import streamlit as st
+from utils.violence import classify_violence
 
 def format_number(n):
     return f"{n:,}"
 
 def calculate_kpis(df):
     total_incidents = len(df)
-    violent_incidents = df["delito"].str.contains("violencia", case=False).sum()
+    violence = df["violence_category"] if "violence_category" in df.columns else classify_violence(df["delito"])
+    violent_incidents = int((violence == "violent").sum())
     high_risk_borough = df["alcaldia_hecho"].value_counts().idxmax() if not df.empty else "N/A"
     active_boroughs = df["alcaldia_hecho"].nunique()
     return total_incidents, violent_incidents, high_risk_borough, active_boroughs
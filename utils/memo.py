@@ -0,0 +1,103 @@
+"""
+memo.py - Bounded, thread-safe LRU memo shared across Streamlit sessions
+
+Streamlit reruns the whole page for every widget change, including widgets
+that do not touch the filters (chart mode radios, dropdowns further down
+the page). Filtered views and their aggregates are therefore memoized per
+crime store snapshot, keyed by a canonical description of the filter
+state, and evicted least-recently-used once the cache holds `maxsize`
+entries or `max_bytes` of DataFrames.
+
+Usage:
+    from utils.memo import BoundedLRU, canonical
+    memo = BoundedLRU(maxsize=128)
+    result = memo.get_or_build(('rollup', canonical(filters)), lambda: cube.rollup('year'))
+"""
+
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+# ===============================
+# Keys
+# ===============================
+def canonical(value):
+    """
+    Turn a filter value into a hashable, order-independent key: ranges, lists,
+    tuples and sets become sorted tuples and dicts become sorted item tuples.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted(((k, canonical(v)) for k, v in value.items()), key=repr))
+    if isinstance(value, (list, tuple, set, frozenset, range)):
+        return tuple(sorted({canonical(v) for v in value}, key=repr))
+    if hasattr(value, 'item') and not isinstance(value, (pd.Timestamp, str)):
+        return value.item()
+    return value
+
+
+def frame_bytes(value):
+    """Approximate in-memory size of a DataFrame / Series (0 for anything else)"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=False).sum())
+    if isinstance(value, pd.Series):
+        # Series.memory_usage is already a scalar
+        return int(value.memory_usage(index=True, deep=False))
+    return 0
+
+
+# ===============================
+# Cache
+# ===============================
+class BoundedLRU:
+    """Least-recently-used memo bounded by entry count and (optionally) DataFrame bytes"""
+
+    def __init__(self, maxsize=128, max_bytes=None):
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_build(self, key, builder):
+        """Return the cached value for `key`, building (outside the lock) and storing it on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            self.misses += 1
+
+        value = builder()
+        size = frame_bytes(value)
+
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (value, size)
+                self._bytes += size
+            self._evict()
+        return value
+
+    def _evict(self):
+        while self._entries and (
+            len(self._entries) > self.maxsize
+            or (self.max_bytes is not None and self._bytes > self.max_bytes and len(self._entries) > 1)
+        ):
+            _, (_, size) = self._entries.popitem(last=False)
+            self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Entries, approximate bytes held and hit/miss counters"""
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
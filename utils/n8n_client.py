@@ -0,0 +1,172 @@
+"""
+n8n_client.py - Pooled, non-blocking client for the n8n chatbot webhook
+
+Prompts are posted from a small worker pool over one keep-alive
+requests.Session, so the Streamlit script thread never waits on the agent
+and every prompt reuses the pooled connection. Each prompt returns a
+`ChatJob` the page polls: `text` grows while the webhook streams (n8n
+"streaming" responses as NDJSON, or server-sent events) and `done` is set
+once the answer is complete. Plain JSON responses arrive in one piece.
+
+The caller passes a stable session id (one per browser session), so the
+agent's conversation memory on the n8n side carries over between prompts.
+
+Environment:
+    N8N_WEBHOOK_URL         webhook to post to (point it at a local stub to test)
+    N8N_TIMEOUT             seconds to wait for the agent (default 120)
+    N8N_WORKERS             prompts in flight per process (default 16); each
+                            holds a worker and a pooled connection until done
+
+Usage:
+    from utils.n8n_client import get_chat_client
+    job = get_chat_client().submit("¿Qué alcaldía tuvo más crímenes en 2023?", session_id)
+    job.text            # partial answer so far
+    job.wait()          # {"output": ...} once done
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+# ===============================
+# Configuration
+# ===============================
+N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL", "https://thebuttoncdmx.app.n8n.cloud/webhook/thaleschat")
+N8N_TIMEOUT = float(os.getenv("N8N_TIMEOUT", "120"))
+N8N_CONNECT_TIMEOUT = 10
+N8N_WORKERS = int(os.getenv("N8N_WORKERS", "16"))
+
+STREAMING_TYPES = ('application/x-ndjson', 'application/jsonl', 'text/event-stream')
+
+
+def _chunk_text(line):
+    """Text carried by one streamed line (n8n NDJSON item, SSE data or plain JSON), or ''"""
+    line = line.strip()
+    if line.startswith('data:'):
+        line = line[len('data:'):].strip()
+    if not line or line == '[DONE]':
+        return ''
+    try:
+        chunk = json.loads(line)
+    except ValueError:
+        return line
+    if isinstance(chunk, dict):
+        if chunk.get('type') in ('begin', 'end', 'error'):
+            return ''
+        return str(chunk.get('content') or chunk.get('output') or '')
+    return str(chunk)
+
+
+def _response_output(response):
+    """The answer of a non-streamed webhook response ({"output": ...}, [{"output": ...}] or text)"""
+    try:
+        result = response.json()
+    except ValueError:
+        return response.text
+    if isinstance(result, list) and len(result) == 1:
+        result = result[0]
+    if isinstance(result, dict) and 'output' in result:
+        return result['output']
+    return result
+
+
+# ===============================
+# Jobs
+# ===============================
+class ChatJob:
+    """One prompt in flight: streamed text so far, and the final result once `done` is set"""
+
+    def __init__(self, prompt, session_id):
+        self.prompt = prompt
+        self.session_id = session_id
+        self.done = threading.Event()
+        self.result = None
+        self._chunks = []
+        self._lock = threading.Lock()
+
+    def append(self, text):
+        with self._lock:
+            self._chunks.append(text)
+
+    @property
+    def text(self):
+        with self._lock:
+            return ''.join(self._chunks)
+
+    def finish(self, output):
+        self.result = {"output": output, "sessionId_enviado": self.session_id}
+        self.done.set()
+
+    def wait(self, timeout=None):
+        """Block until the answer is complete; returns the result (None on timeout)"""
+        self.done.wait(timeout)
+        return self.result
+
+
+# ===============================
+# Client
+# ===============================
+class N8NChatClient:
+    """Posts prompts to the webhook from a worker pool over one pooled HTTP session"""
+
+    def __init__(self, webhook_url=N8N_WEBHOOK_URL, timeout=N8N_TIMEOUT, workers=N8N_WORKERS):
+        self.webhook_url = webhook_url
+        self.timeout = (N8N_CONNECT_TIMEOUT, timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='n8n-chat')
+
+    def submit(self, prompt, session_id):
+        """Post `prompt` in the background and return its ChatJob immediately"""
+        job = ChatJob(prompt, session_id)
+        self.executor.submit(self._run, job)
+        return job
+
+    def send(self, prompt, session_id):
+        """Post `prompt` and wait for the complete answer"""
+        return self.submit(prompt, session_id).wait()
+
+    def _run(self, job):
+        try:
+            with self.session.post(
+                self.webhook_url,
+                json={"prompt": job.prompt, "sessionId": job.session_id},
+                timeout=self.timeout,
+                stream=True
+            ) as response:
+                response.raise_for_status()
+                content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+                if content_type in STREAMING_TYPES:
+                    # Without a charset requests yields bytes even with decode_unicode
+                    response.encoding = response.encoding or 'utf-8'
+                    for line in response.iter_lines(decode_unicode=True):
+                        text = _chunk_text(line or '')
+                        if text:
+                            job.append(text)
+                    job.finish(job.text)
+                else:
+                    output = _response_output(response)
+                    job.append(str(output))
+                    job.finish(output)
+
+        except requests.exceptions.Timeout:
+            job.finish("⏱️ Error: La solicitud tardó demasiado tiempo. Por favor intenta de nuevo.")
+        except requests.exceptions.ConnectionError:
+            job.finish("🔌 Error: No se pudo conectar con el servidor. Verifica tu conexión a internet.")
+        except requests.exceptions.RequestException as e:
+            job.finish(f"❌ Error de red: {str(e)}")
+        except Exception as e:
+            job.finish(f"❌ Error inesperado: {str(e)}")
+
+
+@st.cache_resource(show_spinner=False)
+def get_chat_client(webhook_url=N8N_WEBHOOK_URL):
+    """One pooled chat client per process and webhook"""
+    return N8NChatClient(webhook_url)
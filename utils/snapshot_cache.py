@@ -0,0 +1,159 @@
+"""
+snapshot_cache.py - Local Parquet snapshot of Supabase tables with delta sync
+
+Keeps a copy of a table on local disk next to a small metadata file holding
+its high-water mark (the latest `fecha_hecho` seen). A sync reads the snapshot
+and only pulls rows at or after the mark from Supabase, so restarts and cache
+expiries move a few hundred rows instead of the whole table.
+
+The boundary day is always re-fetched and replaced, which picks up rows that
+arrived late for that day. A full re-download still happens when there is no
+snapshot, when the requested columns change, or every FULL_RESYNC_DAYS to pick
+up edits and deletions of older rows.
+
+If Supabase cannot be reached during a delta or periodic full sync, the
+existing snapshot is served as-is and its metadata is left untouched, so the
+next access retries the sync.
+
+Usage:
+    from utils.snapshot_cache import sync_snapshot
+    raw_df = sync_snapshot("FGJ", ["alcaldia_hecho", "fecha_hecho", "delito"])
+"""
+
+import json
+import os
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from utils.supabase_fetcher import DEFAULT_KEY, fetch_table
+
+# ===============================
+# Configuration
+# ===============================
+SNAPSHOT_DIR = os.getenv("CRIME_SNAPSHOT_DIR", os.path.join(".cache", "snapshots"))
+FULL_RESYNC_DAYS = 7
+
+# Failures that should degrade to a network-only load instead of crashing
+SNAPSHOT_ERRORS = (ImportError, OSError, ValueError, TypeError)
+
+# ===============================
+# Paths & Metadata
+# ===============================
+def _parse_keys(values):
+    """Parse key values to naive UTC timestamps so comparisons never mix timezones"""
+    return pd.to_datetime(values, errors='coerce', utc=True).dt.tz_localize(None)
+
+
+def snapshot_path(table):
+    return os.path.join(SNAPSHOT_DIR, f"{table}.parquet")
+
+
+def metadata_path(table):
+    return os.path.join(SNAPSHOT_DIR, f"{table}.meta.json")
+
+
+def read_metadata(table):
+    """Return the snapshot metadata dict, or None if there is no usable snapshot"""
+    if not os.path.exists(snapshot_path(table)) or not os.path.exists(metadata_path(table)):
+        return None
+    try:
+        with open(metadata_path(table), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot(table, df, key, full_synced_at):
+    """Persist `df` and its high-water mark; the parquet file is replaced atomically"""
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+
+    keys = _parse_keys(df[key]) if key in df.columns else pd.Series(dtype='datetime64[ns]')
+    high_water_mark = keys.max()
+
+    tmp_path = snapshot_path(table) + ".tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, snapshot_path(table))
+
+    metadata = {
+        'table': table,
+        'key': key,
+        'columns': list(df.columns),
+        'row_count': int(len(df)),
+        'high_water_mark': high_water_mark.isoformat() if pd.notna(high_water_mark) else None,
+        'synced_at': datetime.now().isoformat(),
+        'full_synced_at': full_synced_at,
+    }
+    with open(metadata_path(table), 'w', encoding='utf-8') as f:
+        json.dump(metadata, f, indent=2)
+
+    return metadata
+
+
+# ===============================
+# Sync
+# ===============================
+def _needs_full_sync(metadata, columns, key):
+    if metadata is None or metadata.get('high_water_mark') is None:
+        return True
+    if metadata.get('key') != key or metadata.get('columns') != list(columns):
+        return True
+    full_synced_at = pd.Timestamp(metadata.get('full_synced_at'))
+    return datetime.now() - full_synced_at > timedelta(days=FULL_RESYNC_DAYS)
+
+
+def _read_stale_snapshot(table, metadata, columns, key):
+    """The local snapshot if it holds exactly `columns` keyed on `key`, else None"""
+    if metadata is None or metadata.get('key') != key or metadata.get('columns') != columns:
+        return None
+    try:
+        return pd.read_parquet(snapshot_path(table))
+    except SNAPSHOT_ERRORS:
+        return None
+
+
+def sync_snapshot(table, columns, key=DEFAULT_KEY, force_full=False):
+    """
+    Bring the local snapshot of `table` up to date and return it as a DataFrame.
+
+    If the snapshot cannot be read or written (e.g. no Parquet engine is
+    installed or the filesystem is read-only) the rows still come back from
+    the network and the next sync simply tries again. If the network fails
+    and a matching snapshot exists, the stale snapshot is returned instead.
+    """
+    columns = list(columns)
+    metadata = read_metadata(table)
+
+    snapshot_df = None
+    if not force_full and not _needs_full_sync(metadata, columns, key):
+        snapshot_df = _read_stale_snapshot(table, metadata, columns, key)
+
+    try:
+        if snapshot_df is None:
+            df = pd.DataFrame(fetch_table(table, columns, key=key), columns=columns)
+            full_synced_at = datetime.now().isoformat()
+        else:
+            # Re-fetch from the start of the high-water-mark day onwards
+            boundary_day = pd.Timestamp(metadata['high_water_mark']).normalize()
+            delta_df = pd.DataFrame(
+                fetch_table(table, columns, key=key, start=boundary_day.strftime("%Y-%m-%d")),
+                columns=columns
+            )
+
+            snapshot_keys = _parse_keys(snapshot_df[key])
+            kept_df = snapshot_df[~(snapshot_keys >= boundary_day)]
+            df = pd.concat([kept_df, delta_df], ignore_index=True)
+            full_synced_at = metadata['full_synced_at']
+    except Exception:
+        # Serve what is on disk; metadata is not touched, so the next access retries
+        stale_df = snapshot_df if snapshot_df is not None else _read_stale_snapshot(table, metadata, columns, key)
+        if stale_df is None:
+            raise
+        return stale_df
+
+    try:
+        write_snapshot(table, df, key, full_synced_at)
+    except SNAPSHOT_ERRORS:
+        pass
+
+    return df
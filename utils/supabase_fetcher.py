@@ -0,0 +1,176 @@
+"""
+supabase_fetcher.py - Parallel range fetcher for Supabase tables
+
+Splits a table into independent `fecha_hecho` ranges (one per month by
+default), downloads the ranges concurrently on a bounded thread pool with a
+single shared Supabase client, and reassembles the rows in key order.
+
+Each range only holds a few thousand rows, so offset paging inside a range
+stays cheap, and the ~90 serial round trips of a full-table load become a
+handful of parallel ones. Pages are ordered by the key plus a unique
+tiebreaker column (`id` by default), so rows sharing a key value are never
+skipped or repeated across page boundaries.
+
+Usage:
+    from utils.supabase_fetcher import fetch_table
+    rows = fetch_table("FGJ", ["alcaldia_hecho", "fecha_hecho", "delito"])
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import streamlit as st
+from dotenv import load_dotenv
+from supabase import create_client
+
+# ===============================
+# Configuration
+# ===============================
+load_dotenv()
+
+SUPABASE_URL = os.getenv("SUPABASE_URL")
+SUPABASE_KEY = os.getenv("SUPABASE_KEY")
+
+PAGE_SIZE = 1000
+MAX_WORKERS = 8
+DEFAULT_KEY = "fecha_hecho"
+DEFAULT_FREQ = "MS"  # one range per calendar month
+DEFAULT_TIEBREAKER = ("id",)  # unique columns that make paging order total
+
+# ===============================
+# Client
+# ===============================
+@st.cache_resource
+def get_supabase_client():
+    """Return one Supabase client shared by every fetch in this process"""
+    return create_client(SUPABASE_URL, SUPABASE_KEY)
+
+
+# ===============================
+# Range Helpers
+# ===============================
+def _select_clause(columns):
+    if isinstance(columns, str):
+        return columns
+    return ", ".join(columns)
+
+
+def get_key_bounds(client, table, key=DEFAULT_KEY):
+    """Return the (min, max) value of `key` in `table`, or (None, None) if empty"""
+    low = (
+        client.table(table).select(key)
+        .not_.is_(key, "null")
+        .order(key).limit(1).execute()
+    )
+    high = (
+        client.table(table).select(key)
+        .not_.is_(key, "null")
+        .order(key, desc=True).limit(1).execute()
+    )
+    if not low.data or not high.data:
+        return None, None
+    return low.data[0][key], high.data[0][key]
+
+
+def split_key_range(start, end, freq=DEFAULT_FREQ):
+    """Split [start, end] into consecutive half-open [lo, hi) date ranges"""
+    start = pd.Timestamp(start).normalize()
+    end = pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+
+    edges = list(pd.date_range(start, end, freq=freq))
+    if not edges or edges[0] > start:
+        edges.insert(0, start)
+    if edges[-1] < end:
+        edges.append(end)
+
+    return [
+        (lo.strftime("%Y-%m-%d"), hi.strftime("%Y-%m-%d"))
+        for lo, hi in zip(edges[:-1], edges[1:])
+    ]
+
+
+def fetch_key_range(client, table, select_clause, key, lo, hi, filters=None,
+                    tiebreaker=DEFAULT_TIEBREAKER, page_size=PAGE_SIZE):
+    """
+    Fetch every row with lo <= key < hi (or key IS NULL when lo is None).
+
+    `tiebreaker` columns must make the row order unique within the range,
+    otherwise offset pages can overlap or skip rows with equal keys.
+    """
+    rows = []
+    offset = 0
+    while True:
+        query = client.table(table).select(select_clause)
+        if lo is None:
+            query = query.is_(key, "null")
+        else:
+            query = query.gte(key, lo).lt(key, hi).order(key)
+        for column in tiebreaker:
+            query = query.order(column)
+        for column, value in (filters or {}).items():
+            query = query.eq(column, value)
+
+        response = query.range(offset, offset + page_size - 1).execute()
+        if not response.data:
+            break
+
+        rows.extend(response.data)
+        if len(response.data) < page_size:
+            break
+        offset += page_size
+
+    return rows
+
+
+# ===============================
+# Parallel Fetch
+# ===============================
+def fetch_table(table, columns="*", key=DEFAULT_KEY, start=None, end=None,
+                freq=DEFAULT_FREQ, filters=None, tiebreaker=DEFAULT_TIEBREAKER,
+                max_workers=MAX_WORKERS):
+    """
+    Fetch `table` concurrently, one request stream per `key` range.
+
+    Args:
+        table: Supabase table name
+        columns: list of column names or a raw select clause
+        key: date-like column used to partition the table
+        start, end: optional inclusive bounds on `key`; when omitted the
+            table bounds are queried and rows with a NULL key are included
+        freq: pandas offset alias for range width ('MS' = monthly)
+        filters: optional {column: value} equality filters
+        tiebreaker: unique column(s) ordering rows with equal `key` values
+        max_workers: size of the thread pool
+
+    Returns:
+        List of row dicts in ascending `key` order (NULL keys last)
+    """
+    client = get_supabase_client()
+    select_clause = _select_clause(columns)
+
+    include_nulls = start is None and end is None
+    if start is None or end is None:
+        low, high = get_key_bounds(client, table, key)
+        start = start or low
+        end = end or high
+
+    ranges = split_key_range(start, end, freq) if start and end else []
+    if include_nulls:
+        ranges.append((None, None))
+
+    if not ranges:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(ranges))) as pool:
+        pages = pool.map(
+            lambda bounds: fetch_key_range(
+                client, table, select_clause, key, *bounds, filters=filters, tiebreaker=tiebreaker
+            ),
+            ranges
+        )
+        all_rows = []
+        for page in pages:
+            all_rows.extend(page)
+
+    return all_rows
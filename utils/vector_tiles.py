@@ -0,0 +1,381 @@
+"""
+vector_tiles.py - Local Mapbox Vector Tile server for the interactive map
+
+The inline map embeds every cuadrante polygon and every crime point of all
+16 alcaldías in the page HTML. In tile mode those layers are registered with
+a small HTTP server running beside Streamlit in a daemon thread instead, and
+MapLibre fetches `/{dataset}/{z}/{x}/{y}.pbf` tiles for the visible area only.
+The same server answers `/{dataset}/{name}.json` for documents the page
+fetches on demand (the per-alcaldía side panel analytics), built on first
+request by a registered builder.
+
+Datasets are registered under a key that changes with the selected years and
+the crime store snapshot, so a rerun with the same filters reuses them.
+Tiles are cut on demand (STRtree lookup for polygons, a bounding-box mask for
+points) and the encoded bytes are kept in a bounded LRU.
+
+Requires shapely>=2.0 and mapbox-vector-tile. Without them, or if the port
+is taken, `get_tile_server()` returns None and the map keeps inline GeoJSON.
+
+Every page rerun registers (or re-registers) the datasets it needs, so a
+dataset evicted by other sessions comes back on the next interaction.
+
+Environment:
+    MAP_VECTOR_TILES=1      enable tile mode by default
+    TILE_SERVER_HOST        interface to bind (default 127.0.0.1)
+    TILE_SERVER_PORT        port to bind (default 8765)
+    TILE_PUBLIC_URL         URL the browser uses to reach the server
+                            (default http://localhost:{port})
+    TILE_MAX_DATASETS       registered datasets kept per process (default 64)
+
+The defaults only work when the browser runs on the same machine as
+Streamlit. For a remote deployment, TILE_SERVER_HOST must be set to an
+interface the proxy or browser can reach (e.g. 0.0.0.0) and TILE_PUBLIC_URL
+to the server's public URL. If the app is served over HTTPS, TILE_PUBLIC_URL
+must be an HTTPS URL too (e.g. a reverse-proxy path in front of the tile
+port), otherwise the browser blocks the tile requests as mixed content.
+
+Usage:
+    from utils.vector_tiles import get_tile_server
+    server = get_tile_server()
+    if server:
+        source = server.source_spec('cuadrantes-2024')     # None unless registered
+        if source is None:
+            source = server.register_polygons('cuadrantes-2024', 'cuadrantes', features)
+        server.register_documents('analytics-2024', build_analytics)
+        url = server.document_url('analytics-2024')   # .../{name}.json
+"""
+
+import json
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+import numpy as np
+import streamlit as st
+
+# ===============================
+# Configuration
+# ===============================
+VECTOR_TILES_DEFAULT = os.getenv("MAP_VECTOR_TILES", "0") == "1"
+TILE_SERVER_HOST = os.getenv("TILE_SERVER_HOST", "127.0.0.1")
+TILE_SERVER_PORT = int(os.getenv("TILE_SERVER_PORT", "8765"))
+TILE_PUBLIC_URL = os.getenv("TILE_PUBLIC_URL", f"http://localhost:{TILE_SERVER_PORT}")
+
+TILE_EXTENT = 4096
+TILE_BUFFER = 64            # in tile units; avoids seams between neighbouring tiles
+TILE_MAX_ZOOM = 14          # MapLibre overzooms beyond this
+POINT_MIN_ZOOM = 10         # crime points are only drawn once drilled into an alcaldía
+TILE_CACHE_SIZE = 2048
+MAX_DATASETS = int(os.getenv("TILE_MAX_DATASETS", "64"))  # ~3 per (years, snapshot) selection
+
+EARTH_RADIUS = 6378137.0
+ORIGIN_SHIFT = math.pi * EARTH_RADIUS
+MAX_LATITUDE = 85.0511287798
+
+TILE_PATH = re.compile(r'^/([\w.-]+)/(\d+)/(\d+)/(\d+)\.pbf$')
+DOCUMENT_PATH = re.compile(r'^/([\w.-]+)/([^/]+)\.json$')
+
+
+# ===============================
+# Tile Math
+# ===============================
+def to_mercator(lon, lat):
+    """Project lon/lat degree arrays to Web Mercator meters"""
+    lon = np.asarray(lon, dtype='float64')
+    lat = np.clip(np.asarray(lat, dtype='float64'), -MAX_LATITUDE, MAX_LATITUDE)
+    x = np.radians(lon) * EARTH_RADIUS
+    y = np.log(np.tan(np.pi / 4 + np.radians(lat) / 2)) * EARTH_RADIUS
+    return x, y
+
+
+def _project_coords(coords):
+    x, y = to_mercator(coords[:, 0], coords[:, 1])
+    return np.column_stack([x, y])
+
+
+def tile_bounds(z, x, y):
+    """Return (minx, miny, maxx, maxy) of tile z/x/y in Web Mercator meters"""
+    size = 2 * ORIGIN_SHIFT / 2 ** z
+    minx = -ORIGIN_SHIFT + x * size
+    maxy = ORIGIN_SHIFT - y * size
+    return minx, maxy - size, minx + size, maxy
+
+
+def _buffered(bounds):
+    minx, miny, maxx, maxy = bounds
+    pad = (maxx - minx) * TILE_BUFFER / TILE_EXTENT
+    return minx - pad, miny - pad, maxx + pad, maxy + pad
+
+
+def _tile_properties(properties):
+    """MVT properties must be scalars: drop None, JSON-encode lists and dicts"""
+    result = {}
+    for name, value in properties.items():
+        if value is None:
+            continue
+        if isinstance(value, (list, dict)):
+            value = json.dumps(value)
+        result[name] = value
+    return result
+
+
+# ===============================
+# Datasets
+# ===============================
+class PolygonDataset:
+    """GeoJSON polygon features projected once and held in an STRtree"""
+
+    min_zoom = 0
+
+    def __init__(self, layer, features):
+        import shapely
+        from shapely.geometry import shape
+
+        geometries, properties = [], []
+        for feature in features:
+            try:
+                geometries.append(shape(feature['geometry']))
+            except Exception:
+                continue
+            properties.append(_tile_properties(feature.get('properties', {})))
+
+        self.layer = layer
+        self.properties = properties
+        self.geometries = shapely.transform(np.asarray(geometries, dtype=object), _project_coords)
+        self.tree = shapely.STRtree(self.geometries)
+
+    def features(self, bounds):
+        import shapely
+
+        clip = _buffered(bounds)
+        idx = self.tree.query(shapely.box(*clip), predicate='intersects')
+        clipped = shapely.clip_by_rect(self.geometries[idx], *clip)
+        return [
+            {'geometry': geometry, 'properties': self.properties[i]}
+            for i, geometry in zip(idx.tolist(), clipped)
+            if not geometry.is_empty
+        ]
+
+
+class PointDataset:
+    """Point coordinates projected once, with per-point property columns"""
+
+    min_zoom = POINT_MIN_ZOOM
+
+    def __init__(self, layer, lon, lat, properties):
+        self.layer = layer
+        self.x, self.y = to_mercator(lon, lat)
+        self.names = list(properties)
+        self.columns = [np.asarray(properties[name], dtype=object) for name in self.names]
+
+    def features(self, bounds):
+        from shapely.geometry import Point
+
+        minx, miny, maxx, maxy = bounds
+        idx = np.flatnonzero(
+            (self.x >= minx) & (self.x < maxx) & (self.y >= miny) & (self.y < maxy)
+        )
+        columns = [column[idx].tolist() for column in self.columns]
+        return [
+            {'geometry': Point(x, y), 'properties': _tile_properties(dict(zip(self.names, values)))}
+            for x, y, *values in zip(self.x[idx].tolist(), self.y[idx].tolist(), *columns)
+        ]
+
+
+# ===============================
+# Server
+# ===============================
+class _TileRequestHandler(BaseHTTPRequestHandler):
+    tile_server = None
+
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        tile_match = TILE_PATH.match(path)
+        document_match = DOCUMENT_PATH.match(path)
+        try:
+            if tile_match:
+                key, z, x, y = tile_match.group(1), *map(int, tile_match.groups()[1:])
+                body = self.tile_server.render(key, z, x, y)
+                content_type = 'application/vnd.mapbox-vector-tile'
+            elif document_match:
+                body = self.tile_server.document(document_match.group(1), unquote(document_match.group(2)))
+                content_type = 'application/json'
+            else:
+                body = None
+        except Exception:
+            self.send_error(500)
+            return
+
+        if body is None:
+            self.send_error(404)
+            return
+
+        self.send_response(200 if body else 204)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Cache-Control', 'max-age=3600')
+        if body:
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Keep the Streamlit console free of one line per tile
+        pass
+
+
+class TileServer:
+    """Threaded HTTP server that cuts and caches MVT tiles for registered datasets"""
+
+    def __init__(self, host=TILE_SERVER_HOST, port=TILE_SERVER_PORT, public_url=TILE_PUBLIC_URL):
+        self.public_url = public_url.rstrip('/')
+        self._datasets = OrderedDict()
+        self._documents = OrderedDict()
+        self._tiles = OrderedDict()
+        self._lock = threading.Lock()
+
+        handler = type('TileRequestHandler', (_TileRequestHandler,), {'tile_server': self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='vector-tiles', daemon=True)
+        self.thread.start()
+
+    def has(self, key):
+        """True if `key` is registered; marks it recently used so active pages keep their datasets"""
+        with self._lock:
+            if key not in self._datasets:
+                return False
+            self._datasets.move_to_end(key)
+            return True
+
+    def register(self, key, dataset):
+        """
+        Register `dataset` under `key`, evicting the least recently used beyond
+        MAX_DATASETS, and return its source spec (taken before any later eviction).
+        """
+        with self._lock:
+            self._datasets[key] = dataset
+            self._datasets.move_to_end(key)
+            while len(self._datasets) > MAX_DATASETS:
+                self._datasets.popitem(last=False)
+            for tile_key in [k for k in self._tiles if k[0] == key]:
+                del self._tiles[tile_key]
+            return self._source_spec(key, dataset)
+
+    def register_polygons(self, key, layer, features):
+        """Register GeoJSON polygon features unless `key` is already registered; returns the source spec"""
+        spec = self.source_spec(key)
+        return spec if spec is not None else self.register(key, PolygonDataset(layer, features))
+
+    def register_points(self, key, layer, lon, lat, properties):
+        """Register points with {name: list} properties unless `key` is already registered; returns the source spec"""
+        spec = self.source_spec(key)
+        return spec if spec is not None else self.register(key, PointDataset(layer, lon, lat, properties))
+
+    def register_documents(self, key, builder):
+        """
+        Serve `/{key}/{name}.json` from `builder(name)`, called once per name on
+        first request (None means 404). The builder runs on a server thread, so
+        it must not call Streamlit APIs.
+        """
+        with self._lock:
+            if key in self._documents:
+                self._documents.move_to_end(key)
+                return
+            self._documents[key] = builder
+            while len(self._documents) > MAX_DATASETS:
+                self._documents.popitem(last=False)
+
+    def document_url(self, key):
+        """URL template for a document set; the client replaces `{name}`"""
+        return f"{self.public_url}/{key}/{{name}}.json"
+
+    def document(self, key, name):
+        """Return the encoded JSON document, or None if the set or name is unknown"""
+        cache_key = (key, name)
+        with self._lock:
+            builder = self._documents.get(key)
+            if builder is not None:
+                self._documents.move_to_end(key)
+            if cache_key in self._tiles:
+                self._tiles.move_to_end(cache_key)
+                return self._tiles[cache_key]
+        if builder is None:
+            return None
+
+        document = builder(name)
+        if document is None:
+            return None
+        body = json.dumps(document).encode('utf-8')
+
+        with self._lock:
+            self._tiles[cache_key] = body
+            while len(self._tiles) > TILE_CACHE_SIZE:
+                self._tiles.popitem(last=False)
+        return body
+
+    def source_spec(self, key):
+        """MapLibre vector source definition of `key` (marked recently used), or None if it is not registered"""
+        with self._lock:
+            dataset = self._datasets.get(key)
+            if dataset is None:
+                return None
+            self._datasets.move_to_end(key)
+            return self._source_spec(key, dataset)
+
+    def _source_spec(self, key, dataset):
+        return {
+            'type': 'vector',
+            'tiles': [f"{self.public_url}/{key}/{{z}}/{{x}}/{{y}}.pbf"],
+            'minzoom': dataset.min_zoom,
+            'maxzoom': TILE_MAX_ZOOM
+        }
+
+    def render(self, key, z, x, y):
+        """Return the encoded tile (b'' when empty), or None for an unknown dataset"""
+        import mapbox_vector_tile
+
+        tile_key = (key, z, x, y)
+        with self._lock:
+            dataset = self._datasets.get(key)
+            if dataset is not None:
+                self._datasets.move_to_end(key)
+            if tile_key in self._tiles:
+                self._tiles.move_to_end(tile_key)
+                return self._tiles[tile_key]
+        if dataset is None:
+            return None
+
+        tile = b''
+        if z >= dataset.min_zoom:
+            bounds = tile_bounds(z, x, y)
+            features = dataset.features(bounds)
+            if features:
+                tile = mapbox_vector_tile.encode(
+                    [{'name': dataset.layer, 'features': features}],
+                    default_options={'quantize_bounds': bounds, 'extents': TILE_EXTENT}
+                )
+
+        with self._lock:
+            self._tiles[tile_key] = tile
+            while len(self._tiles) > TILE_CACHE_SIZE:
+                self._tiles.popitem(last=False)
+        return tile
+
+
+@st.cache_resource(show_spinner=False)
+def get_tile_server():
+    """Start the tile server once per process; None if its dependencies or port are unavailable"""
+    try:
+        import mapbox_vector_tile  # noqa: F401
+        import shapely  # noqa: F401
+
+        return TileServer()
+    except (ImportError, OSError):
+        return None
@@ -0,0 +1,87 @@
+"""
+violence.py - Shared violence classifier for FGJ `delito` values
+
+Every crime is tagged 'violent', 'non_violent' or 'unknown' from its `delito`
+text. The table only has a few dozen distinct `delito` values, so the rules
+run once per distinct value and the result is broadcast back over the column
+as a categorical.
+
+Rules live in VIOLENCE_RULES: an ordered list of (substring, category) pairs
+matched case-insensitively, first match wins. Add a row there (or pass your
+own `rules`) to support a new modality instead of editing every page.
+
+Usage:
+    from utils.violence import classify_violence
+    df['violence_category'] = classify_violence(df['delito'])
+
+The server-side aggregates (sql/crime_aggregates.sql, utils/crime_aggregates.py)
+receive the same table through `rules_payload()`, so SQL never hard-codes it.
+"""
+
+import numpy as np
+import pandas as pd
+
+# ===============================
+# Rule Table
+# ===============================
+VIOLENCE_RULES = [
+    ('con violencia', 'violent'),
+    ('sin violencia', 'non_violent'),
+]
+
+UNKNOWN_CATEGORY = 'unknown'
+VIOLENCE_CATEGORIES = ['violent', 'non_violent', UNKNOWN_CATEGORY]
+
+
+def lowercase_rules(rules):
+    """Rules with lowercased substrings, the form every matcher (Python and SQL) uses"""
+    return tuple((pattern.lower(), category) for pattern, category in rules)
+
+
+_LOWERCASE_VIOLENCE_RULES = lowercase_rules(VIOLENCE_RULES)
+
+
+def _matching_rules(rules):
+    if rules is VIOLENCE_RULES:
+        return _LOWERCASE_VIOLENCE_RULES
+    return lowercase_rules(rules)
+
+
+def rules_payload(rules=VIOLENCE_RULES):
+    """Rules as a JSON-serializable list of [substring, category] pairs (lowercased substrings)"""
+    return [[pattern, category] for pattern, category in _matching_rules(rules)]
+
+
+# ===============================
+# Classification
+# ===============================
+def _categorize(delito_text, lowercase):
+    if pd.isna(delito_text):
+        return UNKNOWN_CATEGORY
+    delito_lower = str(delito_text).lower()
+    for pattern, category in lowercase:
+        if pattern in delito_lower:
+            return category
+    return UNKNOWN_CATEGORY
+
+
+def categorize_violence(delito_text, rules=VIOLENCE_RULES):
+    """Categorize a single `delito` value by violence"""
+    return _categorize(delito_text, _matching_rules(rules))
+
+
+def classify_violence(series, rules=VIOLENCE_RULES):
+    """Classify a whole `delito` Series, evaluating the rules once per distinct value"""
+    codes, uniques = pd.factorize(series)
+    lowercase = _matching_rules(rules)
+    labels = np.array(
+        [_categorize(delito, lowercase) for delito in uniques] + [UNKNOWN_CATEGORY],
+        dtype=object
+    )
+    # factorize marks missing values with -1, which picks the trailing 'unknown'
+    categories = list(dict.fromkeys(VIOLENCE_CATEGORIES + [category for _, category in rules]))
+    return pd.Series(
+        pd.Categorical(labels[codes], categories=categories),
+        index=series.index,
+        name='violence_category'
+    )
@@ -1,7 +1,8 @@
 import plotly.express as px
 
 def plot_incidents_by_borough(df):
-    counts = df['alcaldia_hecho'].value_counts().reset_index()
+    counts = df['alcaldia_hecho'].value_counts()
+    counts = counts[counts > 0].reset_index()
     counts.columns = ['alcaldia_hecho', 'cases']
     counts['cases_formatted'] = counts['cases'].apply(lambda x: f"{x:,}")
     fig = px.bar(counts, x='alcaldia_hecho', y='cases', text='cases_formatted', title="Incidents by Borough", color='cases')